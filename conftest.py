@@ -3,6 +3,7 @@ from pathlib import Path
 import pytest
 from sqlalchemy import create_engine
 from pytest_sa_pg import db
+import responses
 import webtest
 
 from tshistory.schema import tsschema
@@ -101,6 +102,22 @@ def _initschema(engine):
     supervision_schema('remote').create(engine)
 
 
+@pytest.fixture
+def httpclient(engine):
+    _initschema(engine)
+    tsa = api.timeseries(
+        str(engine.url),
+        handler=timeseries,
+        sources={'remote': (DBURI, 'remote')}
+    )
+    wsgitester = WebTester(
+        nosecurity(appmaker.make_app(tsa, http.supervision_httpapi))
+    )
+    with responses.RequestsMock(assert_all_requests_are_fired=False) as resp:
+        with_http_bridge('http://test-uri', resp, wsgitester)
+        yield http.supervision_httpclient('http://test-uri')
+
+
 tsx = make_tsx(
     'http://test-uri',
     _initschema,
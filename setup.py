@@ -15,10 +15,23 @@ setup(name='tshistory_supervision',
           'simplejson',
           'tshistory >= 0.18.0'
       ],
+      extras_require={
+          'arrow': ['pyarrow'],
+          'zstd': ['zstandard']
+      },
       entry_points={
           'tshistory.subcommands': [
               'fix-supervision-status=tshistory_supervision.cli:fix_supervision_status',
-              'list-supervised-series-mismatch=tshistory_supervision.cli:list_mismatch'
+              'list-supervised-series-mismatch=tshistory_supervision.cli:list_mismatch',
+              'supervision-report=tshistory_supervision.cli:supervision_report',
+              'populate-supervision=tshistory_supervision.cli:populate_supervision',
+              'load-supervision=tshistory_supervision.cli:load_supervision',
+              'bench-writers=tshistory_supervision.cli:bench_writers',
+            'bench-formats=tshistory_supervision.cli:bench_formats',
+              'profile-supervision=tshistory_supervision.cli:profile_supervision',
+              'export-supervision=tshistory_supervision.cli:export_supervision',
+              'import-overrides=tshistory_supervision.cli:import_overrides',
+              'strip-supervision=tshistory_supervision.cli:strip_supervision'
           ],
           'tshistory.migrate.Migrator': [
               'migrator=tshistory_supervision.migrate:Migrator'
@@ -1,6 +1,10 @@
+import contextvars
+
 import numpy as np
 import pandas as pd
+import pytest
 
+from tshistory.api import mainsource
 from tshistory.testutil import assert_df
 
 
@@ -105,6 +109,54 @@ def test_multi_source_handcrafted_federated(tsa1, tsa2):
 """, marker)
 
 
+def test_federated_routing_cache(tsa1, tsa2, monkeypatch):
+    from tshistory_supervision import api
+
+    series = pd.Series(
+        [1., 2., 3.],
+        index=pd.date_range(pd.Timestamp('2020-1-1'), freq='D', periods=3)
+    )
+    probes = []
+    exists = mainsource.exists
+
+    def probe(self, name):
+        if self.namespace == 'test-remote':
+            probes.append(name)
+        return exists(self, name)
+
+    monkeypatch.setattr(mainsource, 'exists', probe)
+
+    # negative entry
+    assert tsa1.edited('routed-series') is None
+    assert tsa1.edited('routed-series') is None
+    assert probes == ['routed-series']
+
+    tsa2.update('routed-series', series, 'test')
+    assert tsa1.edited('routed-series') is None
+
+    # expiration
+    api._ROUTES.clear()
+    monkeypatch.setattr(api, 'ROUTING_TTL', 0)
+    ts, _ = tsa1.edited('routed-series')
+    assert ts.equals(series.rename('routed-series'))
+    ts, _ = tsa1.edited('routed-series')
+    assert probes == ['routed-series'] * 3
+
+    # positive entry
+    monkeypatch.setattr(api, 'ROUTING_TTL', 60)
+    assert tsa1.supervision_status('routed-series') == 'unsupervised'
+    ts, _ = tsa1.edited('routed-series')
+    assert ts.equals(series.rename('routed-series'))
+    assert probes == ['routed-series'] * 4
+
+    # bounded
+    monkeypatch.setattr(api, 'ROUTING_SIZE', 2)
+    for name in ('routed-a', 'routed-b'):
+        tsa1.supervision_status(name)
+    assert len(api._ROUTES) == 2
+    api._ROUTES.clear()
+
+
 def test_multi_source_edited(tsx):
     series = pd.Series(
         [1, 2, 3],
@@ -438,3 +490,768 @@ def test_infer_freq_tz(tsx):
             inferred_freq=True,
         )[0]
     ) == 6
+
+
+def test_update_manual_many(tsa, tmp_path):
+    for name in ('many-a', 'many-b'):
+        tsa.update(
+            name,
+            pd.Series(
+                [1., 2., 3.],
+                index=pd.date_range(pd.Timestamp('2020-1-1'), freq='D', periods=3)
+            ),
+            'test'
+        )
+
+    edits = {
+        'many-a': pd.Series([42.], index=[pd.Timestamp('2020-1-2')]),
+        'many-b': pd.Series([2., 43.], index=pd.date_range(
+            pd.Timestamp('2020-1-2'), freq='D', periods=2
+        ))
+    }
+    diffs = tsa.update_manual_many(edits, 'test', dryrun=True)
+    assert_df("""
+2020-01-02    42.0
+""", diffs['many-a'])
+    assert_df("""
+2020-01-03    43.0
+""", diffs['many-b'])
+    assert tsa.supervision_status('many-a') == 'unsupervised'
+
+    diffs = tsa.update_manual_many(edits, 'test', batchsize=1)
+    assert_df("""
+2020-01-03    43.0
+""", diffs['many-b'])
+    assert tsa.supervision_status('many-a') == 'supervised'
+    _, markers = tsa.edited('many-b')
+    assert markers.tolist() == [False, False, True]
+
+    # the same through a csv file
+    from click.testing import CliRunner
+    from tshistory_supervision.cli import import_overrides
+
+    path = tmp_path / 'overrides.csv'
+    path.write_text(
+        'name,value_date,value\n'
+        'many-a,2020-01-01,7\n'
+        'many-b,2020-01-01,8\n'
+        'many-a,2020-01-03,9\n'
+    )
+    r = CliRunner().invoke(
+        import_overrides,
+        [tsa.uri, str(path), '--author', 'test', '--chunk-size', '2',
+         '--namespace', 'test-api', '--dry-run']
+    )
+    assert r.exit_code == 0, r.output
+    assert 'would change 3 points in 2 series' in r.output
+    assert tsa.get('many-a').tolist() == [1., 42., 3.]
+
+    r = CliRunner().invoke(
+        import_overrides,
+        [tsa.uri, str(path), '--author', 'test', '--namespace', 'test-api']
+    )
+    assert r.exit_code == 0, r.output
+    assert tsa.get('many-a').tolist() == [7., 42., 9.]
+    _, markers = tsa.edited('many-a')
+    assert markers.tolist() == [True, True, True]
+
+
+def test_update_manual_many_bundle(tsx):
+    series = pd.Series(
+        [1., 2., 3.],
+        index=pd.date_range(pd.Timestamp('2020-1-1'), freq='D', periods=3)
+    )
+    tsx.update('bundle-naive', series, 'test')
+    tsx.update('bundle-tz', series.tz_localize('UTC'), 'test')
+    tsx.update('bundle-same', series, 'test')
+
+    edits = {
+        'bundle-naive': pd.Series([42., np.nan], index=series.index[1:]),
+        'bundle-tz': pd.Series(
+            [43.], index=[pd.Timestamp('2020-1-4', tz='UTC')]
+        ),
+        'bundle-same': series[:1]
+    }
+    diffs = tsx.update_manual_many(edits, 'test', dryrun=True)
+    assert diffs['bundle-naive'].tolist()[0] == 42.
+    assert tsx.supervision_status('bundle-naive') == 'unsupervised'
+
+    # all or nothing
+    with pytest.raises(Exception):
+        tsx.update_manual_many(
+            dict(edits, **{
+                'bundle-same': pd.Series(['x'], index=series.index[:1])
+            }),
+            'test'
+        )
+    assert tsx.supervision_status('bundle-naive') == 'unsupervised'
+
+    diffs = tsx.update_manual_many(edits, 'test')
+    assert sorted(diffs) == ['bundle-naive', 'bundle-same', 'bundle-tz']
+    assert_df("""
+2020-01-02    42.0
+2020-01-03     NaN
+""", diffs['bundle-naive'])
+    assert_df("""
+2020-01-04 00:00:00+00:00    43.0
+""", diffs['bundle-tz'])
+    assert len(diffs['bundle-same']) == 0
+
+    ts, markers = tsx.edited('bundle-naive')
+    assert ts.tolist() == [1., 42.]
+    assert markers.tolist() == [False, True, True]
+    ts, markers = tsx.edited('bundle-tz')
+    assert ts.tolist() == [1., 2., 3., 43.]
+    assert markers.tolist() == [False, False, False, True]
+    assert tsx.supervision_status('bundle-same') == 'supervised'
+
+
+def test_upstream(tsx, monkeypatch):
+    from tshistory_supervision import http
+    # the http history stream comes in small pieces
+    monkeypatch.setattr(http, 'HISTORY_BATCH', 2)
+    monkeypatch.setattr(http, 'HISTORY_CHUNK', 7)
+
+    series = pd.Series(
+        [1., 2., 3.],
+        index=pd.date_range(pd.Timestamp('2020-1-1'), freq='D', periods=3)
+    )
+    d1, d2, d3, d4 = (
+        pd.Timestamp(f'2021-1-{day}', tz='UTC') for day in range(1, 5)
+    )
+    tsx.update('upstream-a', series, 'test', insertion_date=d1)
+    tsx.update('upstream-a', series + 1, 'test', insertion_date=d2)
+
+    # unsupervised: the edited series
+    assert tsx.upstream('upstream-a').tolist() == [2., 3., 4.]
+    assert tsx.upstream_insertion_dates('upstream-a') == [d1, d2]
+
+    tsx.update('upstream-a', series[1:2] * 10, 'test', manual=True,
+               insertion_date=d3)
+    tsx.update('upstream-a', (series + 2).iloc[[0, 2]], 'test',
+               insertion_date=d4)
+    assert tsx.edited('upstream-a')[0].tolist() == [3., 20., 5.]
+
+    assert tsx.upstream('upstream-a').tolist() == [3., 3., 5.]
+    assert tsx.upstream('upstream-a', revision_date=d1).tolist() == [1., 2., 3.]
+    assert tsx.upstream('upstream-a', revision_date=d3).tolist() == [2., 3., 4.]
+    assert tsx.upstream(
+        'upstream-a',
+        from_value_date=pd.Timestamp('2020-1-2'),
+        to_value_date=pd.Timestamp('2020-1-2')
+    ).tolist() == [3.]
+
+    # the copy taken at the first manual edit is not a revision
+    assert tsx.upstream_insertion_dates('upstream-a') == [d1, d2, d4]
+    assert tsx.upstream_insertion_dates(
+        'upstream-a', from_insertion_date=d2
+    ) == [d2, d4]
+    assert tsx.upstream_insertion_dates(
+        'upstream-a', to_insertion_date=d3
+    ) == [d1, d2]
+
+    hist = tsx.upstream_history('upstream-a')
+    assert {
+        idate: ts.tolist() for idate, ts in hist.items()
+    } == {
+        d1: [1., 2., 3.],
+        d2: [2., 3., 4.],
+        d4: [3., 3., 5.]
+    }
+    hist = tsx.upstream_history('upstream-a', from_insertion_date=d3)
+    assert list(hist) == [d4]
+    hist = tsx.upstream_history(
+        'upstream-a',
+        from_value_date=pd.Timestamp('2020-1-2'),
+        to_value_date=pd.Timestamp('2020-1-2')
+    )
+    assert {
+        idate: ts.tolist() for idate, ts in hist.items()
+    } == {
+        d1: [2.],
+        d2: [3.]
+    }
+
+    # handcrafted: no upstream
+    tsx.update('upstream-handcrafted', series, 'test', manual=True)
+    assert len(tsx.upstream('upstream-handcrafted')) == 0
+    assert tsx.upstream_insertion_dates('upstream-handcrafted') == []
+    assert tsx.upstream_history('upstream-handcrafted') == {}
+
+    assert tsx.upstream('upstream-nope') is None
+    assert tsx.upstream_insertion_dates('upstream-nope') is None
+    assert tsx.upstream_history('upstream-nope') is None
+
+
+def test_upstream_secondary_source(tsa1, tsa2):
+    series = pd.Series(
+        [1., 2., 3.],
+        index=pd.date_range(pd.Timestamp('2020-1-1'), freq='D', periods=3)
+    )
+    tsa2.update('upstream-remote', series, 'test')
+    tsa2.update('upstream-remote', series[:1] * 0, 'test', manual=True)
+
+    assert tsa1.upstream('upstream-remote').tolist() == [1., 2., 3.]
+    assert len(tsa1.upstream_insertion_dates('upstream-remote')) == 1
+    assert len(tsa1.upstream_history('upstream-remote')) == 1
+
+
+def test_revert_overrides(tsx):
+    series = pd.Series(
+        [1., 2., 3., 4.],
+        index=pd.date_range(pd.Timestamp('2020-1-1'), freq='D', periods=4)
+    )
+    for name in ('revert-a', 'revert-b'):
+        tsx.update(name, series, 'test')
+        tsx.update(
+            name,
+            pd.Series(
+                [-2., -3., -4., -5.],
+                index=pd.date_range(pd.Timestamp('2020-1-2'), freq='D', periods=4)
+            ),
+            'test',
+            manual=True
+        )
+
+    # unsupervised series: nothing to revert
+    tsx.update('revert-nothing', series, 'test')
+    assert not len(tsx.revert_overrides('revert-nothing', 'test'))
+
+    diff = tsx.revert_overrides(
+        'revert-a', 'test',
+        to_value_date=pd.Timestamp('2020-1-2')
+    )
+    assert_df("""
+2020-01-02    2.0
+""", diff)
+    ts, markers = tsx.edited('revert-a')
+    assert_df("""
+2020-01-01    1.0
+2020-01-02    2.0
+2020-01-03   -3.0
+2020-01-04   -4.0
+2020-01-05   -5.0
+""", ts)
+    assert markers.tolist() == [False, False, True, True, True]
+
+    diffs = tsx.revert_overrides_many(['revert-a', 'revert-b'], 'test')
+    # the overrides without upstream values are erased
+    assert_df("""
+2020-01-03    3.0
+2020-01-04    4.0
+2020-01-05    NaN
+""", diffs['revert-a'])
+    for name in ('revert-a', 'revert-b'):
+        ts, markers = tsx.edited(name)
+        assert ts.equals(series.rename(name))
+        assert not markers.any()
+
+    ts, markers = tsx.edited('revert-a', _keep_nans=True)
+    assert len(ts) == len(markers) == 5
+    assert not markers.any()
+
+
+def test_overrides_many(tsx, monkeypatch):
+    from tshistory_supervision import http
+    # the http stream reads one series at a time
+    monkeypatch.setattr(http, 'OVERRIDES_BATCH', 1)
+
+    series = pd.Series(
+        [1., 2., 3.],
+        index=pd.date_range(pd.Timestamp('2020-1-1'), freq='D', periods=3)
+    )
+    for name in ('scan-a', 'scan-b', 'scan-c'):
+        tsx.update(name, series, 'test')
+    for name in ('scan-a', 'scan-b'):
+        tsx.update(
+            name,
+            pd.Series(
+                [-2., -3.],
+                index=pd.date_range(pd.Timestamp('2020-1-2'), freq='D', periods=2)
+            ),
+            'test',
+            manual=True
+        )
+
+    frame = tsx.overrides_many(['scan-a', 'scan-b', 'scan-c', 'scan-nope'])
+    assert frame.to_dict(orient='records') == [
+        {'name': 'scan-a', 'value_date': pd.Timestamp('2020-1-2', tz='UTC'),
+         'value': -2.},
+        {'name': 'scan-a', 'value_date': pd.Timestamp('2020-1-3', tz='UTC'),
+         'value': -3.},
+        {'name': 'scan-b', 'value_date': pd.Timestamp('2020-1-2', tz='UTC'),
+         'value': -2.},
+        {'name': 'scan-b', 'value_date': pd.Timestamp('2020-1-3', tz='UTC'),
+         'value': -3.}
+    ]
+
+    frame = tsx.overrides_many(
+        ['scan-a', 'scan-b'],
+        from_value_date=pd.Timestamp('2020-1-3')
+    )
+    assert frame.name.tolist() == ['scan-a', 'scan-b']
+    assert frame.value.tolist() == [-3., -3.]
+
+    # catalogue-wide
+    frame = tsx.overrides_many(to_value_date=pd.Timestamp('2020-1-2'))
+    assert {'scan-a', 'scan-b'} <= set(frame.name)
+    assert 'scan-c' not in set(frame.name)
+
+    assert not len(tsx.overrides_many(['scan-c']))
+
+
+def test_overrides_many_context(tsa, monkeypatch):
+    series = pd.Series(
+        [1., 2., 3.],
+        index=pd.date_range(pd.Timestamp('2020-1-1'), freq='D', periods=3)
+    )
+    for name in ('scan-ctx-a', 'scan-ctx-b'):
+        tsa.update(name, series, 'test')
+        tsa.update(name, series[1:] * -1, 'test', manual=True)
+
+    # the reading threads see the context of the caller
+    probe = contextvars.ContextVar('probe', default=None)
+    seen = []
+    get_overrides = tsa.tsh.get_overrides
+
+    def spy(cn, name, **kw):
+        seen.append(probe.get())
+        return get_overrides(cn, name, **kw)
+
+    monkeypatch.setattr(tsa.tsh, 'get_overrides', spy)
+    token = probe.set('caller')
+    try:
+        frame = tsa.overrides_many(['scan-ctx-a', 'scan-ctx-b'])
+    finally:
+        probe.reset(token)
+    assert len(frame) == 4
+    assert seen == ['caller', 'caller']
+
+
+def test_supervision_stats(tsa):
+    series = pd.Series(
+        [1., 2., 3.],
+        index=pd.date_range(pd.Timestamp('2020-1-1'), freq='D', periods=3)
+    )
+    tsa.update('stats-unsupervised', series, 'test')
+    tsa.update('stats-unsupervised', series + 1, 'test')
+    tsa.update('stats-handcrafted', series, 'test', manual=True)
+    tsa.update('stats-supervised', series, 'test',
+               insertion_date=pd.Timestamp('2020-1-1', tz='UTC'))
+    tsa.update('stats-supervised', series[1:] * 10, 'test', manual=True,
+               insertion_date=pd.Timestamp('2020-1-2', tz='UTC'))
+    tsa.update('stats-supervised', series + 1, 'test',
+               insertion_date=pd.Timestamp('2020-1-3', tz='UTC'))
+    tsa.update('stats-supervised', series[2:] * -1, 'test', manual=True,
+               insertion_date=pd.Timestamp('2020-1-4', tz='UTC'))
+    # two upstream revisions before the first manual edit
+    tsa.update('stats-late-edit', series, 'test')
+    tsa.update('stats-late-edit', series + 1, 'test')
+    tsa.update('stats-late-edit', series[:1] * 10, 'test', manual=True)
+    tsa.update('stats-late-edit', series + 2, 'test')
+
+    names = ['stats-unsupervised', 'stats-handcrafted', 'stats-supervised']
+    stats = tsa.supervision_stats(names, points=True)
+    assert stats.to_dict(orient='index') == {
+        'stats-handcrafted': {
+            'status': 'handcrafted',
+            'edited_revisions': 1,
+            'upstream_revisions': 0,
+            'manual_changesets': 1,
+            'last_manual_edit': stats.last_manual_edit['stats-handcrafted'],
+            'overridden_points': 0
+        },
+        'stats-supervised': {
+            'status': 'supervised',
+            'edited_revisions': 4,
+            'upstream_revisions': 2,
+            'manual_changesets': 2,
+            'last_manual_edit': pd.Timestamp('2020-1-4', tz='UTC'),
+            # the upstream update of the 3rd wiped the first edits
+            'overridden_points': 1
+        },
+        'stats-unsupervised': {
+            'status': 'unsupervised',
+            'edited_revisions': 2,
+            'upstream_revisions': 2,
+            'manual_changesets': 0,
+            'last_manual_edit': stats.last_manual_edit['stats-unsupervised'],
+            'overridden_points': 0
+        }
+    }
+    assert pd.isnull(stats.last_manual_edit['stats-unsupervised'])
+
+    # the same upstream revisions as `upstream_insertion_dates`
+    names.append('stats-late-edit')
+    stats = tsa.supervision_stats(names)
+    assert stats.upstream_revisions['stats-late-edit'] == 3
+    for name in names:
+        assert stats.upstream_revisions[name] == len(
+            tsa.upstream_insertion_dates(name)
+        )
+
+    assert 'overridden_points' not in tsa.supervision_stats(names).columns
+    assert len(tsa.supervision_stats([])) == 0
+    assert 'stats-supervised' in tsa.supervision_stats().index
+
+
+def test_bulk_lock_order(tsa, monkeypatch):
+    from tshistory_supervision import tsio
+
+    series = pd.Series(
+        [1., 2., 3.],
+        index=pd.date_range(pd.Timestamp('2020-1-1'), freq='D', periods=3)
+    )
+    names = ['lock-order-c', 'lock-order-a', 'lock-order-b']
+    for name in names:
+        tsa.update(name, series, 'test')
+
+    locked = []
+    lock_series = tsio.timeseries._lock_series
+
+    def lock(self, cn, name):
+        locked.append(name)
+        return lock_series(self, cn, name)
+
+    monkeypatch.setattr(tsio.timeseries, '_lock_series', lock)
+
+    # the same order whatever the caller order: no deadlock between
+    # concurrent bulk operations
+    tsa.update_manual_many(
+        {name: series[:1] * 10 for name in names}, 'test'
+    )
+    assert locked == sorted(names)
+
+    locked.clear()
+    tsa.revert_overrides_many(names, 'test')
+    assert locked == sorted(names)
+
+
+def test_edited_downsampling(tsx):
+    index = pd.date_range(pd.Timestamp('2020-1-1'), freq='15min', periods=96 * 10)
+    series = pd.Series(np.sin(np.arange(len(index)) / 10.), index=index)
+    tsx.update('downsample-me', series, 'test')
+    tsx.update(
+        'downsample-me',
+        pd.Series([42., 43.], index=index[[100, 101]]),
+        'test',
+        manual=True
+    )
+
+    ts, markers = tsx.edited('downsample-me', max_points=100)
+    assert len(ts) == len(markers)
+    assert len(ts) <= 100 + 2
+    # the extrema and the overrides are kept
+    assert ts.max() == 43.
+    assert ts.min() == series.min()
+    assert markers.sum() == 2
+    assert ts[markers].tolist() == [42., 43.]
+    assert ts.equals(
+        tsx.edited('downsample-me')[0].reindex(ts.index)
+    )
+
+    # daily min/max
+    ts, markers = tsx.edited('downsample-me', resample='1D')
+    assert 10 * 2 <= len(ts) <= 10 * 2 + 2
+    assert markers.sum() == 2
+
+    ts, markers = tsx.edited('downsample-me', resample='1D', max_points=10)
+    assert len(ts) <= 10 + 2
+
+    # no-op
+    ts, markers = tsx.edited('downsample-me', max_points=10000)
+    assert len(ts) == len(series)
+
+
+def test_edited_provenance(tsx):
+    series = pd.Series(
+        [1., 2., 3., 4., 5.],
+        index=pd.date_range(pd.Timestamp('2020-1-1'), freq='D', periods=5)
+    )
+    tsx.update('provenance', series.drop(series.index[3]), 'test')
+    tsx.update(
+        'provenance',
+        pd.Series([42., np.nan], index=series.index[[1, 2]]),
+        'test',
+        manual=True
+    )
+
+    ts, markers = tsx.edited('provenance')
+    assert markers.tolist() == [False, True, True, False]
+
+    ts, prov = tsx.edited('provenance', provenance=True, _keep_nans=True)
+    assert prov.dtype == 'int8'
+    assert prov.name == 'provenance'
+    assert_df("""
+2020-01-01    0
+2020-01-02    1
+2020-01-03    3
+2020-01-05    0
+""", prov)
+
+    ts, prov = tsx.edited(
+        'provenance', provenance=True, inferred_freq=True
+    )
+    assert_df("""
+2020-01-01     1.0
+2020-01-02    42.0
+2020-01-03     NaN
+2020-01-04     NaN
+2020-01-05     5.0
+""", ts)
+    assert prov.tolist() == [0, 1, 3, 2, 0]
+
+    # unsupervised series
+    tsx.update('provenance-unsupervised', series, 'test')
+    ts, prov = tsx.edited('provenance-unsupervised', provenance=True)
+    assert prov.tolist() == [0] * 5
+
+    # downsampling keeps the manual points
+    ts, prov = tsx.edited('provenance', provenance=True, max_points=2)
+    assert 1 in prov.tolist()
+
+
+def test_edited_frame(tsx):
+    index = pd.date_range(pd.Timestamp('2020-1-1'), freq='D', periods=4)
+    tsx.update('frame-a', pd.Series([1., 2., 3.], index=index[:3]), 'test')
+    tsx.update('frame-b', pd.Series([10., 20., 30.], index=index[1:]), 'test')
+    tsx.update(
+        'frame-b', pd.Series([-20.], index=index[2:3]), 'test', manual=True
+    )
+
+    values, markers = tsx.edited_frame(['frame-b', 'frame-a', 'frame-nope'])
+    assert values.columns.tolist() == ['frame-b', 'frame-a', 'frame-nope']
+    assert values.index.equals(markers.index)
+    assert_df("""
+            frame-b  frame-a  frame-nope
+2020-01-01      NaN      1.0         NaN
+2020-01-02     10.0      2.0         NaN
+2020-01-03    -20.0      3.0         NaN
+2020-01-04     30.0      NaN         NaN
+""", values)
+    assert_df("""
+            frame-b  frame-a  frame-nope
+2020-01-01    False    False       False
+2020-01-02    False    False       False
+2020-01-03     True    False       False
+2020-01-04    False    False       False
+""", markers)
+
+    # the frames are ours
+    values.loc[index[0], 'frame-a'] = 0.
+    markers.loc[index[0], 'frame-a'] = True
+    assert values.values.flags.writeable
+    assert markers.values.flags.writeable
+
+    values, markers = tsx.edited_frame(
+        ['frame-a', 'frame-b'],
+        from_value_date=pd.Timestamp('2020-1-3')
+    )
+    assert values.index.tolist() == index[2:].tolist()
+
+    values, markers = tsx.edited_frame(['frame-nope'])
+    assert values.shape == markers.shape == (0, 1)
+
+    tsx.update('frame-str', pd.Series(['a', 'b'], index=index[:2]), 'test')
+    with pytest.raises(ValueError) as err:
+        tsx.edited_frame(['frame-a', 'frame-str'])
+    assert err.value.args[0] == '`frame-str` is not a numeric series'
+
+    tsx.update(
+        'frame-tz',
+        pd.Series([1., 2.], index=index[:2].tz_localize('UTC')),
+        'test'
+    )
+    with pytest.raises(ValueError) as err:
+        tsx.edited_frame(['frame-a', 'frame-tz'])
+    assert err.value.args[0] == 'cannot align tz-aware and tz-naive series'
+
+
+def test_read_replica(engine, monkeypatch):
+    from sqlalchemy import create_engine
+    from sqlalchemy.exc import InternalError
+    from tshistory import api
+    from tshistory_supervision import tsio
+    from tshistory_supervision.schema import supervision_schema
+
+    # a second database on the same cluster plays the replica
+    with engine.connect().execution_options(
+            isolation_level='AUTOCOMMIT') as cn:
+        cn.execute('drop database if exists replica')
+        cn.execute('create database replica')
+    replicauri = str(engine.url.set(database='replica'))
+    replica = create_engine(replicauri)
+    supervision_schema('test-replica').create(engine)
+    supervision_schema('test-replica').create(replica)
+
+    primary = api.timeseries(
+        str(engine.url),
+        namespace='test-replica',
+        handler=tsio.timeseries,
+        sources={}
+    )
+    mirror = api.timeseries(
+        replicauri,
+        namespace='test-replica',
+        handler=tsio.timeseries,
+        sources={}
+    )
+    series = pd.Series(
+        [1., 2., 3.],
+        index=pd.date_range(pd.Timestamp('2020-1-1'), freq='D', periods=3)
+    )
+    mirror.update('replicated', series * 10, 'test')
+    mirror.update('replicated', series[1:2] * 100, 'test', manual=True)
+
+    # no replica yet: read-your-writes right after a manual update
+    primary.update('replicated', series, 'test')
+    primary.update('replicated', series[:1] * -1, 'test', manual=True)
+    ts, marker = primary.edited('replicated')
+    assert ts.tolist() == [-1., 2., 3.]
+
+    primary.set_read_replica(replicauri)
+    # written a moment ago: pinned to the primary
+    ts, marker = primary.edited('replicated')
+    assert ts.tolist() == [-1., 2., 3.]
+    assert primary.supervision_stats().index.tolist() == ['replicated']
+    assert primary.overrides_many().value.tolist() == [-1.]
+
+    # the replica sessions are read-only
+    with pytest.raises(InternalError):
+        with primary.tsh.replica.begin() as cn:
+            cn.execute('create table nope (id int)')
+
+    # the writes are stamped when committed, and not rolled back
+    tsh = primary.tsh
+    with pytest.raises(ZeroDivisionError):
+        with primary.engine.begin() as cn:
+            tsh.update(cn, series, 'rolled-back', 'test')
+            1 / 0
+    assert not tsh.recently_written('rolled-back')
+
+    primary.update('replicated-bis', series, 'test')
+    tsh.lastwrites.clear()
+    with primary.engine.begin() as cn:
+        tsh.update_metadata(cn, 'replicated-bis', {'foo': 42})
+        assert not tsh.recently_written('replicated-bis')
+    assert tsh.recently_written('replicated-bis')
+
+    tsh.lastwrites.clear()
+    primary.rename('replicated-bis', 'replicated-ter')
+    assert tsh.recently_written('replicated-bis')
+    assert tsh.recently_written('replicated-ter')
+
+    tsh.lastwrites.clear()
+    primary.delete('replicated-ter')
+    assert tsh.recently_written('replicated-ter')
+
+    monkeypatch.setattr(tsio, 'READ_YOUR_WRITES_DELAY', 0)
+    ts, marker = primary.edited('replicated')
+    assert ts.tolist() == [10., 200., 30.]
+    assert marker.tolist() == [False, True, False]
+    assert primary.supervision_status('replicated') == 'supervised'
+    assert primary.overrides_many().value.tolist() == [200.]
+    values, markers = primary.edited_frame(['replicated'])
+    assert values['replicated'].tolist() == [10., 200., 30.]
+    stats = primary.supervision_stats(['replicated'])
+    assert stats.edited_revisions['replicated'] == 2
+
+    primary.set_read_replica(None)
+    ts, marker = primary.edited('replicated')
+    assert ts.tolist() == [-1., 2., 3.]
+    mirror.engine.dispose()
+    replica.dispose()
+
+
+def test_edit_session(tsa, monkeypatch):
+    from tshistory_supervision.api import editsession
+
+    loads = []
+    load = editsession._load
+
+    def countingload(self, cn, name, *a):
+        loads.append(name)
+        return load(self, cn, name, *a)
+
+    monkeypatch.setattr(editsession, '_load', countingload)
+
+    def assert_same(session, name, from_value_date=None, to_value_date=None):
+        ts, marker = session.edited(name, from_value_date, to_value_date)
+        refts, refmarker = tsa.edited(
+            name,
+            from_value_date=from_value_date,
+            to_value_date=to_value_date
+        )
+        assert ts.to_dict() == refts.to_dict()
+        assert marker.to_dict() == refmarker.to_dict()
+
+    series = pd.Series(
+        [1., 2., 3., 4., 5.],
+        index=pd.date_range(pd.Timestamp('2020-1-1'), freq='D', periods=5)
+    )
+    tsa.update('session', series, 'test')
+    tsa.update('session', series[1:2] * 10, 'test', manual=True)
+
+    session = tsa.edit_session()
+    assert_same(session, 'session')
+    assert loads == ['session']
+
+    # change, erasure and new point
+    edit = pd.Series(
+        [30., np.nan, 7.],
+        index=pd.DatetimeIndex(['2020-1-3', '2020-1-4', '2020-1-7'])
+    )
+    session.update('session', edit, 'analyst')
+    assert_same(session, 'session')
+    ts, marker = session.edited('session')
+    assert marker[marker.astype(bool)].index.day.tolist() == [2, 3, 4, 7]
+    # back to upstream
+    session.update('session', series[1:2], 'analyst')
+    assert_same(session, 'session')
+    session.replace('session', series[:3] * 2, 'analyst')
+    assert_same(session, 'session')
+    assert loads == ['session']
+
+    # windows are cached apart
+    fromdate, todate = pd.Timestamp('2020-1-2'), pd.Timestamp('2020-1-4')
+    assert_same(session, 'session', fromdate, todate)
+    session.update('session', series[2:] * -1, 'analyst')
+    assert_same(session, 'session', fromdate, todate)
+    assert_same(session, 'session')
+    assert loads == ['session'] * 2
+
+    # upstream write: full read
+    tsa.update('session', series + 1, 'test')
+    assert_same(session, 'session')
+    assert loads == ['session'] * 3
+
+    # another session write: full read
+    tsa.edit_session().update('session', series[:1] * 0, 'other')
+    session.update('session', series[4:] * 0, 'analyst')
+    assert_same(session, 'session')
+    assert loads == ['session'] * 4
+
+    # handcrafted
+    tsa.update('session-handcrafted', series, 'test', manual=True)
+    assert_same(session, 'session-handcrafted')
+    session.update('session-handcrafted', edit, 'analyst')
+    assert_same(session, 'session-handcrafted')
+    assert loads[4:] == ['session-handcrafted']
+
+    # the first manual edit of an unsupervised series
+    tsa.update('session-unsupervised', series, 'test')
+    assert_same(session, 'session-unsupervised')
+    session.update('session-unsupervised', edit, 'analyst')
+    assert_same(session, 'session-unsupervised')
+    assert loads[5:] == ['session-unsupervised'] * 2
+
+    # a tolerance change makes no revision
+    tsa.update('session-tolerance', series, 'test')
+    tsa.update('session-tolerance', series[1:2] + .001, 'test', manual=True)
+    assert session.edited('session-tolerance')[1].tolist() == [
+        False, True, False, False, False
+    ]
+    tsa.update_metadata('session-tolerance', {'supervision_atol': .01})
+    assert session.edited('session-tolerance')[1].tolist() == [False] * 5
+    assert_same(session, 'session-tolerance')
+    assert loads[7:] == ['session-tolerance'] * 2
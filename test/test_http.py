@@ -3,6 +3,7 @@ import json
 
 import numpy as np
 import pandas as pd
+import pytest
 
 from tshistory import util
 from tshistory.testutil import (
@@ -174,3 +175,549 @@ def test_infer_freq_http(client):
     })
     series, markers = util.unpack_many_series(res.body)
     assert 5 == len(series) == len(markers)
+
+
+def test_supervision_etag(client, engine, tsh):
+    series = genserie(utcdt(2020, 1, 1), 'D', 3)
+    client.patch('/series/state', params={
+        'name': 'test-etag',
+        'series': util.tojson(series),
+        'author': 'Babar',
+        'insertion_date': utcdt(2020, 1, 1, 10),
+        'tzaware': util.tzaware_series(series)
+    })
+
+    res = client.get('/series/supervision', params={'name': 'test-etag'})
+    assert res.status_code == 200
+    etag = res.headers['ETag']
+    assert res.headers['Cache-Control'] == 'no-cache'
+
+    res = client.get(
+        '/series/supervision',
+        params={'name': 'test-etag'},
+        headers={'If-None-Match': etag}
+    )
+    assert res.status_code == 304
+    assert res.body == b''
+
+    # other query args, other etag
+    res = client.get(
+        '/series/supervision',
+        params={'name': 'test-etag', 'format': 'tshpack'},
+        headers={'If-None-Match': etag}
+    )
+    assert res.status_code == 200
+    assert res.headers['ETag'] != etag
+
+    series.iloc[-1] = 42
+    client.patch('/series/state', params={
+        'name': 'test-etag',
+        'series': util.tojson(series),
+        'author': 'Babar',
+        'insertion_date': utcdt(2020, 1, 1, 11),
+        'supervision': json.dumps(True),
+        'tzaware': util.tzaware_series(series)
+    })
+    res = client.get(
+        '/series/supervision',
+        params={'name': 'test-etag'},
+        headers={'If-None-Match': etag}
+    )
+    assert res.status_code == 200
+    assert res.headers['ETag'] != etag
+
+    etag = res.headers['ETag']
+
+    # a tolerance change may change the markers
+    tsh.update_metadata(engine, 'test-etag', {'supervision_atol': 1e-3})
+    res = client.get(
+        '/series/supervision',
+        params={'name': 'test-etag'},
+        headers={'If-None-Match': etag}
+    )
+    assert res.status_code == 200
+    assert res.headers['ETag'] != etag
+
+    # a past revision must be revalidated too: it can be stripped
+    res = client.get('/series/supervision', params={
+        'name': 'test-etag',
+        'insertion_date': utcdt(2020, 1, 1, 11, 30)
+    })
+    assert res.status_code == 200
+    assert res.headers['Cache-Control'] == 'no-cache'
+    past = res.headers['ETag']
+
+    csid = tsh.changeset_at(engine, 'test-etag', utcdt(2020, 1, 1, 11))
+    tsh.strip(engine, 'test-etag', csid)
+    res = client.get(
+        '/series/supervision',
+        params={
+            'name': 'test-etag',
+            'insertion_date': utcdt(2020, 1, 1, 11, 30)
+        },
+        headers={'If-None-Match': past}
+    )
+    assert res.status_code == 200
+    assert res.headers['ETag'] != past
+
+
+def test_edited_client_cache(httpclient, monkeypatch):
+    statuses = []
+    get = httpclient.session.get
+
+    def spyget(*a, **kw):
+        res = get(*a, **kw)
+        statuses.append(res.status_code)
+        return res
+
+    monkeypatch.setattr(httpclient.session, 'get', spyget)
+
+    series = genserie(utcdt(2020, 1, 1), 'D', 3)
+    httpclient.update('test-edited-cache', series, 'Babar')
+
+    ts1, markers1 = httpclient.edited('test-edited-cache')
+    assert statuses == [200]
+    assert len(httpclient._editedcache) == 1
+
+    ts2, markers2 = httpclient.edited('test-edited-cache')
+    # served from the cache after revalidation
+    assert statuses == [200, 304]
+    assert ts1.equals(ts2)
+    assert markers1.equals(markers2)
+    # the cache hands out copies
+    ts2.iloc[0] = -1
+    ts3, _ = httpclient.edited('test-edited-cache')
+    assert ts3.equals(ts1)
+
+    series.iloc[-1] = 42
+    httpclient.update('test-edited-cache', series, 'Babar', manual=True)
+    statuses.clear()
+    ts, markers = httpclient.edited('test-edited-cache')
+    assert statuses == [200]
+    assert ts.iloc[-1] == 42
+    assert markers.iloc[-1]
+
+
+def test_supervision_compression(client):
+    import gzip
+    from webob import Request
+
+    series = genserie(utcdt(2020, 1, 1), 'h', 200)
+    client.patch('/series/state', params={
+        'name': 'test-compress',
+        'series': util.tojson(series),
+        'author': 'Babar',
+        'insertion_date': utcdt(2020, 1, 1, 10),
+        'tzaware': util.tzaware_series(series)
+    })
+
+    # NOTE: webtest transparently decodes the responses,
+    # hence we go raw
+    def get(query, **headers):
+        req = Request.blank(f'/series/supervision?{query}', headers=headers)
+        return req.get_response(client.app)
+
+    res = get('name=test-compress')
+    assert 'Content-Encoding' not in res.headers
+    raw = res.body
+
+    assert 'Accept-Encoding' in res.headers['Vary']
+    etag = res.headers['ETag']
+    assert not etag.startswith('W/')
+
+    res = get('name=test-compress', **{'Accept-Encoding': 'gzip'})
+    assert res.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in res.headers['Vary']
+    assert len(res.body) < len(raw) / 5
+    assert gzip.decompress(res.body) == raw
+    # same resource, other bytes: a weak etag
+    assert res.headers['ETag'] == f'W/{etag}'
+
+    # both validate the cached representations
+    for tag in (etag, f'W/{etag}'):
+        res = get(
+            'name=test-compress',
+            **{'Accept-Encoding': 'gzip', 'If-None-Match': tag}
+        )
+        assert res.status_code == 304
+
+    # zstd is preferred when available
+    zstandard = pytest.importorskip('zstandard')
+    res = get('name=test-compress', **{'Accept-Encoding': 'gzip, zstd'})
+    assert res.headers['Content-Encoding'] == 'zstd'
+    assert len(res.body) < len(raw) / 5
+    assert zstandard.ZstdDecompressor().decompressobj().decompress(
+        res.body
+    ) == raw
+    assert res.headers['ETag'] == f'W/{etag}'
+
+    res = get('name=test-compress', **{'Accept-Encoding': 'zstd;q=0, gzip'})
+    assert res.headers['Content-Encoding'] == 'gzip'
+
+    # small payloads are not compressed
+    res = get(
+        'name=test-compress&to_value_date=2020-01-01T02:00:00',
+        **{'Accept-Encoding': 'gzip'}
+    )
+    assert res.status_code == 200
+    assert 'Content-Encoding' not in res.headers
+    assert 'Accept-Encoding' in res.headers['Vary']
+
+
+def test_supervision_arrow(client):
+    pa = pytest.importorskip('pyarrow')
+    from tshistory_supervision.http import unpack_arrow
+
+    series = genserie(utcdt(2020, 1, 1), 'D', 3)
+    client.patch('/series/state', params={
+        'name': 'test-arrow',
+        'series': util.tojson(series),
+        'author': 'Babar',
+        'insertion_date': utcdt(2020, 1, 1, 10),
+        'tzaware': util.tzaware_series(series)
+    })
+    series.iloc[-1] = 42
+    client.patch('/series/state', params={
+        'name': 'test-arrow',
+        'series': util.tojson(series),
+        'author': 'Babar',
+        'insertion_date': utcdt(2020, 1, 1, 11),
+        'supervision': json.dumps(True),
+        'tzaware': util.tzaware_series(series)
+    })
+
+    res = client.get('/series/supervision', params={
+        'name': 'test-arrow',
+        'format': 'arrow'
+    })
+    assert res.headers['Content-Type'] == 'application/vnd.apache.arrow.stream'
+    batch = pa.ipc.open_stream(res.body).read_next_batch()
+    assert batch.schema.names == ['index', 'value', 'marker']
+    assert batch.column('marker').to_pylist() == [False, False, True]
+
+    ts, markers = unpack_arrow(res.body)
+    assert ts.name == 'test-arrow'
+    assert_df("""
+2020-01-01 00:00:00+00:00     0.0
+2020-01-02 00:00:00+00:00     1.0
+2020-01-03 00:00:00+00:00    42.0
+""", ts)
+    assert_df("""
+2020-01-01 00:00:00+00:00    False
+2020-01-02 00:00:00+00:00    False
+2020-01-03 00:00:00+00:00     True
+""", markers)
+
+    res = client.get('/series/supervision', params={
+        'name': 'test-arrow',
+        'format': 'arrow',
+        'tzone': 'Europe/Paris'
+    })
+    ts, _ = unpack_arrow(res.body)
+    assert str(ts.index.tz) == 'Europe/Paris'
+    assert ts.index[0] == utcdt(2020, 1, 1)
+
+
+def test_edited_arrow_client(tsx):
+    pytest.importorskip('pyarrow')
+    if not hasattr(tsx, 'editedformat'):
+        pytest.skip('the transport formats are an http client matter')
+
+    series = genserie(utcdt(2020, 1, 1), 'D', 3)
+    tsx.update('test-arrow-client', series, 'Babar')
+    series.iloc[-1] = 42
+    tsx.update('test-arrow-client', series, 'Babar', manual=True)
+
+    tsx.editedformat = 'arrow'
+    try:
+        ts, markers = tsx.edited('test-arrow-client')
+        _, prov = tsx.edited('test-arrow-client', provenance=True)
+    finally:
+        tsx.editedformat = 'tshpack'
+
+    assert_df("""
+2020-01-01 00:00:00+00:00     0.0
+2020-01-02 00:00:00+00:00     1.0
+2020-01-03 00:00:00+00:00    42.0
+""", ts)
+    assert markers.tolist() == [False, False, True]
+    assert prov.dtype == 'int8'
+    assert prov.tolist() == [0, 0, 1]
+
+    # the arrays are ours
+    ts.iloc[0] = 4
+    markers.iloc[0] = True
+
+    # erased points: same output as tshpack
+    tsx.update(
+        'test-arrow-client',
+        pd.Series([np.nan], index=[utcdt(2020, 1, 2)]),
+        'Babar',
+        manual=True
+    )
+    for provenance in (False, True):
+        tsx.editedformat = 'arrow'
+        try:
+            arrow = tsx.edited('test-arrow-client', provenance=provenance)
+        finally:
+            tsx.editedformat = 'tshpack'
+        tshpack = tsx.edited('test-arrow-client', provenance=provenance)
+        pd.testing.assert_series_equal(arrow[0], tshpack[0])
+        pd.testing.assert_series_equal(arrow[1], tshpack[1])
+    assert len(arrow[0]) == 2
+    assert len(arrow[1]) == 3
+
+
+def test_supervision_server_timing(client, caplog, monkeypatch):
+    from tshistory_supervision import http
+
+    series = genserie(utcdt(2020, 1, 1), 'D', 3)
+    client.patch('/series/state', params={
+        'name': 'test-timing',
+        'series': util.tojson(series),
+        'author': 'Babar',
+        'insertion_date': utcdt(2020, 1, 1, 10),
+        'tzaware': util.tzaware_series(series)
+    })
+    series.iloc[-1] = 42
+    client.patch('/series/state', params={
+        'name': 'test-timing',
+        'series': util.tojson(series),
+        'author': 'Babar',
+        'insertion_date': utcdt(2020, 1, 1, 11),
+        'supervision': json.dumps(True),
+        'tzaware': util.tzaware_series(series)
+    })
+
+    res = client.get('/series/supervision?name=test-timing')
+    timing = res.headers['Server-Timing']
+    phases = dict(
+        entry.split(';', 1)
+        for entry in timing.split(', ')
+    )
+    assert set(phases) == {
+        'sql', 'reconstruction', 'markers', 'encoding', 'statements', 'total'
+    }
+    statements = int(phases['statements'].split('"')[1].split()[0])
+    assert statements > 5
+
+    with caplog.at_level('WARNING', logger='tshistory_supervision.http'):
+        client.get('/series/supervision?name=test-timing&format=tshpack')
+        assert not caplog.records
+        monkeypatch.setattr(http, 'SLOW_REQUEST_THRESHOLD', 0)
+        client.get('/series/supervision?name=test-timing&format=tshpack')
+    [record] = caplog.records
+    assert record.getMessage().startswith(
+        "slow request /series/supervision "
+        "{'name': ['test-timing'], 'format': ['tshpack']}"
+    )
+
+
+def test_supervision_statements_count(client):
+    series = genserie(utcdt(2020, 1, 1), 'D', 3)
+    for name in ('count-supervised', 'count-unsupervised'):
+        client.patch('/series/state', params={
+            'name': name,
+            'series': util.tojson(series),
+            'author': 'Babar',
+            'insertion_date': utcdt(2020, 1, 1, 10),
+            'tzaware': util.tzaware_series(series)
+        })
+    series.iloc[-1] = 42
+    client.patch('/series/state', params={
+        'name': 'count-supervised',
+        'series': util.tojson(series),
+        'author': 'Babar',
+        'insertion_date': utcdt(2020, 1, 1, 11),
+        'supervision': json.dumps(True),
+        'tzaware': util.tzaware_series(series)
+    })
+
+    def statements(res):
+        timing = res.headers['Server-Timing']
+        return int(timing.split('statements;desc="')[1].split()[0])
+
+    # registry (both branches), last revisions, edited + upstream
+    # (revision, chunks)
+    res = client.get('/series/supervision?name=count-supervised&format=tshpack')
+    assert statements(res) == 1 + 2 + 2 * 2
+    ts, markers = util.unpack_many_series(res.body)
+    assert markers.tolist() == [False, False, True]
+
+    # no upstream there
+    res = client.get('/series/supervision?name=count-unsupervised&format=tshpack')
+    assert statements(res) == 1 + 1 + 2
+
+    res = client.get('/series/supervision?name=count-supervised&format=tshpack')
+    res = client.get(
+        '/series/supervision?name=count-supervised&format=tshpack',
+        headers={'If-None-Match': res.headers['ETag']}
+    )
+    assert res.status_code == 304
+    assert statements(res) == 1 + 2
+
+
+def test_request_timings(engine):
+    import contextvars
+    from tshistory.util import threadpool
+    from tshistory_supervision import http
+
+    http.watch_sql(engine)
+    timings = {}
+    token = http.TIMINGS.set(timings)
+    try:
+        with http.timed('reconstruction'):
+            with engine.begin() as cn:
+                cn.execute('select pg_sleep(.05)')
+
+        def sleep():
+            with engine.begin() as cn:
+                cn.execute('select pg_sleep(.02)')
+
+        # the statements of the threads are accounted too
+        threadpool(4)(
+            lambda ctx: ctx.run(sleep),
+            [(contextvars.copy_context(),) for _ in range(4)]
+        )
+    finally:
+        http.TIMINGS.reset(token)
+
+    assert timings['_statements'] == 1 + 4
+    assert timings['sql'] >= .05 + 4 * .02
+    # the phase does not count its sql statements
+    assert timings['reconstruction'] < .05
+
+
+def test_supervision_overrides_timing(client, caplog, monkeypatch):
+    from tshistory_supervision import http
+
+    series = genserie(utcdt(2020, 1, 1), 'D', 3)
+    names = [f'timing-overrides-{idx}' for idx in range(3)]
+    for name in names:
+        client.patch('/series/state', params={
+            'name': name,
+            'series': util.tojson(series),
+            'author': 'Babar',
+            'insertion_date': utcdt(2020, 1, 1, 10),
+            'tzaware': util.tzaware_series(series)
+        })
+        client.patch('/series/state', params={
+            'name': name,
+            'series': util.tojson(series[-1:] * 2),
+            'author': 'Babar',
+            'insertion_date': utcdt(2020, 1, 1, 11),
+            'supervision': json.dumps(True),
+            'tzaware': util.tzaware_series(series)
+        })
+
+    monkeypatch.setattr(http, 'SLOW_REQUEST_THRESHOLD', 0)
+    with caplog.at_level('WARNING', logger='tshistory_supervision.http'):
+        res = client.get(
+            '/series/supervision/overrides',
+            params=[('name', name) for name in names]
+        )
+    assert res.text.count('timing-overrides-') == 3
+    # logged once the body is out, with the statements of its threads
+    [record] = caplog.records
+    statements = int(record.getMessage().split('s, ')[1].split()[0])
+    assert statements > len(names)
+
+
+def test_supervision_manual_json(client):
+    series = genserie(utcdt(2020, 1, 1), 'D', 3)
+    client.patch('/series/state', params={
+        'name': 'test-manual-bundle',
+        'series': util.tojson(series),
+        'author': 'Babar',
+        'tzaware': util.tzaware_series(series)
+    })
+
+    edit = series[1:2] * 10
+    edit.name = 'test-manual-bundle'
+    bundle = util.pack_many_series([(util.series_metadata(edit), edit)])
+    res = client.post(
+        '/series/supervision/manual',
+        params={'author': 'Celeste'},
+        upload_files=[('bseries', 'bseries', bundle)]
+    )
+    assert res.status_code == 200
+    assert res.json == {
+        'test-manual-bundle': {'2020-01-02T00:00:00+00:00': 10.0}
+    }
+
+    res = client.get('/series/supervision?name=test-manual-bundle')
+    df = pd.read_json(io.StringIO(res.text), orient='index')
+    assert_df("""
+                           series  markers
+2020-01-01 00:00:00+00:00       0    False
+2020-01-02 00:00:00+00:00      10     True
+2020-01-03 00:00:00+00:00       2    False
+""", df)
+
+
+def test_supervision_upstream_json(client):
+    series = genserie(utcdt(2020, 1, 1), 'D', 3)
+    client.patch('/series/state', params={
+        'name': 'test-upstream-json',
+        'series': util.tojson(series),
+        'author': 'Babar',
+        'insertion_date': utcdt(2021, 1, 1),
+        'tzaware': util.tzaware_series(series)
+    })
+    series.iloc[-1] = 42
+    client.patch('/series/state', params={
+        'name': 'test-upstream-json',
+        'series': util.tojson(series),
+        'author': 'Babar',
+        'insertion_date': utcdt(2021, 1, 2),
+        'supervision': json.dumps(True),
+        'tzaware': util.tzaware_series(series)
+    })
+
+    res = client.get('/series/supervision/upstream?name=test-upstream-json')
+    assert res.json == {
+        '2020-01-01T00:00:00+00:00': 0.0,
+        '2020-01-02T00:00:00+00:00': 1.0,
+        '2020-01-03T00:00:00+00:00': 2.0
+    }
+
+    res = client.get(
+        '/series/supervision/upstream/history?name=test-upstream-json'
+    )
+    assert list(res.json) == ['2021-01-01T00:00:00+00:00']
+
+    res = client.get(
+        '/series/supervision/upstream/insertion_dates?name=nope'
+    )
+    assert res.status_code == 404
+
+
+def test_supervision_upstream_compression(client):
+    import gzip
+    from webob import Request
+
+    series = genserie(utcdt(2020, 1, 1), 'h', 1000)
+    client.patch('/series/state', params={
+        'name': 'test-upstream-compression',
+        'series': util.tojson(series),
+        'author': 'Babar',
+        'tzaware': util.tzaware_series(series)
+    })
+
+    # raw, webtest decodes the responses
+    def get(query):
+        req = Request.blank(
+            f'/series/supervision/upstream?name=test-upstream-compression{query}',
+            headers={'Accept-Encoding': 'gzip'}
+        )
+        return req.get_response(client.app)
+
+    res = get('')
+    assert res.headers['Content-Encoding'] == 'gzip'
+    assert len(json.loads(gzip.decompress(res.body))) == 1000
+
+    # tshpack is already compressed
+    res = get('&format=tshpack')
+    assert 'Content-Encoding' not in res.headers
+    ts = util.unpack_series('test-upstream-compression', res.body)
+    assert len(ts) == 1000
@@ -1,16 +1,19 @@
 from datetime import datetime
+import json
 import pytest
 
 import pandas as pd
 import numpy as np
 
-from tshistory.util import _set_cache, empty_series
+from tshistory.util import _set_cache, empty_series, threadpool
 from tshistory.testutil import (
     assert_df,
     genserie,
     utcdt
 )
 
+from tshistory_supervision import tsio
+
 
 def test_rename(engine, tsh):
     assert tsh.supervision_status(engine, 'rename-me') == 'unsupervised'
@@ -364,6 +367,70 @@ def test_manual_replace(engine, tsh):
 """, ts)
 
 
+def test_manual_diff():
+    upstream = pd.Series(
+        [1., 2., 3.],
+        index=pd.date_range(datetime(2020, 1, 1), freq='D', periods=3)
+    )
+    edited = pd.Series(
+        [1., np.nan, 3., np.nan, 5.],
+        index=pd.date_range(datetime(2020, 1, 1), freq='D', periods=5)
+    )
+    # the erasure of an upstream point is an override, the
+    # erasure of a point upstream never had is not
+    assert_df("""
+2020-01-02    NaN
+2020-01-05    5.0
+""", tsio.manual_diff(upstream, edited))
+
+    # the markers span both indexes
+    assert_df("""
+2020-01-01    False
+2020-01-02     True
+2020-01-03    False
+2020-01-04    False
+2020-01-05     True
+""", tsio.manual_markers('supervised', edited, upstream))
+
+    edited.iloc[0] = 1.01
+    assert tsio.manual_diff(upstream, edited).index.tolist() == [
+        pd.Timestamp('2020-1-1'),
+        pd.Timestamp('2020-1-2'),
+        pd.Timestamp('2020-1-5')
+    ]
+    assert tsio.manual_diff(upstream, edited, atol=.1).index.tolist() == [
+        pd.Timestamp('2020-1-2'),
+        pd.Timestamp('2020-1-5')
+    ]
+
+
+def test_preloaded_metadata(engine, tsh):
+    ts = genserie(datetime(2019, 1, 1), 'D', 3)
+    tsh.update(engine, ts, 'preloaded', 'test')
+
+    with engine.begin() as cn:
+        meta = tsh.series_meta(cn, 'preloaded')
+        assert tsh.internal_metadata(cn, 'preloaded') is meta['internal_metadata']
+
+        tsh.update_metadata(cn, 'preloaded', {'supervision_atol': .1})
+        assert tsh.tolerance(cn, 'preloaded') == (.1, 0.)
+        tsh.update_internal_metadata(
+            cn, 'preloaded', {'supervision_status': 'handcrafted'}
+        )
+        assert tsh.supervision_status(cn, 'preloaded') == 'handcrafted'
+        # the preloaded copy was left alone
+        assert meta['internal_metadata']['supervision_status'] == 'unsupervised'
+
+        tsh.series_meta(cn, 'preloaded')
+        tsh.rename(cn, 'preloaded', 'preloaded-renamed')
+        assert not tsh.exists(cn, 'preloaded')
+        assert tsh.exists(cn, 'preloaded-renamed')
+
+        tsh.series_meta(cn, 'preloaded-renamed')
+        tsh.delete(cn, 'preloaded-renamed')
+        assert not tsh.exists(cn, 'preloaded-renamed')
+
+
 def test_strip(engine, tsh):
     ts = genserie(datetime(2019, 1, 1), 'D', 3)
     tsh.update(
@@ -394,9 +461,173 @@ def test_strip(engine, tsh):
         insertion_date=utcdt(2019, 1, 2)
     )
 
-    with pytest.raises(ValueError):
-        csid = tsh.changeset_at(engine, 'strip-supervised', utcdt(2019, 1, 1))
-        tsh.strip(engine, 'strip-supervised', csid)
+    ts = genserie(datetime(2019, 1, 3), 'D', 3, [7])
+    tsh.update(
+        engine, ts, 'strip-supervised', 'test',
+        insertion_date=utcdt(2019, 1, 3)
+    )
+    ts = genserie(datetime(2019, 1, 5), 'D', 1, [-1])
+    tsh.update(
+        engine, ts, 'strip-supervised', 'test',
+        manual=True,
+        insertion_date=utcdt(2019, 1, 4)
+    )
+    assert tsh.supervision_status(engine, 'strip-supervised') == 'supervised'
+    assert len(tsh.upstream.insertion_dates(engine, 'strip-supervised')) == 2
+
+    # strip the last upstream write and manual edit
+    csid = tsh.changeset_at(engine, 'strip-supervised', utcdt(2019, 1, 3))
+    tsh.strip(engine, 'strip-supervised', csid)
+    assert tsh.upstream.insertion_dates(engine, 'strip-supervised') == [
+        utcdt(2019, 1, 2)
+    ]
+    ts, marker = tsh.get_ts_marker(engine, 'strip-supervised')
+    assert_df("""
+2019-01-01    0.0
+2019-01-02    0.0
+2019-01-03    1.0
+2019-01-04    2.0
+""", ts)
+    assert_df("""
+2019-01-01    False
+2019-01-02     True
+2019-01-03     True
+2019-01-04     True
+""", marker)
+
+    # strip the first manual edit: back to an unsupervised state
+    csid = tsh.changeset_at(engine, 'strip-supervised', utcdt(2019, 1, 2))
+    tsh.strip(engine, 'strip-supervised', csid)
+    assert tsh.supervision_status(engine, 'strip-supervised') == 'unsupervised'
+    assert not tsh.upstream.exists(engine, 'strip-supervised')
+    ts, marker = tsh.get_ts_marker(engine, 'strip-supervised')
+    assert_df("""
+2019-01-01    0.0
+2019-01-02    1.0
+2019-01-03    2.0
+""", ts)
+    assert not marker.any()
+
+    # a stripped handcrafted + upstream series goes back to handcrafted
+    ts = genserie(datetime(2019, 1, 1), 'D', 3)
+    tsh.update(
+        engine, ts, 'strip-handcrafted-2', 'test',
+        manual=True,
+        insertion_date=utcdt(2019, 1, 1)
+    )
+    tsh.update(
+        engine, ts + 1, 'strip-handcrafted-2', 'test',
+        insertion_date=utcdt(2019, 1, 2)
+    )
+    assert tsh.supervision_status(engine, 'strip-handcrafted-2') == 'supervised'
+    csid = tsh.changeset_at(engine, 'strip-handcrafted-2', utcdt(2019, 1, 2))
+    tsh.strip(engine, 'strip-handcrafted-2', csid)
+    assert tsh.supervision_status(engine, 'strip-handcrafted-2') == 'handcrafted'
+
+    # an upstream only revision made between two edits is kept
+    ts = genserie(datetime(2019, 1, 1), 'D', 3)
+    tsh.update(
+        engine, ts, 'strip-upstream-only', 'test',
+        insertion_date=utcdt(2019, 1, 1)
+    )
+    tsh.update(
+        engine, genserie(datetime(2019, 1, 2), 'D', 1, [42]),
+        'strip-upstream-only', 'test',
+        manual=True,
+        insertion_date=utcdt(2019, 1, 2)
+    )
+    # upstream catches up with the edit: no new edited revision
+    tsh.update(
+        engine, genserie(datetime(2019, 1, 2), 'D', 1, [42]),
+        'strip-upstream-only', 'test',
+        insertion_date=utcdt(2019, 1, 3)
+    )
+    tsh.update(
+        engine, genserie(datetime(2019, 1, 3), 'D', 1, [-1]),
+        'strip-upstream-only', 'test',
+        manual=True,
+        insertion_date=utcdt(2019, 1, 4)
+    )
+    assert tsh.insertion_dates(engine, 'strip-upstream-only') == [
+        utcdt(2019, 1, 1), utcdt(2019, 1, 2), utcdt(2019, 1, 4)
+    ]
+    assert tsh.upstream.insertion_dates(engine, 'strip-upstream-only') == [
+        utcdt(2019, 1, 2), utcdt(2019, 1, 3)
+    ]
+    csid = tsh.changeset_at(engine, 'strip-upstream-only', utcdt(2019, 1, 4))
+    tsh.strip(engine, 'strip-upstream-only', csid)
+    assert tsh.insertion_dates(engine, 'strip-upstream-only') == [
+        utcdt(2019, 1, 1), utcdt(2019, 1, 2)
+    ]
+    assert tsh.upstream.insertion_dates(engine, 'strip-upstream-only') == [
+        utcdt(2019, 1, 2), utcdt(2019, 1, 3)
+    ]
+    assert tsh.supervision_status(engine, 'strip-upstream-only') == 'supervised'
+
+
+def test_strip_legacy_stamps(engine, tsh):
+    from tshistory.tsio import timeseries as basets
+
+    name = 'strip-legacy'
+    tsh.update(
+        engine, genserie(datetime(2019, 1, 1), 'D', 3), name, 'test',
+        insertion_date=utcdt(2019, 1, 1)
+    )
+    tsh.update(
+        engine, genserie(datetime(2019, 1, 2), 'D', 1, [42]), name, 'test',
+        manual=True,
+        insertion_date=utcdt(2019, 1, 2)
+    )
+    # upstream only
+    tsh.update(
+        engine, genserie(datetime(2019, 1, 2), 'D', 1, [42]), name, 'test',
+        insertion_date=utcdt(2019, 1, 3)
+    )
+
+    def legacy_write(ts, stamp):
+        # as written before the upstream and edited revisions of a
+        # write got one stamp: upstream a bit before edited
+        with engine.begin() as cn:
+            diff = tsh.upstream.update(
+                cn, ts, name, 'test', insertion_date=stamp
+            )
+            basets.update(
+                tsh, cn, diff, name, 'test',
+                insertion_date=stamp + pd.Timedelta(microseconds=5)
+            )
+
+    series, markers = tsh.get_ts_marker(engine, name)
+    overrides = tsh.get_overrides(engine, name)
+    legacy_write(genserie(datetime(2019, 1, 3), 'D', 2, [7]), utcdt(2019, 1, 4))
+    legacy_write(genserie(datetime(2019, 1, 4), 'D', 2, [8]), utcdt(2019, 1, 5))
+    assert tsh.upstream.insertion_dates(engine, name) == [
+        utcdt(2019, 1, 2), utcdt(2019, 1, 3),
+        utcdt(2019, 1, 4), utcdt(2019, 1, 5)
+    ]
+
+    def strip(stamp):
+        csid = tsh.changeset_at(
+            engine, name, stamp + pd.Timedelta(microseconds=5)
+        )
+        tsh.strip(engine, name, csid)
+
+    strip(utcdt(2019, 1, 5))
+    assert tsh.upstream.insertion_dates(engine, name) == [
+        utcdt(2019, 1, 2), utcdt(2019, 1, 3), utcdt(2019, 1, 4)
+    ]
+    _, legacymarkers = tsh.get_ts_marker(engine, name)
+    assert not legacymarkers['2019-01-03':].any()
+
+    strip(utcdt(2019, 1, 4))
+    assert tsh.upstream.insertion_dates(engine, name) == [
+        utcdt(2019, 1, 2), utcdt(2019, 1, 3)
+    ]
+    stripped, strippedmarkers = tsh.get_ts_marker(engine, name)
+    pd.testing.assert_series_equal(stripped, series)
+    pd.testing.assert_series_equal(strippedmarkers, markers)
+    pd.testing.assert_series_equal(
+        tsh.get_overrides(engine, name), overrides
+    )
 
 
 def test_handcrafted(engine, tsh):
@@ -582,3 +813,548 @@ def test_create_empty_series(engine, tsh):
     ts = empty_series(False)
     tsh.update(engine, ts, 'empty', 'Babar')
     # did not fail :)
+
+
+def test_upstream_tolerance(engine, tsh, monkeypatch):
+    ts = genserie(datetime(2020, 1, 1), 'D', 5, [1.])
+    tsh.update(engine, ts, 'noisy', 'test')
+    tsh.update_metadata(engine, 'noisy', {'supervision_atol': 1e-6})
+    assert tsh.tolerance(engine, 'noisy') == (1e-6, 0.)
+
+    # unsupervised: noise does not make a new revision
+    noisy = ts + 1e-9
+    diff = tsh.update(engine, noisy, 'noisy', 'test')
+    assert len(diff) == 0
+    assert tsh.suppressed['noisy'] == 5
+    assert len(tsh.insertion_dates(engine, 'noisy')) == 1
+
+    ts_manual = genserie(datetime(2020, 1, 3), 'D', 1, [3.])
+    tsh.update(engine, ts_manual, 'noisy', 'test', manual=True)
+    assert tsh.supervision_status(engine, 'noisy') == 'supervised'
+
+    # supervised: noise + a real change
+    noisy = ts + 1e-9
+    noisy.iloc[-1] = 2.
+    diff = tsh.update(engine, noisy, 'noisy', 'test')
+    assert_df("""
+2020-01-05    2.0
+""", diff)
+    assert tsh.suppressed['noisy'] == 9
+
+    # the counts are kept for a bounded number of series
+    monkeypatch.setattr(tsio, 'SUPPRESSED_SIZE', 1)
+    tsh.update(engine, ts, 'noisy-bis', 'test')
+    tsh.update_metadata(engine, 'noisy-bis', {'supervision_atol': 1e-6})
+    tsh.update(engine, ts + 1e-9, 'noisy-bis', 'test')
+    assert tsh.suppressed == {'noisy-bis': 5}
+
+    ts, marker = tsh.get_ts_marker(engine, 'noisy')
+    assert_df("""
+2020-01-01    1.0
+2020-01-02    1.0
+2020-01-03    3.0
+2020-01-04    1.0
+2020-01-05    2.0
+""", ts)
+    assert_df("""
+2020-01-01    False
+2020-01-02    False
+2020-01-03     True
+2020-01-04    False
+2020-01-05    False
+""", marker)
+
+    # a manual edit within tolerance is not an override
+    tsh.update(
+        engine,
+        genserie(datetime(2020, 1, 4), 'D', 1, [1. + 1e-9]),
+        'noisy', 'test', manual=True
+    )
+    assert_df("""
+2020-01-03    3.0
+""", tsh.get_overrides(engine, 'noisy'))
+    _, marker = tsh.get_ts_marker(engine, 'noisy')
+    assert marker.sum() == 1
+
+
+def test_concurrent_writers(engine, tsh):
+    def write(name, idx, manual):
+        ts = genserie(datetime(2020, 1, 1 + idx), 'D', 1, [-idx if manual else idx])
+        tsh.update(engine, ts, name, 'test', manual=manual)
+
+    args = [
+        (name, idx, idx % 3 == 0)
+        for name in ('concurrent-1', 'concurrent-2')
+        for idx in range(1, 21)
+    ]
+    threadpool(8)(write, args)
+
+    for name in ('concurrent-1', 'concurrent-2'):
+        assert tsh.supervision_status(engine, name) == 'supervised'
+        ts, markers = tsh.get_ts_marker(engine, name)
+        assert len(ts) == 20
+        # the manual points are all marked, the upstream ones are not
+        assert (markers == (ts < 0)).all()
+        overrides = tsh.get_overrides(engine, name)
+        assert (overrides < 0).all()
+        upstream = tsh.upstream.get(engine, name)
+        assert (upstream[~markers[upstream.index]] > 0).all()
+
+
+def test_export_supervision(engine, tsh, tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    from click.testing import CliRunner
+    from tshistory_supervision.cli import export_supervision
+
+    ts = genserie(datetime(2021, 1, 1), 'D', 5)
+    tsh.update(engine, ts, 'export-me', 'test',
+               insertion_date=utcdt(2100, 1, 1))
+    tsh.update(engine, genserie(datetime(2021, 1, 2), 'D', 1, [42]),
+               'export-me', 'test', manual=True,
+               insertion_date=utcdt(2100, 1, 2))
+
+    tsh.update(engine, pd.Series(['a', 'b'], index=ts.index[:2]),
+               'export-me-not', 'test',
+               insertion_date=utcdt(2100, 1, 3))
+
+    r = CliRunner().invoke(
+        export_supervision,
+        [str(engine.url), str(tmp_path), '--rowgroup', '2', '--workers', '2',
+         '--chunk', '2D', '--since', '2100-01-01T12:00:00']
+    )
+    assert r.exit_code == 0, r.output
+    report = r.output.strip().split('\n')
+    assert report[-3:] == [
+        'rows 5', 'skipped (not float) 1', '  export-me-not'
+    ]
+    assert report[-4].endswith('supervised 1')
+
+    table = pq.read_table(tmp_path / 'supervised' / 'export-me.parquet')
+    assert table.num_rows == 5
+    assert table.column('manual_flag').to_pylist() == [
+        False, True, False, False, False
+    ]
+    assert table.column('value').to_pylist() == [0, 42, 2, 3, 4]
+    assert set(table.column('supervision_status').to_pylist()) == {'supervised'}
+    # incremental: older series were left aside
+    assert [p.name for p in tmp_path.iterdir()] == ['supervised']
+    assert len(list((tmp_path / 'supervised').iterdir())) == 1
+
+    # a status change moves the file to its new partition
+    lake = tmp_path / 'lake'
+    tsh.update(engine, ts, 'export-moved', 'test',
+               insertion_date=utcdt(2100, 2, 1))
+
+    def export():
+        r = CliRunner().invoke(
+            export_supervision,
+            [str(engine.url), str(lake), '--workers', '1',
+             '--since', '2100-01-31T00:00:00']
+        )
+        assert r.exit_code == 0, r.output
+
+    export()
+    assert (lake / 'unsupervised' / 'export-moved.parquet').exists()
+    tsh.update(engine, ts[:1] * 10, 'export-moved', 'test', manual=True,
+               insertion_date=utcdt(2100, 2, 2))
+    export()
+    assert (lake / 'supervised' / 'export-moved.parquet').exists()
+    assert not (lake / 'unsupervised' / 'export-moved.parquet').exists()
+
+
+def test_strip_supervision_cli(engine, tsh):
+    from click.testing import CliRunner
+    from tshistory_supervision.cli import strip_supervision
+
+    ts = genserie(datetime(2021, 1, 1), 'D', 3)
+    for day in (1, 2, 3):
+        tsh.update(engine, ts + day, 'bulk-strip', 'test',
+                   insertion_date=utcdt(2021, 1, day))
+    tsh.update(engine, genserie(datetime(2021, 1, 2), 'D', 1, [42]),
+               'bulk-strip', 'test', manual=True,
+               insertion_date=utcdt(2021, 1, 4))
+
+    # nothing to strip without an explicit selection
+    r = CliRunner().invoke(
+        strip_supervision,
+        [str(engine.url), '2021-01-02T00:00:00']
+    )
+    assert r.exit_code == 2
+    assert len(tsh.insertion_dates(engine, 'bulk-strip')) == 4
+
+    r = CliRunner().invoke(
+        strip_supervision,
+        [str(engine.url), '2021-01-02T00:00:00', '--name', 'bulk-strip',
+         '--dry-run']
+    )
+    assert r.exit_code == 0, r.output
+    assert r.output.split('\n')[:2] == [
+        'bulk-strip: 3 edited, 1 upstream revisions from 2021-01-02 00:00:00+00:00',
+        'would strip 1 series'
+    ]
+    assert len(tsh.insertion_dates(engine, 'bulk-strip')) == 4
+
+    r = CliRunner().invoke(
+        strip_supervision,
+        [str(engine.url), '2021-01-02T00:00:00', '--name', 'bulk-strip']
+    )
+    assert r.exit_code == 0, r.output
+    assert 'stripped 1 series' in r.output
+    assert tsh.insertion_dates(engine, 'bulk-strip') == [utcdt(2021, 1, 1)]
+    assert tsh.supervision_status(engine, 'bulk-strip') == 'unsupervised'
+    assert not tsh.upstream.exists(engine, 'bulk-strip')
+
+
+def test_supervision_report_cli(engine, tsh, tmp_path):
+    from click.testing import CliRunner
+    from tshistory_supervision.cli import supervision_report
+
+    ts = genserie(datetime(2021, 1, 1), 'D', 3)
+    tsh.update(engine, ts, 'report-me', 'test')
+    tsh.update(engine, ts[1:] * 2, 'report-me', 'test', manual=True)
+
+    r = CliRunner().invoke(
+        supervision_report,
+        [str(engine.url), '--name', 'report-me', '--points']
+    )
+    assert r.exit_code == 0, r.output
+    assert '1 series: 1 supervised' in r.output
+
+    out = tmp_path / 'report.csv'
+    r = CliRunner().invoke(
+        supervision_report,
+        [str(engine.url), '--output', str(out)]
+    )
+    assert r.exit_code == 0, r.output
+    report = pd.read_csv(out, index_col='name')
+    assert report.loc['report-me'].to_dict() == {
+        'status': 'supervised',
+        'edited_revisions': 2,
+        'upstream_revisions': 1,
+        'manual_changesets': 1,
+        'last_manual_edit': report.loc['report-me', 'last_manual_edit']
+    }
+
+
+def test_bench_writers(engine, tsh):
+    from click.testing import CliRunner
+    from tshistory_supervision.cli import bench_writers
+    from tshistory_supervision.bench import writebench
+
+    total, elapsed, broken = writebench(
+        engine, tsh, threads=4, series=2, writes=6, prefix='writebench'
+    )
+    assert total == 12
+    assert elapsed > 0
+    assert broken == []
+    # cleaned up
+    assert not tsh.exists(engine, 'writebench-0')
+
+    r = CliRunner().invoke(
+        bench_writers,
+        [str(engine.url), '--threads', '1', '--threads', '4',
+         '--series', '1', '--writes', '6']
+    )
+    assert r.exit_code == 0, r.output
+    lines = r.output.splitlines()
+    assert lines[0].split() == [
+        'writes', 'seconds', 'writes/s', 'broken', 'speedup'
+    ]
+    assert lines[1].split() == ['threads']
+    assert [line.split()[0] for line in lines[2:]] == ['1', '4']
+
+
+
+def test_bench_formats(engine, tsh):
+    from click.testing import CliRunner
+    from tshistory_supervision.cli import bench_formats
+    from tshistory_supervision.bench import format_report, formatbench, serve
+
+    ts = genserie(datetime(2021, 1, 1), 'h', 24 * 30)
+    tsh.update(engine, ts, 'formats-a', 'test',
+               insertion_date=utcdt(2021, 1, 1))
+    tsh.update(engine, ts[:3] * 2, 'formats-a', 'test', manual=True,
+               insertion_date=utcdt(2021, 1, 2))
+
+    server, uri = serve(str(engine.url))
+    try:
+        samples = formatbench(
+            uri, ['formats-a'],
+            formats=['json', 'json+gzip', 'tshpack'],
+            repeat=2
+        )
+    finally:
+        server.terminate()
+    assert len(samples) == 6
+    assert (samples.status == 200).all()
+    report = format_report(samples)
+    assert list(report.index) == ['json', 'json+gzip', 'tshpack']
+    assert report.loc['json+gzip', 'encoding'] == 'gzip'
+    assert report.loc['json', 'ratio'] == 1
+    assert report.loc['json+gzip', 'ratio'] < .2
+    # same payload, other bytes
+    assert report.loc['json+gzip', 'decoded'] == report.loc['json', 'bytes']
+
+    r = CliRunner().invoke(
+        bench_formats,
+        [str(engine.url), '--prefix', 'formats-', '--repeat', '1',
+         '--format', 'json', '--format', 'json+zstd', '--format', 'tshpack']
+    )
+    assert r.exit_code == 0, r.output
+    lines = r.output.splitlines()
+    assert lines[0].split() == [
+        'encoding', 'errors', 'bytes', 'ratio', 'decoded', 'p50', 'p90'
+    ]
+    assert [line.split()[0] for line in lines[2:]] == [
+        'json', 'json+zstd', 'tshpack'
+    ]
+
+def test_populate(engine, tsh):
+    from click.testing import CliRunner
+    from tshistory_supervision.cli import populate_supervision
+    from tshistory_supervision.bench import populate
+
+    catalog = populate(
+        engine, tsh,
+        count=6, length=48, revisions=4, density=.1, prefix='populate-a'
+    )
+    assert len(catalog) == 6
+    for name, status in catalog.items():
+        assert tsh.supervision_status(engine, name) == status
+        assert len(tsh.get(engine, name)) == 48
+
+    supervised = [
+        name for name, status in catalog.items()
+        if status == 'supervised'
+    ]
+    assert supervised
+    for name in supervised:
+        assert len(tsh.insertion_dates(engine, name)) == 8
+        assert len(tsh.upstream.insertion_dates(engine, name)) == 4
+        assert len(tsh.get_overrides(engine, name))
+
+    # deterministic
+    r = CliRunner().invoke(
+        populate_supervision,
+        [str(engine.url), '--count', '6', '--length', '48',
+         '--revisions', '4', '--density', '.1', '--prefix', 'populate-b']
+    )
+    assert r.exit_code == 0, r.output
+    for idx in range(6):
+        a, b = f'populate-a-{idx}', f'populate-b-{idx}'
+        assert tsh.supervision_status(engine, b) == catalog[a]
+        assert tsh.get(engine, a).equals(tsh.get(engine, b).rename(a))
+
+
+def test_load_supervision(engine, tsh, tmp_path):
+    from click.testing import CliRunner
+    from tshistory_supervision.cli import load_supervision
+
+    ts = genserie(datetime(2021, 1, 1), 'D', 30)
+    for name in ('load-a', 'load-b'):
+        tsh.update(engine, ts, name, 'test',
+                   insertion_date=utcdt(2021, 1, 1))
+        tsh.update(engine, ts[:3] * 2, name, 'test', manual=True,
+                   insertion_date=utcdt(2021, 1, 2))
+
+    out = tmp_path / 'report.json'
+    r = CliRunner().invoke(
+        load_supervision,
+        [str(engine.url), '--prefix', 'load-', '--requests', '40',
+         '--clients', '4', '--output', str(out)]
+    )
+    assert r.exit_code == 0, r.output
+    report = json.loads(out.read_text())
+    assert set(report) == {
+        'all', 'json', 'tshpack', 'inferred_freq', 'tzone', 'revision'
+    }
+    assert report['all']['count'] == 40
+    assert report['all']['errors'] == 0
+    assert report['all']['p50'] <= report['all']['p99']
+
+    r = CliRunner().invoke(
+        load_supervision,
+        [str(engine.url), '--prefix', 'load-', '--requests', '10',
+         '--mix', 'tshpack=1', '--baseline', str(out)]
+    )
+    assert r.exit_code == 0, r.output
+    assert 'changes vs baseline' in r.output
+
+    # forked server processes
+    r = CliRunner().invoke(
+        load_supervision,
+        [str(engine.url), '--prefix', 'load-', '--requests', '20',
+         '--clients', '4', '--workers', '2', '--output', str(out)]
+    )
+    assert r.exit_code == 0, r.output
+    report = json.loads(out.read_text())
+    assert report['all']['count'] == 20
+    assert report['all']['errors'] == 0
+
+
+def test_profile_supervision(engine, tsh, tmp_path, monkeypatch):
+    import pstats
+    from click.testing import CliRunner
+    from tshistory_supervision.cli import profile_supervision
+
+    ts = genserie(datetime(2021, 1, 1), 'D', 30)
+    tsh.update(engine, ts, 'profile-me', 'test',
+               insertion_date=utcdt(2021, 1, 1))
+    tsh.update(engine, ts[:3] * 2, 'profile-me', 'test', manual=True,
+               insertion_date=utcdt(2021, 1, 2))
+
+    out = tmp_path / 'profile.pstats'
+    r = CliRunner().invoke(
+        profile_supervision,
+        [str(engine.url), 'profile-me', '--output', str(out)]
+    )
+    assert r.exit_code == 0, r.output
+    assert 'profile-me: 30 points (supervised)' in r.output
+    for phase in ('edited', 'get_overrides', 'update', 'encode tshpack'):
+        assert phase in r.output
+    assert pstats.Stats(str(out)).total_calls
+
+    # the updates were rolled back
+    assert len(tsh.insertion_dates(engine, 'profile-me')) == 2
+
+    # nothing to read
+    monkeypatch.setattr(
+        tsio.timeseries, 'get_ts_marker',
+        lambda self, cn, name, **kw: (None, None)
+    )
+    r = CliRunner().invoke(
+        profile_supervision, [str(engine.url), 'profile-me']
+    )
+    assert r.exit_code == 0, r.output
+    assert 'profile-me: no points (supervised)' in r.output
+    assert 'encode json' in r.output
+    assert 'encode tshpack' not in r.output
+    monkeypatch.undo()
+
+    r = CliRunner().invoke(
+        profile_supervision, [str(engine.url), 'no-such-series']
+    )
+    assert r.exit_code == 2
+
+
+def test_windowed_storage(engine, tsh, monkeypatch):
+    from tshistory.storage import Postgres
+
+    series = pd.Series(
+        np.arange(3000, dtype='float64'),
+        index=pd.date_range(pd.Timestamp('2000-1-1'), freq='D', periods=3000)
+    )
+    # several buckets, then a revision touching the middle
+    tsh.update(engine, series, 'windowed', 'test')
+    tsh.update(engine, series[1000:1010] * 2, 'windowed', 'test')
+    tsh.update(engine, series[-10:] + 1, 'windowed', 'test')
+
+    payloads = []
+
+    def chunks_to_ts(self, chunks):
+        chunks = list(chunks)
+        payloads.append(len(chunks))
+        return Postgres._chunks_to_ts(self, chunks)
+
+    monkeypatch.setattr(
+        tsio.windowedstorage, '_chunks_to_ts', chunks_to_ts
+    )
+
+    with engine.begin() as cn:
+        _set_cache(cn)
+        windowed = tsio.windowedstorage(cn, tsh, 'windowed')
+        base = Postgres(cn, tsh, 'windowed')
+        _, head = windowed.cset_heads_query().limit(1).do(cn).fetchone()
+
+        def assert_same(fromdate, todate):
+            pd.testing.assert_series_equal(
+                windowed.chunk(head, fromdate, todate),
+                base.chunk(head, fromdate, todate)
+            )
+
+        assert_same(None, None)
+        assert_same(pd.Timestamp('2000-1-1'), pd.Timestamp('2000-3-1'))
+        assert_same(None, pd.Timestamp('2002-10-1'))
+        assert_same(pd.Timestamp('2002-9-1'), pd.Timestamp('2002-11-1'))
+        assert_same(pd.Timestamp('2030-1-1'), pd.Timestamp('2031-1-1'))
+
+        payloads.clear()
+        windowed.chunk(head, None, None)
+        allpayloads = payloads[-1]
+
+        # the start of the series only needs its first bucket
+        payloads.clear()
+        windowed.chunk(head, pd.Timestamp('2000-1-1'), pd.Timestamp('2000-3-1'))
+        assert payloads == [1]
+        assert allpayloads > 10
+
+        # nothing overlaps: no payload at all
+        payloads.clear()
+        empty = windowed.chunk(
+            head, pd.Timestamp('1990-1-1'), pd.Timestamp('1991-1-1')
+        )
+        assert payloads == []
+        assert len(empty) == 0
+        assert empty.dtype == 'float64'
+
+
+def test_chunked_ts_marker(engine, tsh):
+    import tracemalloc
+
+    n = 100_000
+    series = pd.Series(
+        np.arange(n, dtype='float64'),
+        index=pd.date_range(pd.Timestamp('2000-1-1'), freq='h', periods=n)
+    )
+    tsh.update(engine, series, 'chunked', 'test',
+               insertion_date=utcdt(2021, 1, 1))
+    tsh.update(engine, series[::97] * 2, 'chunked', 'test', manual=True,
+               insertion_date=utcdt(2021, 1, 2))
+    erased = series[5::1000] * np.nan
+    tsh.update(engine, erased, 'chunked', 'test', manual=True,
+               insertion_date=utcdt(2021, 1, 3))
+    tsh.update(engine, series[::101] + 1, 'chunked', 'test',
+               insertion_date=utcdt(2021, 1, 4))
+    tsh.update(engine, series[:1000], 'chunked-unsupervised', 'test')
+
+    def assert_same(name, **kw):
+        with engine.begin() as cn:
+            full = tsh.get_ts_marker(cn, name, **kw)
+            chunked = tsh.get_ts_marker(cn, name, chunk='100D', **kw)
+        pd.testing.assert_series_equal(full[0], chunked[0])
+        pd.testing.assert_series_equal(full[1], chunked[1])
+
+    assert_same('chunked')
+    assert_same('chunked', provenance=True, _keep_nans=True)
+    assert_same('chunked', revision_date=utcdt(2021, 1, 2))
+    assert_same(
+        'chunked',
+        from_value_date=pd.Timestamp('2001-3-1 12:00'),
+        to_value_date=pd.Timestamp('2005-1-1')
+    )
+    assert_same('chunked-unsupervised')
+    assert_same('chunked-unsupervised',
+                from_value_date=pd.Timestamp('2010-1-1'))
+
+    with pytest.raises(ValueError):
+        tsh.get_ts_marker(engine, 'chunked', chunk='100D', inferred_freq=True)
+
+    def peak(func):
+        with engine.begin() as cn:
+            tracemalloc.start()
+            try:
+                func(cn)
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+    def iterate(cn):
+        for _ in tsh.iter_ts_marker(cn, 'chunked', '100D'):
+            pass
+
+    fullpeak = peak(lambda cn: tsh.get_ts_marker(cn, 'chunked'))
+    chunkpeak = peak(iterate)
+    # 100 days of hourly points, as index + values
+    chunkbytes = 100 * 24 * 16
+    assert chunkpeak < 40 * chunkbytes
+    assert chunkpeak * 5 < fullpeak
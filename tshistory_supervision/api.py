@@ -1,28 +1,147 @@
-from typing import Optional, Tuple
+from collections import OrderedDict
+import contextvars
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
+from sqlalchemy import create_engine
 
-from tshistory.util import extend
+from tshistory.util import (
+    diff,
+    ensuretz,
+    extend,
+    threadpool
+)
 from tshistory.api import (
     altsources,
     mainsource
 )
 
 
+# federated routing cache: (sources, name) -> (expiry, source index)
+# with negative (None) entries for the names found nowhere
+ROUTING_TTL = 60
+ROUTING_SIZE = 10_000
+_ROUTES = OrderedDict()
+_ROUTESLOCK = threading.Lock()
+
+
+def findsource(sources, name):
+    """Find the first secondary source having a given series.
+
+    The sources are probed concurrently and the answer is cached
+    for `ROUTING_TTL` seconds.
+    """
+    key = (tuple((s.uri, s.namespace) for s in sources), name)
+    now = time.monotonic()
+    with _ROUTESLOCK:
+        route = _ROUTES.get(key)
+        if route is not None and route[0] > now:
+            _ROUTES.move_to_end(key)
+            idx = route[1]
+            return None if idx is None else sources[idx]
+
+    found = [False] * len(sources)
+    errors = []
+
+    def probe(idx, source):
+        try:
+            found[idx] = source.tsa.exists(name)
+        except Exception as err:
+            errors.append(err)
+            print(f'findsource: source {source} currently unavailable (cause: {err})')
+
+    if len(sources) > 1:
+        pool = threadpool(len(sources))
+        pool(
+            lambda ctx, idx, source: ctx.run(probe, idx, source),
+            [
+                (contextvars.copy_context(), idx, source)
+                for idx, source in enumerate(sources)
+            ]
+        )
+    elif sources:
+        probe(0, sources[0])
+
+    # the sources order gives the precedence
+    idx = next((idx for idx, exists in enumerate(found) if exists), None)
+    if idx is None and errors:
+        # not a reliable negative answer
+        return None
+
+    with _ROUTESLOCK:
+        _ROUTES[key] = (now + ROUTING_TTL, idx)
+        _ROUTES.move_to_end(key)
+        while len(_ROUTES) > ROUTING_SIZE:
+            _ROUTES.popitem(last=False)
+    return None if idx is None else sources[idx]
+
+
+def readengine(tsa, name=None):
+    """Engine to use for a read-only supervision query.
+
+    This is the read replica when one is set, unless the series (or
+    any series when no name is given) has just been written through
+    this api: such reads are pinned to the primary to see their
+    writes despite the replication lag.
+    """
+    replica = tsa.tsh.replica
+    if replica is None or tsa.tsh.recently_written(name):
+        return tsa.engine
+    return replica
+
+
+@extend(mainsource)
+def set_read_replica(self, uri: Optional[str]) -> None:
+    """
+    Route the read-only supervision queries (`edited`, `edited_frame`,
+    `overrides_many`, `supervision_stats`, `supervision_status` and
+    the http GET) to a read-only database (e.g. a streaming replica)
+    given by its `uri`, whose sessions are made read-only. The series
+    written through this api (by this process) are read from the
+    primary for a few seconds after the commit.
+
+    Use `None` to read from the primary again.
+
+    """
+    previous = self.tsh.replica
+    self.tsh.replica = None if uri is None else create_engine(
+        uri,
+        connect_args={'options': '-c default_transaction_read_only=on'}
+    )
+    if previous is not None:
+        previous.dispose()
+
+
 @extend(mainsource)
 def edited(self, name: str,
            revision_date: Optional[pd.Timestamp]=None,
            from_value_date: Optional[pd.Timestamp]=None,
            to_value_date: Optional[pd.Timestamp]=None,
            inferred_freq: Optional[bool]=False,
+           max_points: Optional[int]=None,
+           resample: Optional[str]=None,
+           provenance: bool=False,
            _keep_nans: bool=False) -> Tuple[pd.Series, pd.Series]:
     """
     Returns the base series and a second boolean series whose entries
     indicate if an override has been made or not.
 
+    With `provenance`, the second series rather holds int8 codes
+    telling where each point comes from: upstream (0), manual (1),
+    inferred-freq filling (2) or erasure (3).
+
+    The series can be downsampled (for display purposes) to the min
+    and max points of buckets of the `resample` frequency (e.g. `1D`)
+    and/or to about `max_points` points. The overridden points are
+    always kept.
+
     """
-    with self.engine.begin() as cn:
-        if self.tsh.exists(cn, name):
+    with readengine(self, name).begin() as cn:
+        meta = self.tsh.series_meta(cn, name)
+        if meta is not None:
             return self.tsh.get_ts_marker(
                 cn,
                 name,
@@ -30,7 +149,11 @@ def edited(self, name: str,
                 from_value_date=from_value_date,
                 to_value_date=to_value_date,
                 inferred_freq=inferred_freq,
-                _keep_nans=_keep_nans
+                provenance=provenance,
+                max_points=max_points,
+                resample=resample,
+                _keep_nans=_keep_nans,
+                _meta=meta
             )
 
     return self.othersources.edited(
@@ -39,6 +162,9 @@ def edited(self, name: str,
         from_value_date,
         to_value_date,
         inferred_freq=inferred_freq,
+        max_points=max_points,
+        resample=resample,
+        provenance=provenance,
         _keep_nans=_keep_nans
     )
 
@@ -50,9 +176,12 @@ def edited(self,  # noqa: F811
            from_value_date=None,
            to_value_date=None,
            inferred_freq=False,
+           max_points=None,
+           resample=None,
+           provenance=False,
            _keep_nans=False):
 
-    source = self._findsourcefor(name)
+    source = findsource(self.sources, name)
     if source is None:
         return
     return source.tsa.edited(
@@ -61,8 +190,251 @@ def edited(self,  # noqa: F811
         from_value_date,
         to_value_date,
         inferred_freq,
-        _keep_nans
+        max_points=max_points,
+        resample=resample,
+        provenance=provenance,
+        _keep_nans=_keep_nans
+    )
+
+
+@extend(mainsource)
+def edited_frame(self, names: List[str],
+                 revision_date: Optional[pd.Timestamp]=None,
+                 from_value_date: Optional[pd.Timestamp]=None,
+                 to_value_date: Optional[pd.Timestamp]=None
+                 ) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Returns the values and the (boolean) markers of many numeric
+    series as two dataframes (one column per series) sharing the
+    union index of the series.
+
+    """
+    # tsio imports us
+    from tshistory_supervision.tsio import aligned_frames
+
+    parts = {}
+    engine = (
+        self.engine if any(self.tsh.recently_written(n) for n in names)
+        else readengine(self)
     )
+    with engine.begin() as cn:
+        for name in names:
+            if self.tsh.exists(cn, name):
+                parts[name] = self.tsh.get_ts_marker(
+                    cn,
+                    name,
+                    revision_date=revision_date,
+                    from_value_date=from_value_date,
+                    to_value_date=to_value_date
+                )
+
+    for name in names:
+        if name not in parts:
+            parts[name] = self.othersources.edited(
+                name,
+                revision_date,
+                from_value_date,
+                to_value_date
+            ) or (None, None)
+
+    return aligned_frames(names, parts)
+
+
+@extend(mainsource)
+def update_manual_many(self,
+                       serieslist: Dict[str, pd.Series],
+                       author: str,
+                       insertion_date: Optional[pd.Timestamp]=None,
+                       dryrun: bool=False,
+                       batchsize: int=100) -> Dict[str, Optional[pd.Series]]:
+    """
+    Apply manual edits to many series at once, by batches of
+    `batchsize` series per transaction.
+
+    Returns a mapping from series names to the diff of their
+    edition. With `dryrun` nothing is written and the diffs are those
+    the edits would produce.
+
+    """
+    insertion_date = ensuretz(insertion_date)
+    for name in serieslist:
+        if not self.tsh.exists(self.engine, name):
+            # give a chance to say *no*
+            self.othersources.forbidden(
+                name,
+                'not allowed to update to a secondary source'
+            )
+
+    # the series locks are taken in the names order
+    names = sorted(serieslist)
+    diffs = {}
+    for start in range(0, len(names), batchsize):
+        batch = {
+            name: serieslist[name]
+            for name in names[start:start + batchsize]
+        }
+        with self.engine.begin() as cn:
+            diffs.update(
+                self.tsh.update_manual_many(
+                    cn, batch, author,
+                    insertion_date=insertion_date,
+                    dryrun=dryrun
+                )
+            )
+    return diffs
+
+
+@extend(mainsource)
+def revert_overrides(self, name: str,
+                     author: str,
+                     from_value_date: Optional[pd.Timestamp]=None,
+                     to_value_date: Optional[pd.Timestamp]=None,
+                     insertion_date: Optional[pd.Timestamp]=None) -> Optional[pd.Series]:
+    """
+    Drop the manual overrides of a series (possibly restricted to a
+    value dates range) by putting back the upstream values.
+
+    This happens in one new revision, and the written points are
+    returned.
+
+    """
+    return self.revert_overrides_many(
+        [name], author,
+        from_value_date=from_value_date,
+        to_value_date=to_value_date,
+        insertion_date=insertion_date
+    ).get(name)
+
+
+@extend(mainsource)
+def revert_overrides_many(self, names: List[str],
+                          author: str,
+                          from_value_date: Optional[pd.Timestamp]=None,
+                          to_value_date: Optional[pd.Timestamp]=None,
+                          insertion_date: Optional[pd.Timestamp]=None) -> Dict[str, pd.Series]:
+    """
+    Like `revert_overrides` for many series in a single transaction.
+
+    """
+    insertion_date = ensuretz(insertion_date)
+    for name in names:
+        if not self.tsh.exists(self.engine, name):
+            # give a chance to say *no*
+            self.othersources.forbidden(
+                name,
+                'not allowed to update to a secondary source'
+            )
+
+    with self.engine.begin() as cn:
+        # the series locks are taken in the names order: concurrent
+        # bulk reverts cannot deadlock
+        return {
+            name: self.tsh.revert_overrides(
+                cn, name, author,
+                from_value_date=from_value_date,
+                to_value_date=to_value_date,
+                insertion_date=insertion_date
+            )
+            for name in sorted(names)
+            if self.tsh.exists(cn, name)
+        }
+
+
+@extend(mainsource)
+def overrides_many(self,
+                   names: Optional[List[str]]=None,
+                   from_value_date: Optional[pd.Timestamp]=None,
+                   to_value_date: Optional[pd.Timestamp]=None,
+                   revision_date: Optional[pd.Timestamp]=None,
+                   maxthreads: int=8) -> pd.DataFrame:
+    """
+    Returns all the manual overrides of the supervised series (all of
+    them or those among `names`) as a long-form dataframe with
+    `name`, `value_date` (utc) and `value` columns.
+
+    The series are read in parallel, using up to `maxthreads`
+    connections of the engine pool.
+
+    """
+    engine = readengine(self)
+    with engine.begin() as cn:
+        names = self.tsh.supervised_series(cn, names)
+
+    overrides = {}
+    errors = []
+
+    def getoverrides(name):
+        try:
+            with engine.begin() as cn:
+                overrides[name] = self.tsh.get_overrides(
+                    cn, name,
+                    revision_date=revision_date,
+                    from_value_date=from_value_date,
+                    to_value_date=to_value_date
+                )
+        except Exception as err:
+            # the pool threads swallow their exceptions
+            errors.append(err)
+
+    if names:
+        pool = threadpool(min(maxthreads, len(names)))
+        # the threads see the context of the caller (e.g. the
+        # request timings of the http server)
+        pool(
+            lambda ctx, name: ctx.run(getoverrides, name),
+            [(contextvars.copy_context(), name) for name in names]
+        )
+    if errors:
+        raise errors[0]
+
+    frames = []
+    for name in names:
+        manual = overrides[name]
+        if not len(manual):
+            continue
+        index = manual.index
+        # naive series are utc by convention
+        index = (
+            index.tz_localize('UTC') if index.tz is None
+            else index.tz_convert('UTC')
+        )
+        frames.append(
+            pd.DataFrame({
+                'name': name,
+                'value_date': index,
+                'value': manual.values
+            })
+        )
+    if not frames:
+        return pd.DataFrame(columns=['name', 'value_date', 'value'])
+    return pd.concat(frames, ignore_index=True)
+
+
+@extend(mainsource)
+def supervision_stats(self,
+                      names: Optional[List[str]]=None,
+                      points: bool=False) -> pd.DataFrame:
+    """
+    Returns a dataframe indexed by series name with the supervision
+    figures of the series (all of them or those among `names`):
+    `status`, `edited_revisions`, `upstream_revisions`,
+    `manual_changesets` and `last_manual_edit`.
+
+    With `points`, an `overridden_points` column is added (this is
+    much more costly).
+
+    """
+    with readengine(self).begin() as cn:
+        stats = self.tsh.supervision_stats(cn, names, points=points)
+    columns = [
+        'status', 'edited_revisions', 'upstream_revisions',
+        'manual_changesets', 'last_manual_edit'
+    ]
+    if points:
+        columns.append('overridden_points')
+    return pd.DataFrame.from_dict(
+        stats, orient='index', columns=columns
+    ).rename_axis('name')
 
 
 @extend(mainsource)
@@ -71,7 +443,7 @@ def supervision_status(self, name: str) -> str:
     Returns the supervision status of a series.
     Possible values are `unsupervised`, `handcrafted` and `supervised`.
     """
-    with self.engine.begin() as cn:
+    with readengine(self, name).begin() as cn:
         if self.tsh.exists(cn, name):
             return self.tsh.supervision_status(
                 cn,
@@ -83,7 +455,423 @@ def supervision_status(self, name: str) -> str:
 
 @extend(altsources)
 def supervision_status(self, name):  # noqa: F811
-    source = self._findsourcefor(name)
+    source = findsource(self.sources, name)
     if source is None:
         return
     return source.tsa.supervision_status(name)
+
+
+@extend(mainsource)
+def upstream(self, name: str,
+             revision_date: Optional[pd.Timestamp]=None,
+             from_value_date: Optional[pd.Timestamp]=None,
+             to_value_date: Optional[pd.Timestamp]=None) -> Optional[pd.Series]:
+    """
+    Returns the upstream (provider) values of a series, without the
+    manual overrides.
+
+    The unsupervised series are their own upstream and the
+    handcrafted series have an empty upstream.
+
+    """
+    revision_date = ensuretz(revision_date)
+    with readengine(self, name).begin() as cn:
+        meta = self.tsh.series_meta(cn, name)
+        if meta is not None:
+            return self.tsh.get_upstream(
+                cn, name,
+                revision_date=revision_date,
+                from_value_date=from_value_date,
+                to_value_date=to_value_date,
+                _meta=meta
+            )
+
+    return self.othersources.upstream(
+        name,
+        revision_date=revision_date,
+        from_value_date=from_value_date,
+        to_value_date=to_value_date
+    )
+
+
+@extend(altsources)
+def upstream(self, name,  # noqa: F811
+             revision_date=None,
+             from_value_date=None,
+             to_value_date=None):
+    source = findsource(self.sources, name)
+    if source is None:
+        return
+    return source.tsa.upstream(
+        name,
+        revision_date=revision_date,
+        from_value_date=from_value_date,
+        to_value_date=to_value_date
+    )
+
+
+@extend(mainsource)
+def upstream_insertion_dates(self, name: str,
+                             from_insertion_date: Optional[pd.Timestamp]=None,
+                             to_insertion_date: Optional[pd.Timestamp]=None,
+                             from_value_date: Optional[pd.Timestamp]=None,
+                             to_value_date: Optional[pd.Timestamp]=None
+                             ) -> Optional[List[pd.Timestamp]]:
+    """
+    Returns the insertion dates of the upstream revisions of a series.
+
+    """
+    from_insertion_date = ensuretz(from_insertion_date)
+    to_insertion_date = ensuretz(to_insertion_date)
+    with readengine(self, name).begin() as cn:
+        meta = self.tsh.series_meta(cn, name)
+        if meta is not None:
+            return self.tsh.upstream_insertion_dates(
+                cn, name,
+                from_insertion_date=from_insertion_date,
+                to_insertion_date=to_insertion_date,
+                from_value_date=from_value_date,
+                to_value_date=to_value_date,
+                _meta=meta
+            )
+
+    return self.othersources.upstream_insertion_dates(
+        name,
+        from_insertion_date=from_insertion_date,
+        to_insertion_date=to_insertion_date,
+        from_value_date=from_value_date,
+        to_value_date=to_value_date
+    )
+
+
+@extend(altsources)
+def upstream_insertion_dates(self, name,  # noqa: F811
+                             from_insertion_date=None,
+                             to_insertion_date=None,
+                             from_value_date=None,
+                             to_value_date=None):
+    source = findsource(self.sources, name)
+    if source is None:
+        return
+    return source.tsa.upstream_insertion_dates(
+        name,
+        from_insertion_date=from_insertion_date,
+        to_insertion_date=to_insertion_date,
+        from_value_date=from_value_date,
+        to_value_date=to_value_date
+    )
+
+
+@extend(mainsource)
+def upstream_history(self, name: str,
+                     from_insertion_date: Optional[pd.Timestamp]=None,
+                     to_insertion_date: Optional[pd.Timestamp]=None,
+                     from_value_date: Optional[pd.Timestamp]=None,
+                     to_value_date: Optional[pd.Timestamp]=None
+                     ) -> Optional[Dict[pd.Timestamp, pd.Series]]:
+    """
+    Returns the upstream revisions of a series as a dict from
+    insertion dates to series.
+
+    """
+    from_insertion_date = ensuretz(from_insertion_date)
+    to_insertion_date = ensuretz(to_insertion_date)
+    with readengine(self, name).begin() as cn:
+        meta = self.tsh.series_meta(cn, name)
+        if meta is not None:
+            return self.tsh.upstream_history(
+                cn, name,
+                from_insertion_date=from_insertion_date,
+                to_insertion_date=to_insertion_date,
+                from_value_date=from_value_date,
+                to_value_date=to_value_date,
+                _meta=meta
+            )
+
+    return self.othersources.upstream_history(
+        name,
+        from_insertion_date=from_insertion_date,
+        to_insertion_date=to_insertion_date,
+        from_value_date=from_value_date,
+        to_value_date=to_value_date
+    )
+
+
+@extend(altsources)
+def upstream_history(self, name,  # noqa: F811
+                     from_insertion_date=None,
+                     to_insertion_date=None,
+                     from_value_date=None,
+                     to_value_date=None):
+    source = findsource(self.sources, name)
+    if source is None:
+        return
+    return source.tsa.upstream_history(
+        name,
+        from_insertion_date=from_insertion_date,
+        to_insertion_date=to_insertion_date,
+        from_value_date=from_value_date,
+        to_value_date=to_value_date
+    )
+
+
+# max number of (series, window) entries of an edit session
+SESSION_SIZE = 100
+
+
+def _window(series, from_value_date, to_value_date):
+    index = series.index
+    mask = np.ones(len(index), dtype=bool)
+    for bound, keep in ((from_value_date, index.__ge__),
+                        (to_value_date, index.__le__)):
+        if bound is None:
+            continue
+        bound = pd.Timestamp(bound)
+        if index.tz is not None:
+            bound = ensuretz(bound)
+        elif bound.tz is not None:
+            bound = bound.tz_convert('UTC').tz_localize(None)
+        mask &= keep(bound)
+    return series[mask]
+
+
+class editsession:
+    """Read-your-writes cache of the edited series and markers, for
+    the edit -> read -> edit loops of an analyst on a few series.
+
+    The manual writes done through the session patch the cached series
+    and markers with their diff, the markers being only recomputed at
+    the changed value dates. Any other write (upstream, another
+    session) is detected by the revision ids of the series and leads
+    to a full read.
+
+    """
+    __slots__ = ('tsa', 'cache')
+
+    def __init__(self, tsa):
+        self.tsa = tsa
+        # (name, from, to) -> entry
+        self.cache = OrderedDict()
+
+    def invalidate(self, name=None):
+        for key in list(self.cache):
+            if name is None or key[0] == name:
+                del self.cache[key]
+
+    def _stamps(self, cn, name, meta):
+        # the tolerance changes the markers without a new revision
+        return (
+            self.tsa.tsh.supervision_status(cn, name, meta),
+            self.tsa.tsh.last_revisions(cn, name, _meta=meta),
+            self.tsa.tsh.tolerance(cn, name, meta)
+        )
+
+    def _load(self, cn, name, from_value_date, to_value_date, meta):
+        # tsio imports us
+        from tshistory_supervision.tsio import manual_markers
+
+        tsh = self.tsa.tsh
+        status = tsh.supervision_status(cn, name, meta)
+        edited = tsh.get(
+            cn, name,
+            from_value_date=from_value_date,
+            to_value_date=to_value_date,
+            _keep_nans=True
+        )
+        upstream = None
+        if status == 'supervised':
+            upstream = tsh.upstream.get(
+                cn, name,
+                from_value_date=from_value_date,
+                to_value_date=to_value_date,
+                _keep_nans=True
+            )
+        tolerance = tsh.tolerance(cn, name, meta)
+        return {
+            'stamps': self._stamps(cn, name, meta),
+            'tolerance': tolerance,
+            'edited': edited,
+            'upstream': upstream,
+            'markers': manual_markers(status, edited, upstream, *tolerance)
+        }
+
+    def edited(self, name: str,
+               from_value_date: Optional[pd.Timestamp]=None,
+               to_value_date: Optional[pd.Timestamp]=None,
+               max_points: Optional[int]=None,
+               resample: Optional[str]=None) -> Tuple[pd.Series, pd.Series]:
+        """
+        Same as `.edited` on the session api (without revision date
+        and inferred freq), served from the session cache when the
+        series did not change behind its back.
+
+        """
+        # tsio imports us
+        from tshistory_supervision.tsio import downsample, fill_markers
+
+        tsh = self.tsa.tsh
+        key = (name, from_value_date, to_value_date)
+        with self.tsa.engine.begin() as cn:
+            meta = tsh.series_meta(cn, name)
+            if meta is None:
+                self.invalidate(name)
+                return self.tsa.edited(
+                    name,
+                    from_value_date=from_value_date,
+                    to_value_date=to_value_date,
+                    max_points=max_points,
+                    resample=resample
+                )
+            entry = self.cache.get(key)
+            if entry is None or entry['stamps'] != self._stamps(cn, name, meta):
+                entry = self._load(
+                    cn, name, from_value_date, to_value_date, meta
+                )
+                self.cache[key] = entry
+            self.cache.move_to_end(key)
+            while len(self.cache) > SESSION_SIZE:
+                self.cache.popitem(last=False)
+
+        if entry['markers'] is None:
+            return None, None
+        series = entry['edited'].dropna()
+        markers = fill_markers(entry['markers'])
+        if max_points or resample:
+            series, markers = downsample(
+                series, markers,
+                max_points=max_points,
+                resample=resample
+            )
+        return series, markers
+
+    def _patch(self, entry, key, changes, removed):
+        # tsio imports us
+        from tshistory_supervision.tsio import manual_markers
+
+        changes = _window(changes, *key[1:])
+        removed = _window(
+            pd.Series(np.nan, index=removed), *key[1:]
+        ).index
+        if not len(changes) and not len(removed):
+            return
+
+        status = entry['stamps'][0]
+        edited = entry['edited']
+        upstream = entry['upstream']
+        markers = entry['markers']
+        touched = changes.index.union(removed)
+        edited = pd.concat([
+            edited[~edited.index.isin(touched)],
+            changes
+        ]).sort_index()
+        edited.name = key[0]
+
+        # markers at the touched value dates only
+        flags = manual_markers(status, changes, upstream, *entry['tolerance'])
+        if status == 'supervised':
+            flags = flags[flags.index.isin(changes.index)]
+            if upstream is not None:
+                # the removed points fall back to upstream, if any
+                flags = pd.concat([
+                    flags,
+                    pd.Series(
+                        False,
+                        index=removed[removed.isin(upstream.index)],
+                        dtype='object'
+                    )
+                ])
+        if markers is None:
+            markers = flags
+        else:
+            markers = pd.concat([
+                markers[~markers.index.isin(touched)],
+                flags
+            ]).sort_index()
+        markers.name = key[0]
+        entry['edited'] = edited
+        entry['markers'] = markers
+
+    def _write(self, method, name, ts, author, metadata, insertion_date):
+        tsh = self.tsa.tsh
+        if not tsh.exists(self.tsa.engine, name):
+            self.invalidate(name)
+            return getattr(self.tsa, method)(
+                name, ts, author,
+                metadata=metadata,
+                insertion_date=insertion_date,
+                manual=True
+            )
+
+        insertion_date = ensuretz(insertion_date)
+        with self.tsa.engine.begin() as cn:
+            # no concurrent writer between the freshness check and
+            # our own write
+            tsh._lock_series(cn, name)
+            meta = tsh.series_meta(cn, name)
+            stamps = self._stamps(cn, name, meta)
+            entries = [
+                (key, entry) for key, entry in self.cache.items()
+                if key[0] == name
+            ]
+            self.invalidate(name)
+            if stamps[0] == 'unsupervised':
+                # the first manual edit makes it supervised
+                entries = []
+
+            series_diff = getattr(tsh, method)(
+                cn, ts, name, author,
+                metadata=metadata,
+                insertion_date=insertion_date,
+                manual=True
+            )
+            if series_diff is None or not len(series_diff):
+                newstamps = stamps
+            else:
+                newstamps = self._stamps(cn, name, tsh.series_meta(cn, name))
+
+        for key, entry in entries:
+            if entry['stamps'] != stamps:
+                continue
+            if series_diff is not None and len(series_diff):
+                if method == 'update':
+                    changes, removed = series_diff, series_diff.index[:0]
+                else:
+                    # replace returns the whole new series
+                    current = _window(entry['edited'], *key[1:])
+                    changes = diff(current.dropna(), series_diff)
+                    removed = current.index.difference(series_diff.index)
+                self._patch(entry, key, changes, removed)
+            entry['stamps'] = newstamps
+            self.cache[key] = entry
+        return series_diff
+
+    def update(self, name: str,
+               updatets: pd.Series,
+               author: str,
+               metadata: Optional[dict]=None,
+               insertion_date: Optional[pd.Timestamp]=None) -> Optional[pd.Series]:
+        """Manual update of a series, patching the session cache."""
+        return self._write(
+            'update', name, updatets, author, metadata, insertion_date
+        )
+
+    def replace(self, name: str,
+                replacets: pd.Series,
+                author: str,
+                metadata: Optional[dict]=None,
+                insertion_date: Optional[pd.Timestamp]=None) -> Optional[pd.Series]:
+        """Manual replacement of a series, patching the session cache."""
+        return self._write(
+            'replace', name, replacets, author, metadata, insertion_date
+        )
+
+
+@extend(mainsource)
+def edit_session(self) -> editsession:
+    """
+    Returns an edit session: its `.edited` calls are served from a
+    cache patched by its own manual `.update` and `.replace` calls,
+    and fully read again when the series was written by anyone else.
+
+    """
+    return editsession(self)
@@ -0,0 +1,413 @@
+from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+import threading
+from time import perf_counter
+import zlib
+
+import numpy as np
+import pandas as pd
+import requests
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+from tshistory_supervision.tsio import timeseries
+
+
+# synthetic catalogue
+
+STATUSES = ('unsupervised', 'supervised', 'handcrafted')
+
+
+def populate(engine, tsh,
+             count=100,
+             length=1000,
+             freq='h',
+             revisions=10,
+             mix=(1, 1, 1),
+             density=.01,
+             seed=42,
+             prefix='synthetic',
+             start=pd.Timestamp('2020-1-1', tz='UTC')):
+    """Fill a database with `count` synthetic series of `length`
+    points at `freq`, each built out of `revisions` upstream
+    revisions (one per day from `start`).
+
+    The (unsupervised, supervised, handcrafted) statuses are drawn
+    according to the `mix` weights. Supervised series get manual
+    overrides of a `density` fraction of their known points after each
+    upstream revision. Handcrafted series only get manual revisions.
+
+    Everything derives from `seed`: the same call produces the same
+    catalogue. Each series is written within one transaction.
+
+    Returns a mapping from the series names to their status.
+    """
+    weights = np.array(mix, dtype='float64')
+    kinds = np.random.default_rng(seed).choice(
+        len(STATUSES), size=count, p=weights / weights.sum()
+    )
+    index = pd.date_range(start, periods=length, freq=freq)
+    step = max(length // revisions, 1)
+    catalog = {}
+    for idx, kind in enumerate(kinds):
+        name = f'{prefix}-{idx}'
+        status = STATUSES[kind]
+        catalog[name] = status
+        # per-series generator: independent from the other series
+        rng = np.random.default_rng([seed, idx])
+        values = rng.normal(size=length).cumsum() + 100
+        with engine.begin() as cn:
+            for rev in range(revisions):
+                end = length if rev == revisions - 1 else (rev + 1) * step
+                begin = max(end - 2 * step, 0)
+                # the previous chunk gets revised a bit
+                chunk = values[begin:end] + rng.normal(
+                    scale=.01, size=end - begin
+                )
+                idate = start + pd.Timedelta(days=rev)
+                tsh.update(
+                    cn,
+                    pd.Series(chunk, index=index[begin:end]),
+                    name,
+                    'populate',
+                    insertion_date=idate,
+                    manual=status == 'handcrafted'
+                )
+                if status != 'supervised':
+                    continue
+
+                size = int(density * end)
+                if not size:
+                    continue
+                positions = np.sort(
+                    rng.choice(end, size=size, replace=False)
+                )
+                tsh.update(
+                    cn,
+                    pd.Series(
+                        values[positions] + rng.normal(scale=10, size=size),
+                        index=index[positions]
+                    ),
+                    name,
+                    'populate',
+                    insertion_date=idate + pd.Timedelta(hours=1),
+                    manual=True
+                )
+    return catalog
+
+
+# concurrent writers
+
+def branches_hold(engine, tsh, name, manual):
+    """Tell if a series written by `writebench` is consistent: the
+    `manual` (negative) points are all marked and are the overrides,
+    the upstream branch holds none of them.
+    """
+    if tsh.supervision_status(engine, name) != 'supervised':
+        return False
+    series, markers = tsh.get_ts_marker(engine, name)
+    overrides = tsh.get_overrides(engine, name)
+    upstream = tsh.upstream.get(engine, name)
+    return bool(
+        (markers == (series < 0)).all()
+        and (overrides < 0).all()
+        and len(overrides) == manual
+        and (upstream >= 0).all()
+    )
+
+
+def writebench(engine, tsh, threads=8, series=16, writes=20,
+               prefix='bench-writers'):
+    """Write `writes` one point revisions into each of `series` series
+    from `threads` concurrent writers, every third one being manual.
+    Each write is a transaction of its own.
+
+    The series are created beforehand (out of the measure) and
+    deleted afterwards.
+
+    Returns the number of writes, the elapsed time and the names of
+    the series whose branches do not hold (see `branches_hold`).
+    """
+    names = [f'{prefix}-{idx}' for idx in range(series)]
+    start = pd.Timestamp('2020-1-1')
+    for name in names:
+        tsh.update(engine, pd.Series([0.], index=[start]), name, 'bench')
+
+    def write(name, idx):
+        manual = idx % 3 == 0
+        tsh.update(
+            engine,
+            pd.Series(
+                [float(-idx if manual else idx)],
+                index=[start + pd.Timedelta(days=idx)]
+            ),
+            name,
+            'bench',
+            manual=manual
+        )
+
+    # interleaved: the writers of a series run concurrently
+    plan = [
+        (name, idx)
+        for idx in range(1, writes + 1)
+        for name in names
+    ]
+    t0 = perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(lambda args: write(*args), plan))
+    elapsed = perf_counter() - t0
+
+    try:
+        broken = [
+            name for name in names
+            if not branches_hold(engine, tsh, name, writes // 3)
+        ]
+    finally:
+        for name in names:
+            tsh.delete(engine, name)
+    return len(plan), elapsed, broken
+
+
+# http load testing
+
+# query kind -> /series/supervision parameters
+LOADQUERIES = {
+    'json': {'format': 'json'},
+    'tshpack': {'format': 'tshpack'},
+    'inferred_freq': {'format': 'tshpack', 'inferred_freq': 'true'},
+    'tzone': {'format': 'json', 'tzone': 'Europe/Paris'},
+    'revision': {'format': 'tshpack', 'insertion_date': None},
+}
+
+
+def _serve(dburi, namespace, host, port, workers, ports):
+    from werkzeug.serving import make_server
+    from tshistory.api import timeseries as tsapi
+    from tshistory.http.app import make_app
+    from tshistory.http.util import nosecurity
+    from tshistory_supervision.http import supervision_httpapi
+
+    tsa = tsapi(dburi, namespace=namespace, handler=timeseries, sources={})
+    app = nosecurity(make_app(tsa, supervision_httpapi))
+    # the forked request handlers must not share the pooled connections
+    tsa.engine.dispose()
+    server = make_server(
+        host, port, app,
+        threaded=workers == 1,
+        processes=workers
+    )
+    ports.put(server.port)
+    server.serve_forever()
+
+
+def serve(dburi, namespace='tsh', host='127.0.0.1', port=0, workers=1):
+    """Serve the supervision http api of `dburi` from its own process
+    (the load clients would otherwise compete with it for the GIL).
+
+    With one worker, the server is multi-threaded. With more, each
+    request is handled in a forked process, with at most `workers` of
+    them at a time: the requests are not bound to one core by the GIL.
+
+    Returns the server process (to be `.terminate()`-d) and its base
+    uri.
+    """
+    ports = multiprocessing.Queue()
+    process = multiprocessing.Process(
+        target=_serve,
+        args=(dburi, namespace, host, port, workers, ports),
+        daemon=True
+    )
+    process.start()
+    return process, f'http://{host}:{ports.get(timeout=60)}'
+
+
+def loadtest(uri, names, mix=None, clients=8, count=1000, seed=42,
+             revision_dates=None):
+    """Hit the supervision route of `uri` with `count` requests from
+    `clients` concurrent clients. The series `names` and the query
+    kinds (weighted by the `mix` mapping of LOADQUERIES keys) are
+    drawn at random. The `revision` queries read the series as of
+    their date in the `revision_dates` mapping.
+
+    Returns a dataframe of the samples (kind, status, latency in
+    seconds) and the total elapsed time.
+    """
+    mix = mix or {kind: 1 for kind in LOADQUERIES}
+    kinds = list(mix)
+    weights = np.array([mix[kind] for kind in kinds], dtype='float64')
+    rng = np.random.default_rng(seed)
+    plan = list(zip(
+        rng.choice(kinds, size=count, p=weights / weights.sum()),
+        rng.choice(names, size=count)
+    ))
+    revision_dates = revision_dates or {}
+    local = threading.local()
+
+    def query(kind, name):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        params = dict(LOADQUERIES[kind], name=name)
+        if 'insertion_date' in params:
+            params['insertion_date'] = revision_dates[name].isoformat()
+        t0 = perf_counter()
+        res = session.get(f'{uri}/series/supervision', params=params)
+        res.content
+        return kind, res.status_code, perf_counter() - t0
+
+    t0 = perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        samples = list(pool.map(lambda args: query(*args), plan))
+    elapsed = perf_counter() - t0
+    return (
+        pd.DataFrame(samples, columns=['kind', 'status', 'latency']),
+        elapsed
+    )
+
+
+def load_report(samples, elapsed):
+    """Summarize the loadtest samples per query kind (and overall):
+    count, errors, throughput and latency percentiles (in ms).
+    """
+    def summary(group):
+        ms = group.latency.values * 1000
+        return {
+            'count': len(group),
+            'errors': int((group.status != 200).sum()),
+            'rps': round(len(group) / elapsed, 1),
+            'mean': round(float(ms.mean()), 2),
+            'p50': round(float(np.percentile(ms, 50)), 2),
+            'p90': round(float(np.percentile(ms, 90)), 2),
+            'p99': round(float(np.percentile(ms, 99)), 2),
+            'max': round(float(ms.max()), 2)
+        }
+
+    report = {
+        kind: summary(group)
+        for kind, group in samples.groupby('kind')
+    }
+    report['all'] = summary(samples)
+    return report
+
+
+def latency_histogram(samples, bins=12):
+    """Returns a (log-spaced bucket upper bound in ms, count) text
+    histogram of the samples latencies.
+    """
+    ms = samples.latency.values * 1000
+    edges = np.geomspace(max(ms.min(), .01), ms.max() * 1.0001, bins + 1)
+    counts, edges = np.histogram(ms, bins=edges)
+    width = max(counts.max(), 1)
+    return '\n'.join(
+        f'{edge:10.2f} ms | {"#" * int(50 * count / width)} {count}'
+        for edge, count in zip(edges[1:], counts)
+    )
+
+
+def compare_reports(baseline, report, keys=('rps', 'p50', 'p99')):
+    """Returns the relative changes (in %) of a report against a
+    baseline, per query kind.
+    """
+    return {
+        kind: {
+            key: round(100 * (figures[key] - baseline[kind][key])
+                       / baseline[kind][key], 1)
+            for key in keys
+            if baseline[kind].get(key)
+        }
+        for kind, figures in report.items()
+        if kind in baseline
+    }
+
+
+# payload formats
+
+# label -> (format, content encoding) of the /series/supervision answer
+PAYLOADFORMATS = {
+    'json': ('json', 'identity'),
+    'json+gzip': ('json', 'gzip'),
+    'json+zstd': ('json', 'zstd'),
+    'tshpack': ('tshpack', 'identity'),
+    'arrow': ('arrow', 'identity'),
+    'arrow+gzip': ('arrow', 'gzip'),
+    'arrow+zstd': ('arrow', 'zstd'),
+}
+
+
+def _decode(body, encoding):
+    if encoding == 'gzip':
+        return zlib.decompress(body, 31)
+    if encoding == 'zstd':
+        return zstandard.ZstdDecompressor().decompressobj().decompress(body)
+    return body
+
+
+def formatbench(uri, names, formats=None, repeat=5):
+    """Fetch the supervision of the series `names` from `uri` in each of
+    the `formats` (PAYLOADFORMATS keys), `repeat` times each.
+
+    The latency covers the transfer and the decoding of the content
+    encoding, not the parsing of the payload. The encoding is the one
+    actually served: a server without zstd support answers the zstd
+    requests uncompressed.
+
+    Returns a dataframe of the samples (label, format, encoding,
+    status, wire bytes, decoded bytes, latency in seconds).
+    """
+    formats = formats or list(PAYLOADFORMATS)
+    samples = []
+    with requests.Session() as session:
+        for label in formats:
+            fmt, encoding = PAYLOADFORMATS[label]
+            for _ in range(repeat):
+                for name in names:
+                    t0 = perf_counter()
+                    res = session.get(
+                        f'{uri}/series/supervision',
+                        params={'name': name, 'format': fmt},
+                        headers={'Accept-Encoding': encoding},
+                        stream=True
+                    )
+                    wire = res.raw.read(decode_content=False)
+                    served = res.headers.get('Content-Encoding', 'identity')
+                    body = _decode(wire, served)
+                    elapsed = perf_counter() - t0
+                    samples.append(
+                        (label, fmt, served, res.status_code,
+                         len(wire), len(body), elapsed)
+                    )
+    return pd.DataFrame(
+        samples,
+        columns=['label', 'format', 'encoding', 'status',
+                 'bytes', 'decoded', 'latency']
+    )
+
+
+def format_report(samples):
+    """Summarize the formatbench samples per format label: served
+    encoding, errors, mean payload size (wire and decoded, in bytes),
+    size relative to plain json and latency percentiles (in ms).
+    """
+    rows = {}
+    for label, group in samples.groupby('label', sort=False):
+        ok = group[group.status == 200]
+        ms = ok.latency.values * 1000
+        rows[label] = {
+            'encoding': ','.join(sorted(set(ok.encoding))) or '-',
+            'errors': int((group.status != 200).sum()),
+            'bytes': int(ok.bytes.mean()) if len(ok) else 0,
+            'decoded': int(ok.decoded.mean()) if len(ok) else 0,
+            'p50': round(float(np.percentile(ms, 50)), 2) if len(ok) else None,
+            'p90': round(float(np.percentile(ms, 90)), 2) if len(ok) else None
+        }
+    report = pd.DataFrame(rows).T
+    if 'json' in rows and rows['json']['bytes']:
+        report.insert(
+            3, 'ratio',
+            (report['bytes'] / rows['json']['bytes']).astype('float64').round(3)
+        )
+    report.index.name = 'format'
+    return report
@@ -1,10 +1,37 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import cProfile
+from itertools import repeat
+import json
+from pathlib import Path
+import pstats
+from time import perf_counter
+import tracemalloc
+from urllib.parse import quote
+
 import click
 
+import numpy as np
+import pandas as pd
 import tqdm
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from tshistory.api import timeseries as tsapi
 from tshistory.util import find_dburi
 from collections import defaultdict
 
+from tshistory_supervision.bench import (
+    compare_reports,
+    format_report,
+    formatbench,
+    latency_histogram,
+    load_report,
+    loadtest,
+    PAYLOADFORMATS,
+    populate,
+    serve,
+    STATUSES,
+    writebench
+)
 from tshistory_supervision.tsio import timeseries
 
 
@@ -85,3 +112,630 @@ def list_mismatch(db_uri, namespace='tsh'):
     for name in sorted(diff):
         assert (False, True) == (tsh.exists(e, name), tsh.upstream.exists(e, name))
         print(name)
+
+
+@click.command(name='supervision-report')
+@click.argument('dburi')
+@click.option('--name', multiple=True,
+              help='restrict to these series (default: all series)')
+@click.option('--points', is_flag=True, default=False,
+              help='also count the overridden points (slow)')
+@click.option('--output', type=click.Path(), default=None,
+              help='write the report as csv into this file')
+@click.option('--namespace', default='tsh')
+def supervision_report(dburi, name=(), points=False, output=None,
+                       namespace='tsh'):
+    """Show the supervision figures of the series."""
+    tsa = tsapi(
+        find_dburi(dburi),
+        namespace=namespace,
+        handler=timeseries,
+        sources={}
+    )
+    t0 = perf_counter()
+    report = tsa.supervision_stats(list(name) or None, points=points)
+    elapsed = perf_counter() - t0
+
+    if output:
+        report.to_csv(output)
+    else:
+        with pd.option_context('display.max_rows', None,
+                               'display.width', 200):
+            print(report)
+
+    print(
+        f'{len(report)} series:',
+        ', '.join(
+            f'{count} {status}'
+            for status, count in sorted(report.status.value_counts().items())
+        ),
+        f'({elapsed:.3f}s)'
+    )
+
+
+@click.command(name='populate-supervision')
+@click.argument('dburi')
+@click.option('--count', type=int, default=100, help='number of series')
+@click.option('--length', type=int, default=1000, help='points per series')
+@click.option('--freq', default='h', help='series frequency')
+@click.option('--revisions', type=int, default=10,
+              help='upstream revisions per series')
+@click.option('--mix', default='1,1,1',
+              help='unsupervised,supervised,handcrafted weights')
+@click.option('--density', type=float, default=.01,
+              help='fraction of points overridden at each manual edit')
+@click.option('--seed', type=int, default=42)
+@click.option('--prefix', default='synthetic', help='series names prefix')
+@click.option('--namespace', default='tsh')
+def populate_supervision(dburi, count=100, length=1000, freq='h',
+                         revisions=10, mix='1,1,1', density=.01,
+                         seed=42, prefix='synthetic', namespace='tsh'):
+    """Fill a database with a synthetic (and reproducible) catalogue of
+    supervised, unsupervised and handcrafted series.
+    """
+    engine = create_engine(find_dburi(dburi))
+    tsh = timeseries(namespace)
+    t0 = perf_counter()
+    catalog = populate(
+        engine, tsh,
+        count=count,
+        length=length,
+        freq=freq,
+        revisions=revisions,
+        mix=[float(weight) for weight in mix.split(',')],
+        density=density,
+        seed=seed,
+        prefix=prefix
+    )
+    statuses = pd.Series(catalog).value_counts()
+    print(
+        f'{len(catalog)} series:',
+        ', '.join(
+            f'{count} {status}'
+            for status, count in sorted(statuses.items())
+        ),
+        f'({perf_counter() - t0:.3f}s)'
+    )
+
+
+@click.command(name='load-supervision')
+@click.argument('dburi')
+@click.option('--clients', type=int, default=8, help='concurrent clients')
+@click.option('--workers', type=int, default=1,
+              help='server processes (one: a multi-threaded server)')
+@click.option('--requests', 'count', type=int, default=1000,
+              help='total number of requests')
+@click.option('--mix', default='json=1,tshpack=1,inferred_freq=1,tzone=1,revision=1',
+              help='query kinds weights')
+@click.option('--prefix', default=None,
+              help='only query the series with this prefix')
+@click.option('--seed', type=int, default=42)
+@click.option('--output', type=click.Path(), default=None,
+              help='write the json report into this file')
+@click.option('--baseline', type=click.Path(exists=True), default=None,
+              help='compare against this json report')
+@click.option('--namespace', default='tsh')
+def load_supervision(dburi, clients=8, workers=1, count=1000,
+                     mix='json=1,tshpack=1,inferred_freq=1,tzone=1,revision=1',
+                     prefix=None, seed=42, output=None, baseline=None,
+                     namespace='tsh'):
+    """Serve the supervision http api locally (in a separate process,
+    multi-threaded or with `--workers` forked processes) and measure
+    its latency and throughput under concurrent clients.
+    """
+    dburi = find_dburi(dburi)
+    engine = create_engine(dburi)
+    tsh = timeseries(namespace)
+    names = [
+        name for name, stype in tsh.list_series(engine).items()
+        if stype == 'primary' and (not prefix or name.startswith(prefix))
+    ]
+    if not names:
+        raise click.UsageError('no series to query')
+
+    # the revision queries read the series in the middle of their history
+    revision_dates = {}
+    with engine.begin() as cn:
+        for name in names:
+            idates = tsh.insertion_dates(cn, name)
+            revision_dates[name] = idates[(len(idates) - 1) // 2]
+
+    server, uri = serve(dburi, namespace, workers=workers)
+    try:
+        samples, elapsed = loadtest(
+            uri, names,
+            mix={
+                kind: float(weight)
+                for kind, weight in (
+                    item.split('=') for item in mix.split(',')
+                )
+            },
+            clients=clients,
+            count=count,
+            seed=seed,
+            revision_dates=revision_dates
+        )
+    finally:
+        server.terminate()
+
+    report = load_report(samples, elapsed)
+    print(latency_histogram(samples))
+    print(pd.DataFrame(report).T.to_string())
+    if baseline:
+        with open(baseline) as f:
+            changes = compare_reports(json.load(f), report)
+        print('changes vs baseline (%)')
+        print(pd.DataFrame(changes).T.to_string())
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+@click.command(name='bench-writers')
+@click.argument('dburi')
+@click.option('--threads', type=int, multiple=True, default=(1, 2, 4, 8),
+              help='concurrent writers (repeatable)')
+@click.option('--series', type=int, default=16,
+              help='number of written series')
+@click.option('--writes', type=int, default=20,
+              help='writes per series')
+@click.option('--prefix', default='bench-writers', help='series names prefix')
+@click.option('--namespace', default='tsh')
+def bench_writers(dburi, threads=(1, 2, 4, 8), series=16, writes=20,
+                  prefix='bench-writers', namespace='tsh'):
+    """Measure the write throughput of concurrent writers (by number of
+    threads) and check the supervision branches invariants of the
+    written series.
+
+    With `--series 1` all the writers contend for the same series lock.
+    """
+    engine = create_engine(find_dburi(dburi), pool_size=max(threads))
+    tsh = timeseries(namespace)
+    rows = {}
+    failed = False
+    for count in threads:
+        total, elapsed, broken = writebench(
+            engine, tsh,
+            threads=count,
+            series=series,
+            writes=writes,
+            prefix=prefix
+        )
+        failed = failed or bool(broken)
+        rows[count] = {
+            'writes': total,
+            'seconds': round(elapsed, 3),
+            'writes/s': round(total / elapsed, 1),
+            'broken': len(broken)
+        }
+    report = pd.DataFrame(rows).T.astype(
+        {'writes': 'int64', 'broken': 'int64'}
+    )
+    report['speedup'] = (
+        report['writes/s'] / report['writes/s'].iloc[0]
+    ).round(2)
+    report.index.name = 'threads'
+    print(report.to_string())
+    if failed:
+        raise click.ClickException('the branches invariants do not hold')
+
+
+@click.command(name='bench-formats')
+@click.argument('dburi')
+@click.option('--format', 'formats', multiple=True,
+              type=click.Choice(list(PAYLOADFORMATS)),
+              default=list(PAYLOADFORMATS),
+              help='payload format and content encoding (repeatable)')
+@click.option('--repeat', type=int, default=5,
+              help='fetches per series and format')
+@click.option('--prefix', default=None,
+              help='only fetch the series with this prefix')
+@click.option('--namespace', default='tsh')
+def bench_formats(dburi, formats=tuple(PAYLOADFORMATS), repeat=5,
+                  prefix=None, namespace='tsh'):
+    """Serve the supervision http api locally and measure the payload
+    size and latency of the supervision route per format and content
+    encoding.
+    """
+    dburi = find_dburi(dburi)
+    engine = create_engine(dburi)
+    tsh = timeseries(namespace)
+    names = [
+        name for name, stype in tsh.list_series(engine).items()
+        if stype == 'primary' and (not prefix or name.startswith(prefix))
+    ]
+    if not names:
+        raise click.UsageError('no series to fetch')
+
+    server, uri = serve(dburi, namespace)
+    try:
+        samples = formatbench(uri, names, formats=formats, repeat=repeat)
+    finally:
+        server.terminate()
+    print(format_report(samples).to_string())
+
+
+# profiling
+
+class phaseprofiler:
+    """Measure named phases: wall time, time spent in the sql
+    statements (and their count), peak memory allocations, with all
+    the phases under one cProfile profile.
+    """
+
+    def __init__(self, engine):
+        self.phases = {}
+        self.profile = cProfile.Profile()
+        self._sql = [0, 0.]
+        self._t0 = None
+        event.listen(engine, 'before_cursor_execute', self._before)
+        event.listen(engine, 'after_cursor_execute', self._after)
+
+    def _before(self, *_a):
+        self._t0 = perf_counter()
+
+    def _after(self, *_a):
+        self._sql[0] += 1
+        self._sql[1] += perf_counter() - self._t0
+
+    @contextmanager
+    def phase(self, name, kind='compute'):
+        self._sql = [0, 0.]
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        t0 = perf_counter()
+        self.profile.enable()
+        try:
+            yield
+        finally:
+            self.profile.disable()
+            elapsed = perf_counter() - t0
+            _, peak = tracemalloc.get_traced_memory()
+            statements, sqltime = self._sql
+            self.phases[name] = {
+                'total (ms)': elapsed * 1000,
+                'sql (ms)': sqltime * 1000,
+                'pandas (ms)': (elapsed - sqltime) * 1000 if kind == 'compute' else 0.,
+                'encoding (ms)': elapsed * 1000 if kind == 'encoding' else 0.,
+                'statements': statements,
+                'peak (kb)': (peak - start) / 1024
+            }
+
+    def report(self):
+        return pd.DataFrame(self.phases).T.round(2).astype(
+            {'statements': 'int64'}
+        )
+
+
+@click.command(name='profile-supervision')
+@click.argument('dburi')
+@click.argument('name')
+@click.option('--top', type=int, default=15,
+              help='number of functions shown (by cumulative time)')
+@click.option('--output', type=click.Path(), default=None,
+              help='write the pstats profile (for flameprof, snakeviz, ...)')
+@click.option('--namespace', default='tsh')
+def profile_supervision(dburi, name, top=15, output=None, namespace='tsh'):
+    """Profile the supervision operations on a series: update (rolled
+    back), edited, get_overrides and the http encodings.
+    """
+    from tshistory_supervision.http import (
+        pa,
+        pack_arrow,
+        pack_json,
+        pack_tshpack
+    )
+
+    engine = create_engine(find_dburi(dburi))
+    tsh = timeseries(namespace)
+    if not tsh.exists(engine, name):
+        raise click.UsageError(f'no series `{name}`')
+
+    profiler = phaseprofiler(engine)
+    tracemalloc.start()
+    try:
+        with engine.connect() as cn:
+            tx = cn.begin()
+            try:
+                with profiler.phase('edited'):
+                    series, markers = tsh.get_ts_marker(cn, name)
+                with profiler.phase('get_overrides'):
+                    tsh.get_overrides(cn, name)
+                if (series is not None and len(series)
+                        and series.dtype == 'float64'):
+                    with profiler.phase('update'):
+                        tsh.update(cn, series.iloc[-1:] + 1, name, 'profiler')
+                    with profiler.phase('update (manual)'):
+                        tsh.update(cn, series.iloc[:1] + 1, name, 'profiler',
+                                   manual=True)
+            finally:
+                # leave the series untouched
+                tx.rollback()
+
+        # the encoders of the http routes
+        with profiler.phase('encode json', kind='encoding'):
+            pack_json(series, markers)
+        if series is not None:
+            metadata = tsh.internal_metadata(engine, name)
+            with profiler.phase('encode tshpack', kind='encoding'):
+                pack_tshpack(metadata, series, markers)
+            if pa is not None:
+                with profiler.phase('encode arrow', kind='encoding'):
+                    pack_arrow(series, markers)
+    finally:
+        tracemalloc.stop()
+
+    points = 'no' if series is None else len(series)
+    print(f'{name}: {points} points ({tsh.supervision_status(engine, name)})')
+    print(profiler.report().to_string())
+    print()
+    stats = pstats.Stats(profiler.profile)
+    stats.sort_stats('cumulative').print_stats(top)
+    if output:
+        stats.dump_stats(output)
+
+
+# parquet export
+
+_EXPORT = {}
+
+
+def _init_export_worker(dburi, namespace):
+    _EXPORT['engine'] = create_engine(dburi)
+    _EXPORT['tsh'] = timeseries(namespace)
+
+
+def export_series(name, outdir, rowgroup, chunk):
+    """Write the edited series and markers of `name` into
+    `<outdir>/<supervision status>/<name>.parquet`, one row group of
+    at most `rowgroup` rows at a time.
+
+    The series is read by value dates windows of a `chunk` span, so
+    that a worker never holds more than a window. Returns the number
+    of rows written, or None for the (skipped) non-float series.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    engine, tsh = _EXPORT['engine'], _EXPORT['tsh']
+    schema = pa.schema([
+        ('name', pa.dictionary(pa.int32(), pa.string())),
+        ('value_date', pa.timestamp('ns')),
+        ('value', pa.float64()),
+        ('manual_flag', pa.bool_()),
+        ('supervision_status', pa.dictionary(pa.int32(), pa.string()))
+    ])
+    rows = 0
+    with engine.begin() as cn:
+        meta = tsh.series_meta(cn, name)
+        status = tsh.supervision_status(cn, name, meta)
+        if meta['internal_metadata']['value_type'] != 'float64':
+            return name, status, None
+
+        filename = f'{quote(name, safe="")}.parquet'
+        partition = Path(outdir) / status
+        partition.mkdir(parents=True, exist_ok=True)
+        path = partition / filename
+        with pq.ParquetWriter(path, schema) as writer:
+            for series, markers in tsh.iter_ts_marker(
+                    cn, name, chunk, _keep_nans=True, _meta=meta):
+                index = markers.index
+                if index.tz is not None:
+                    index = index.tz_convert('UTC').tz_localize(None)
+                values = series.reindex(markers.index).values
+                flags = markers.values.astype('bool')
+                for start in range(0, len(index), rowgroup):
+                    end = start + rowgroup
+                    size = len(index[start:end])
+                    zeros = pa.array(np.zeros(size, dtype='int32'))
+                    writer.write_batch(
+                        pa.RecordBatch.from_arrays(
+                            [
+                                pa.DictionaryArray.from_arrays(zeros, [name]),
+                                pa.array(index.values[start:end]),
+                                pa.array(values[start:end]),
+                                pa.array(flags[start:end]),
+                                pa.DictionaryArray.from_arrays(zeros, [status])
+                            ],
+                            schema=schema
+                        )
+                    )
+                rows += len(index)
+
+    # the series may have changed status since a previous export
+    for other in STATUSES:
+        if other != status:
+            (Path(outdir) / other / filename).unlink(missing_ok=True)
+    return name, status, rows
+
+
+@click.command(name='export-supervision')
+@click.argument('dburi')
+@click.argument('outdir')
+@click.option('--since', type=click.DateTime(), default=None,
+              help='only export the series changed after this (utc) insertion date')
+@click.option('--workers', type=int, default=4)
+@click.option('--rowgroup', type=int, default=100_000,
+              help='max number of rows written at once')
+@click.option('--chunk', default='365D',
+              help='value dates span read at once (bounds the memory of a worker)')
+@click.option('--namespace', default='tsh')
+def export_supervision(dburi, outdir, since=None, workers=4,
+                       rowgroup=100_000, chunk='365D', namespace='tsh'):
+    """Export the edited float series with their markers as parquet
+    files, one per series, partitioned by supervision status.
+    """
+    dburi = find_dburi(dburi)
+    engine = create_engine(dburi)
+    tsh = timeseries(namespace)
+    series = [
+        name for name, stype in tsh.list_series(engine).items()
+        if stype == 'primary'
+    ]
+    if since:
+        since = pd.Timestamp(since, tz='UTC')
+        with engine.begin() as cn:
+            series = [
+                name for name in series
+                if (tsh.latest_insertion_date(cn, name) or since) > since
+            ]
+
+    categories = defaultdict(int)
+    skipped = []
+    rows = 0
+    with ProcessPoolExecutor(
+            workers,
+            initializer=_init_export_worker,
+            initargs=(dburi, namespace)) as pool:
+        for name, status, count in tqdm.tqdm(
+                pool.map(export_series, series,
+                         repeat(outdir), repeat(rowgroup), repeat(chunk)),
+                total=len(series)):
+            if count is None:
+                skipped.append(name)
+                continue
+            categories[status] += 1
+            rows += count
+
+    for status, count in sorted(categories.items()):
+        print(status, count)
+    print('rows', rows)
+    if skipped:
+        print('skipped (not float)', len(skipped))
+        for name in sorted(skipped):
+            print(' ', name)
+
+
+# overrides import
+
+def read_overrides(path, chunksize):
+    """Read a csv or parquet file with `name`, `value_date` and `value`
+    columns, by chunks of `chunksize` rows.
+    """
+    if str(path).endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+        return
+
+    yield from pd.read_csv(path, chunksize=chunksize)
+
+
+def overrides_by_series(path, chunksize):
+    pieces = defaultdict(list)
+    for chunk in read_overrides(path, chunksize):
+        for name, group in chunk.groupby('name', sort=False):
+            pieces[name].append(
+                pd.Series(
+                    group['value'].values,
+                    index=pd.DatetimeIndex(pd.to_datetime(group['value_date'])),
+                    dtype='float64'
+                )
+            )
+
+    serieslist = {}
+    for name, parts in pieces.items():
+        ts = pd.concat(parts)
+        # the last entry of a given stamp wins
+        serieslist[name] = ts[
+            ~ts.index.duplicated(keep='last')
+        ].sort_index()
+    return serieslist
+
+
+@click.command(name='import-overrides')
+@click.argument('dburi')
+@click.argument('path')
+@click.option('--author', required=True)
+@click.option('--dry-run', is_flag=True, default=False,
+              help='show what would change without writing')
+@click.option('--batch-size', type=int, default=100,
+              help='number of series per transaction')
+@click.option('--chunk-size', type=int, default=100_000,
+              help='number of rows read at once')
+@click.option('--namespace', default='tsh')
+def import_overrides(dburi, path, author, dry_run=False,
+                     batch_size=100, chunk_size=100_000, namespace='tsh'):
+    """Apply the manual edits of a csv or parquet file (with `name`,
+    `value_date` and `value` columns) in a few transactions.
+    """
+    engine = create_engine(find_dburi(dburi))
+    tsh = timeseries(namespace)
+    serieslist = overrides_by_series(path, chunk_size)
+
+    names = list(serieslist)
+    total = 0
+    start = perf_counter()
+    for idx in range(0, len(names), batch_size):
+        batch = {
+            name: serieslist[name]
+            for name in names[idx:idx + batch_size]
+        }
+        with engine.begin() as cn:
+            t0 = perf_counter()
+            for name, diff in tsh.update_manual_many(
+                    cn, batch, author, dryrun=dry_run):
+                t1 = perf_counter()
+                count = 0 if diff is None else len(diff)
+                total += count
+                print(f'{name}: {count} points ({t1 - t0:.3f}s)')
+                if dry_run and count:
+                    print(diff.to_string())
+                t0 = t1
+
+    print(
+        f'{"would change" if dry_run else "changed"} {total} points '
+        f'in {len(names)} series ({perf_counter() - start:.3f}s)'
+    )
+
+
+@click.command(name='strip-supervision')
+@click.argument('dburi')
+@click.argument('since', type=click.DateTime())
+@click.option('--name', multiple=True,
+              help='strip these series')
+@click.option('--all', 'allseries', is_flag=True, default=False,
+              help='strip all the primary series')
+@click.option('--dry-run', is_flag=True, default=False,
+              help='list the revisions that would be deleted')
+@click.option('--namespace', default='tsh')
+def strip_supervision(dburi, since, name=(), allseries=False,
+                      dry_run=False, namespace='tsh'):
+    """Delete all the revisions inserted at or after the `since` (utc)
+    date, on the edited and upstream branches.
+
+    This drops the most recent history of the series (e.g. to undo a
+    bad bulk import), the older revisions are kept.
+    """
+    if bool(name) == allseries:
+        raise click.UsageError('give either some --name or --all')
+    engine = create_engine(find_dburi(dburi))
+    tsh = timeseries(namespace)
+    series = list(name) or [
+        name for name, stype in tsh.list_series(engine).items()
+        if stype == 'primary'
+    ]
+    since = pd.Timestamp(since, tz='UTC')
+
+    stripped = 0
+    for name in tqdm.tqdm(series, disable=dry_run):
+        with engine.begin() as cn:
+            csid = tsh.changeset_at(cn, name, since, mode='after')
+            if csid is None:
+                continue
+            stripped += 1
+            if dry_run:
+                edited = tsh.insertion_dates(cn, name, from_insertion_date=since)
+                upstream = []
+                if tsh.upstream.exists(cn, name):
+                    upstream = tsh.upstream.insertion_dates(
+                        cn, name, from_insertion_date=since
+                    )
+                print(
+                    f'{name}: {len(edited)} edited, {len(upstream)} upstream '
+                    f'revisions from {edited[0]}'
+                )
+                continue
+            tsh.strip(cn, name, csid)
+
+    print(f'{"would strip" if dry_run else "stripped"} {stripped} series')
@@ -1,7 +1,25 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+import contextvars
+from functools import wraps
+import hashlib
+import io
+import logging
+import struct
+import threading
+from time import perf_counter
+import zlib
+
 import simplejson as json
+import numpy as np
 import pandas as pd
 
-from flask import make_response
+from flask import (
+    make_response,
+    request
+)
+from sqlalchemy import event
+import werkzeug
 
 from flask_restx import (
     inputs,
@@ -20,9 +38,33 @@ from tshistory.http.util import (
     enum,
     onerror,
     required_roles,
+    series_response,
     utcdt
 )
 
+from tshistory_supervision.api import readengine
+from tshistory_supervision.tsio import PHASEHOOK
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover
+    pa = None
+
+
+L = logging.getLogger('tshistory_supervision.http')
+
+# requests slower than this (in seconds) are logged
+SLOW_REQUEST_THRESHOLD = 1.
+
+# below this size, compression is not worth it
+COMPRESSION_THRESHOLD = 1024
+ENCODINGS = ('zstd', 'gzip') if zstandard else ('gzip',)
+
 
 base = reqparse.RequestParser()
 base.add_argument(
@@ -44,7 +86,7 @@ edited.add_argument(
     'to_value_date', type=utcdt, default=None
 )
 edited.add_argument(
-    'format', type=enum('json', 'tshpack'), default='json'
+    'format', type=enum('json', 'tshpack', 'arrow'), default='json'
 )
 edited.add_argument(
     'horizon', type=str, default=None,
@@ -54,6 +96,18 @@ edited.add_argument(
     'inferred_freq', type=inputs.boolean, default=False,
     help='re-index series on a inferred frequency'
 )
+edited.add_argument(
+    'max_points', type=int, default=None,
+    help='downsample to about this number of points'
+)
+edited.add_argument(
+    'resample', type=str, default=None,
+    help='downsample to the min/max points of buckets of this frequency'
+)
+edited.add_argument(
+    'provenance', type=inputs.boolean, default=False,
+    help='send provenance codes instead of the boolean markers'
+)
 edited.add_argument(
     'tzone', type=str, default='UTC',
     help='Convert tz-aware series into this time zone before sending'
@@ -63,6 +117,575 @@ edited.add_argument(
     help='keep erasure information'
 )
 
+revert = reqparse.RequestParser()
+revert.add_argument(
+    'name', type=str, required=True, action='append',
+    help='timeseries name(s)'
+)
+revert.add_argument(
+    'author', type=str, required=True,
+    help='author of the revert'
+)
+revert.add_argument(
+    'from_value_date', type=utcdt, default=None
+)
+revert.add_argument(
+    'to_value_date', type=utcdt, default=None
+)
+revert.add_argument(
+    'insertion_date', type=utcdt, default=None,
+    help='insertion date can be forced'
+)
+revert.add_argument(
+    'format', type=enum('json', 'tshpack'), default='json'
+)
+
+manual = reqparse.RequestParser()
+manual.add_argument(
+    'author', type=str, required=True,
+    help='author of the edits'
+)
+manual.add_argument(
+    'bseries', type=werkzeug.datastructures.FileStorage,
+    location='files', required=True,
+    help='the edits as many series in binary format (tshpack)'
+)
+manual.add_argument(
+    'insertion_date', type=utcdt, default=None,
+    help='insertion date can be forced'
+)
+manual.add_argument(
+    'dryrun', type=inputs.boolean, default=False,
+    help='compute the diffs without writing anything'
+)
+manual.add_argument(
+    'format', type=enum('json', 'tshpack'), default='json'
+)
+
+upstream = base.copy()
+upstream.add_argument(
+    'insertion_date', type=utcdt, default=None,
+    help='select a specific version'
+)
+upstream.add_argument(
+    'from_value_date', type=utcdt, default=None
+)
+upstream.add_argument(
+    'to_value_date', type=utcdt, default=None
+)
+upstream.add_argument(
+    'format', type=enum('json', 'tshpack'), default='json'
+)
+
+upstream_idates = base.copy()
+upstream_idates.add_argument(
+    'from_insertion_date', type=utcdt, default=None
+)
+upstream_idates.add_argument(
+    'to_insertion_date', type=utcdt, default=None
+)
+upstream_idates.add_argument(
+    'from_value_date', type=utcdt, default=None
+)
+upstream_idates.add_argument(
+    'to_value_date', type=utcdt, default=None
+)
+
+upstream_history = upstream_idates.copy()
+upstream_history.add_argument(
+    'format', type=enum('json', 'tshpack'), default='json'
+)
+
+frame = reqparse.RequestParser()
+frame.add_argument(
+    'name', type=str, required=True, action='append',
+    help='timeseries names'
+)
+frame.add_argument(
+    'insertion_date', type=utcdt, default=None,
+    help='select a specific version'
+)
+frame.add_argument(
+    'from_value_date', type=utcdt, default=None
+)
+frame.add_argument(
+    'to_value_date', type=utcdt, default=None
+)
+
+overrides = reqparse.RequestParser()
+overrides.add_argument(
+    'name', type=str, default=None, action='append',
+    help='restrict to these series (default: all supervised series)'
+)
+overrides.add_argument(
+    'from_value_date', type=utcdt, default=None
+)
+overrides.add_argument(
+    'to_value_date', type=utcdt, default=None
+)
+overrides.add_argument(
+    'insertion_date', type=utcdt, default=None,
+    help='select a specific version'
+)
+
+# number of series read at once by the overrides stream
+OVERRIDES_BATCH = 50
+# number of overrides rows per streamed csv chunk
+OVERRIDES_CHUNK = 10_000
+
+
+def diffs_response(fmt, diffs):
+    """Response made of many named diffs (as json or tshpack)."""
+    if fmt == 'json':
+        response = make_response(
+            json.dumps({
+                name: {
+                    stamp.isoformat(): value
+                    for stamp, value in diff.items()
+                }
+                for name, diff in diffs.items()
+            }, ignore_nan=True)
+        )
+        response.headers['Content-Type'] = 'text/json'
+        response.status_code = 200
+        return response
+
+    assert fmt == 'tshpack'
+    serieslist = []
+    for name, diff in diffs.items():
+        diff.name = name
+        serieslist.append((util.series_metadata(diff), diff))
+    response = make_response(
+        util.pack_many_series(serieslist)
+    )
+    response.headers['Content-Type'] = 'application/octet-stream'
+    response.status_code = 200
+    return response
+
+
+def stream_overrides(tsa, names, **query):
+    """Yield the overrides of the `names` series as csv, reading
+    `OVERRIDES_BATCH` series at a time.
+
+    The body is produced as it is sent: an error past the first chunk
+    truncates it.
+    """
+    yield 'name,value_date,value\n'
+    for idx in range(0, len(names), OVERRIDES_BATCH):
+        frame = tsa.overrides_many(
+            names[idx:idx + OVERRIDES_BATCH], **query
+        )
+        for start in range(0, len(frame), OVERRIDES_CHUNK):
+            out = io.StringIO()
+            frame.iloc[start:start + OVERRIDES_CHUNK].to_csv(
+                out,
+                header=False,
+                index=False,
+                date_format='%Y-%m-%dT%H:%M:%S%z'
+            )
+            yield out.getvalue()
+
+
+# history frame header: insertion date (ns since epoch), payload size
+HISTORY_FRAME = struct.Struct('>qQ')
+# number of revisions read at once by the history stream
+HISTORY_BATCH = 10
+# size of the chunks read by the client
+HISTORY_CHUNK = 1 << 16
+
+
+def stream_history(tsa, name, idates,
+                   from_value_date=None, to_value_date=None):
+    """Yield the upstream revisions of `name` at `idates` one by one,
+    each as a header and a packed series, reading `HISTORY_BATCH`
+    revisions at a time.
+
+    The body is produced as it is sent: an error past the first
+    revisions truncates it.
+    """
+    pruned = from_value_date is not None or to_value_date is not None
+    current = None
+    for idx in range(0, len(idates), HISTORY_BATCH):
+        batch = idates[idx:idx + HISTORY_BATCH]
+        hist = tsa.upstream_history(
+            name,
+            from_insertion_date=batch[0],
+            to_insertion_date=batch[-1],
+            from_value_date=from_value_date,
+            to_value_date=to_value_date
+        )
+        for idate, series in hist.items():
+            # like the history pruning, across the batches
+            if pruned and current is not None and current.equals(series):
+                continue
+            current = series
+            payload = util.pack_series(util.series_metadata(series), series)
+            yield HISTORY_FRAME.pack(idate.value, len(payload)) + payload
+
+
+def unpack_history_stream(name, chunks):
+    """Read back the revisions yielded by `stream_history` out of an
+    iterable of byte chunks, one revision at a time.
+    """
+    hist = {}
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= HISTORY_FRAME.size:
+            stamp, size = HISTORY_FRAME.unpack_from(buffer)
+            end = HISTORY_FRAME.size + size
+            if len(buffer) < end:
+                break
+            hist[pd.Timestamp(stamp, tz='UTC')] = util.unpack_series(
+                name, bytes(buffer[HISTORY_FRAME.size:end])
+            )
+            del buffer[:end]
+    if buffer:
+        raise ValueError(f'truncated history stream for `{name}`')
+    return hist
+
+
+def pack_json(series, markers, provenance=False):
+    """Encode a series and its markers (or provenance codes) as a json
+    object of `{stamp: {series, markers|provenance}}` (or `null` for
+    no series).
+    """
+    if series is None:
+        return 'null'
+    df = pd.DataFrame()
+    df['series'] = series
+    df['provenance' if provenance else 'markers'] = markers
+    return json.dumps(
+        {
+            k.isoformat(): v
+            for k, v in df.to_dict(orient='index').items()
+        },
+        ignore_nan=True
+    )
+
+
+def pack_tshpack(metadata, series, markers):
+    """Pack a series (with its internal metadata) and its markers with
+    the tshpack encoding.
+    """
+    return util.pack_many_series(
+        [
+            (metadata, series),
+            (util.series_metadata(markers), markers)
+        ]
+    )
+
+
+def pack_arrow(series, markers):
+    """Pack a series and its markers into an arrow ipc stream of one
+    record batch with `index`, `value` and `marker` (or `provenance`
+    for int8 provenance codes) columns.
+
+    The batch spans the markers index: the stamps the series does not
+    have (erased points) get a null value, so that they come back as
+    markers only, as with tshpack. Otherwise the index and values are
+    not copied (save for non-numeric values).
+    """
+    index = markers.index
+    values, absent = series.values, None
+    if not series.index.equals(index):
+        absent = ~index.isin(series.index)
+        values = series.reindex(index).values
+    tz = str(index.tz) if index.tz is not None else None
+    if markers.dtype == 'int8':
+        flags, flagsname = markers.values, 'provenance'
+    else:
+        flags, flagsname = markers.values.astype('bool', copy=False), 'marker'
+    batch = pa.RecordBatch.from_arrays(
+        [
+            pa.array(index.values, type=pa.timestamp('ns', tz=tz)),
+            pa.array(values, mask=absent),
+            pa.array(flags)
+        ],
+        names=['index', 'value', flagsname]
+    ).replace_schema_metadata({'name': series.name or ''})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def unpack_arrow(bytestream):
+    """Read back a series and its markers from an arrow ipc stream.
+
+    The arrays are copied out of the (read-only) stream buffers.
+    """
+    batch = pa.ipc.open_stream(bytestream).read_next_batch()
+    name = batch.schema.metadata[b'name'].decode('utf-8') or None
+    stamps = batch.column(0)
+    index = pd.DatetimeIndex(
+        stamps.to_numpy(zero_copy_only=False, writable=True)
+    )
+    if stamps.type.tz is not None:
+        index = index.tz_localize('UTC').tz_convert(stamps.type.tz)
+    values = batch.column(1)
+    series = pd.Series(
+        values.to_numpy(zero_copy_only=False, writable=True),
+        index=index,
+        name=name
+    )
+    if values.null_count:
+        # the erased points only have markers
+        series = series[values.is_valid().to_numpy(zero_copy_only=False)]
+    markers = pd.Series(
+        batch.column(2).to_numpy(zero_copy_only=False, writable=True),
+        index=index,
+        name=name
+    )
+    return series, markers
+
+
+def pack_frame(values, markers):
+    """Pack the aligned values and markers dataframes of
+    `edited_frame` with their shared index, in one zlib-compressed
+    binary string.
+    """
+    meta = {
+        'names': list(values.columns),
+        'tzaware': values.index.tz is not None
+    }
+    return zlib.compress(
+        util.nary_pack(
+            json.dumps(meta).encode('utf-8'),
+            values.index.values.view('int64').tobytes(),
+            np.ascontiguousarray(values.values).tobytes(),
+            np.ascontiguousarray(markers.values).tobytes()
+        )
+    )
+
+
+def unpack_frame(bytestream):
+    """Read back the values and markers dataframes packed by
+    `pack_frame`.
+    """
+    bmeta, bindex, bvalues, bmarkers = util.nary_unpack(
+        zlib.decompress(bytestream)
+    )
+    meta = json.loads(bmeta)
+    names = meta['names']
+    index = pd.DatetimeIndex(
+        np.frombuffer(bindex, 'int64').view('datetime64[ns]')
+    )
+    if meta['tzaware']:
+        index = index.tz_localize('UTC')
+    shape = (len(index), len(names))
+    # copies: the buffers are read-only
+    return (
+        pd.DataFrame(
+            np.frombuffer(bvalues, 'float64').reshape(shape).copy(),
+            index=index,
+            columns=names
+        ),
+        pd.DataFrame(
+            np.frombuffer(bmarkers, 'bool').reshape(shape).copy(),
+            index=index,
+            columns=names
+        )
+    )
+
+
+def edited_etag(tsh, cn, args, meta):
+    """Compute an etag for a supervision query out of the last
+    revisions of the edited and upstream series, their metadata (the
+    supervision status and tolerance change the markers) and the
+    query arguments.
+    """
+    revs = tsh.last_revisions(cn, args.name, _meta=meta)
+
+    key = json.dumps(
+        [
+            revs,
+            meta['internal_metadata'].get('supervision_status'),
+            meta['metadata'],
+            sorted(args.items())
+        ],
+        default=str,
+        sort_keys=True
+    )
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def cache_headers(response, etag):
+    # no answer is immutable (even a past revision can be stripped):
+    # the clients must revalidate
+    if etag is None:
+        return response
+    # the compressed representations are not byte-identical
+    response.set_etag(etag, weak='Content-Encoding' in response.headers)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def compressobj(encoding):
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor().compressobj()
+    assert encoding == 'gzip'
+    return zlib.compressobj(6, zlib.DEFLATED, 31)
+
+
+def compress_response(response):
+    """Compress the (in memory) response body with the best encoding
+    accepted by the client.
+
+    Small bodies are left untouched.
+    """
+    # the representation depends on the accepted encodings
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < COMPRESSION_THRESHOLD:
+        return response
+
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+    if encoding is None:
+        return response
+
+    compressor = compressobj(encoding)
+    response.set_data(compressor.compress(body) + compressor.flush())
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+# request instrumentation
+
+# phase -> elapsed seconds of the instrumented request, shared with
+# the threads it spawns (in copies of its context)
+TIMINGS = contextvars.ContextVar('timings', default=None)
+_TIMINGSLOCK = threading.Lock()
+# sql time spent by the current thread, for the exclusive phases
+_THREADSQL = threading.local()
+
+
+@contextmanager
+def timed(phase):
+    """Time a request phase, minus the sql statements the thread issues
+    meanwhile (accounted under `sql`): the phases do not overlap.
+    """
+    timings = TIMINGS.get()
+    if timings is None:
+        yield
+        return
+    sql0 = getattr(_THREADSQL, 'elapsed', 0.)
+    t0 = perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = perf_counter() - t0
+        elapsed -= getattr(_THREADSQL, 'elapsed', 0.) - sql0
+        with _TIMINGSLOCK:
+            timings[phase] = timings.get(phase, 0.) + elapsed
+
+
+def _sql_before(conn, cursor, statement, parameters, context, executemany):
+    if TIMINGS.get() is not None and context is not None:
+        # one start per execution: the threads of a request run theirs
+        # concurrently
+        context._sqlstart = perf_counter()
+
+
+def _sql_after(conn, cursor, statement, parameters, context, executemany):
+    timings = TIMINGS.get()
+    start = getattr(context, '_sqlstart', None)
+    if timings is None or start is None:
+        return
+    elapsed = perf_counter() - start
+    _THREADSQL.elapsed = getattr(_THREADSQL, 'elapsed', 0.) + elapsed
+    with _TIMINGSLOCK:
+        timings['sql'] = timings.get('sql', 0.) + elapsed
+        timings['_statements'] = timings.get('_statements', 0) + 1
+
+
+def watch_sql(engine):
+    """Account the sql statements of the instrumented requests."""
+    if not event.contains(engine, 'before_cursor_execute', _sql_before):
+        event.listen(engine, 'before_cursor_execute', _sql_before)
+        event.listen(engine, 'after_cursor_execute', _sql_after)
+
+
+def server_timing(timings, total):
+    """Format the timings as a `Server-Timing` header value."""
+    entries = [
+        f'{phase};dur={elapsed * 1000:.2f}'
+        for phase, elapsed in timings.items()
+        if not phase.startswith('_')
+    ]
+    entries.append(
+        f'statements;desc="{timings.get("_statements", 0)} sql statements"'
+    )
+    entries.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(entries)
+
+
+def log_slow(where, timings, total):
+    if total > SLOW_REQUEST_THRESHOLD:
+        path, args = where
+        L.warning(
+            'slow request %s %s: %.3fs, %s sql statements (%s)',
+            path,
+            args,
+            total,
+            timings.get('_statements', 0),
+            server_timing(timings, total)
+        )
+
+
+def accounted_body(ctx, body, where, timings, t0):
+    """Produce a streamed body within the request context `ctx`, then
+    log the request if it was slow.
+    """
+    body = iter(body)
+    try:
+        while True:
+            try:
+                chunk = ctx.run(next, body)
+            except StopIteration:
+                break
+            yield chunk
+    finally:
+        close = getattr(body, 'close', None)
+        if close is not None:
+            close()
+    log_slow(where, timings, perf_counter() - t0)
+
+
+def instrumented(func):
+    """Time the request phases (sql, series reconstruction, markers,
+    encoding), count its sql statements (including those of its
+    threads), expose them as a `Server-Timing` header and log the slow
+    requests.
+
+    A streamed body is produced once the headers are out: its share
+    only makes it to the slow requests log.
+    """
+    @wraps(func)
+    def wrapper(*a, **kw):
+        timings = {}
+        token = TIMINGS.set(timings)
+        hooktoken = PHASEHOOK.set(timed)
+        t0 = perf_counter()
+        try:
+            response = make_response(func(*a, **kw))
+            ctx = contextvars.copy_context()
+        finally:
+            PHASEHOOK.reset(hooktoken)
+            TIMINGS.reset(token)
+        where = request.path, request.values.to_dict(flat=False)
+        total = perf_counter() - t0
+        response.headers['Server-Timing'] = server_timing(timings, total)
+        if response.is_streamed:
+            response.response = accounted_body(
+                ctx, response.response, where, timings, t0
+            )
+        else:
+            log_slow(where, timings, total)
+        return response
+
+    return wrapper
+
 
 class supervision_httpapi(httpapi):
 
@@ -72,69 +695,366 @@ class supervision_httpapi(httpapi):
         tsa = self.tsa
         api = self.api
         nss = self.nss
+        if getattr(tsa, 'engine', None) is not None:
+            watch_sql(tsa.engine)
 
         @nss.route('/supervision')
         class series_supervision(Resource):
 
             @api.expect(edited)
+            @instrumented
             @onerror
             @required_roles('admin', 'rw', 'ro')
             def get(self):
                 args = edited.parse_args()
-                if not tsa.exists(args.name):
-                    api.abort(404, f'`{args.name}` does not exists')
-                if getattr(tsa, 'formula', False):
-                    if tsa.formula(args.name):
-                        api.abort(404, f'`{args.name}` is a formula')
-
-                series, markers = tsa.edited(
-                    args.name,
+                query = dict(
                     revision_date=args.insertion_date,
                     from_value_date=args.from_value_date,
                     to_value_date=args.to_value_date,
                     inferred_freq=args.get('inferred_freq'),
+                    max_points=args.max_points,
+                    resample=args.resample,
+                    provenance=args.provenance,
                     _keep_nans=args._keep_nans
                 )
-                metadata = tsa.internal_metadata(args.name)
+                # local series: everything within one transaction,
+                # out of one registry query
+                engine = readengine(tsa, args.name)
+                watch_sql(engine)
+                with engine.begin() as cn:
+                    meta = tsa.tsh.series_meta(cn, args.name)
+                    if meta is not None:
+                        etag = edited_etag(tsa.tsh, cn, args, meta)
+                        if request.if_none_match.contains_weak(etag):
+                            return cache_headers(
+                                make_response('', 304),
+                                etag
+                            )
+                        series, markers = tsa.tsh.get_ts_marker(
+                            cn, args.name, _meta=meta, **query
+                        )
+                        metadata = meta['internal_metadata']
+
+                if meta is None:
+                    # secondary source: we know nothing about the revisions
+                    if not tsa.exists(args.name):
+                        api.abort(404, f'`{args.name}` does not exists')
+                    if getattr(tsa, 'formula', False):
+                        if tsa.formula(args.name):
+                            api.abort(404, f'`{args.name}` is a formula')
+                    etag = None
+                    series, markers = tsa.edited(args.name, **query)
+                    metadata = tsa.internal_metadata(args.name)
+
                 if metadata['tzaware'] and args.tzone.upper() != 'UTC':
                     series.index = series.index.tz_convert(args.tzone)
                     markers.index = markers.index.tz_convert(args.tzone)
 
-                if args.format == 'json':
-                    if series is not None:
-                        df = pd.DataFrame()
-                        df['series'] = series
-                        df['markers'] = markers
-                        out = {
-                            k.isoformat(): v
-                            for k, v in df.to_dict(orient='index').items()
-                        }
+                with timed('encoding'):
+                    if args.format == 'json':
                         response = make_response(
-                            json.dumps(out, ignore_nan=True)
+                            pack_json(series, markers, args.provenance)
                         )
-                    else:
-                        response = make_response('null')
-                    response.headers['Content-Type'] = 'text/json'
+                        response.headers['Content-Type'] = 'text/json'
+                        response.status_code = 200
+                        return cache_headers(
+                            compress_response(response),
+                            etag
+                        )
+
+                    if args.format == 'arrow':
+                        if pa is None:
+                            api.abort(400, 'the arrow format is not available')
+                        response = make_response(
+                            pack_arrow(series, markers)
+                        )
+                        response.headers['Content-Type'] = (
+                            'application/vnd.apache.arrow.stream'
+                        )
+                        response.status_code = 200
+                        return cache_headers(
+                            compress_response(response),
+                            etag
+                        )
+
+                    # tshpack is already zlib-compressed
+                    assert args.format == 'tshpack'
+                    response = make_response(
+                        pack_tshpack(metadata, series, markers)
+                    )
+                    response.headers['Content-Type'] = 'application/octet-stream'
+                    response.status_code = 200
+                    return cache_headers(response, etag)
+
+
+        @nss.route('/supervision/revert')
+        class series_supervision_revert(Resource):
+
+            @api.expect(revert)
+            @instrumented
+            @onerror
+            @required_roles('admin', 'rw')
+            def put(self):
+                """revert the manual overrides of some series
+
+                The upstream values are put back in place of the
+                overrides (within the from/to value dates range if
+                given). The written points are returned per series.
+                """
+                args = revert.parse_args()
+                for name in args.name:
+                    if not tsa.exists(name):
+                        api.abort(404, f'`{name}` does not exists')
+
+                try:
+                    diffs = tsa.revert_overrides_many(
+                        args.name,
+                        args.author,
+                        from_value_date=args.from_value_date,
+                        to_value_date=args.to_value_date,
+                        insertion_date=args.insertion_date
+                    )
+                except ValueError as err:
+                    if err.args[0].startswith('not allowed to'):
+                        api.abort(405, err.args[0])
+                    raise
+
+                return diffs_response(args.format, diffs)
+
+        @nss.route('/supervision/manual')
+        class series_supervision_manual(Resource):
+
+            def _apply(self):
+                args = manual.parse_args()
+                edits = {
+                    series.name: series
+                    for series in util.unpack_many_series(
+                        args.bseries.stream.read()
+                    )
+                }
+                try:
+                    diffs = tsa.update_manual_many(
+                        edits,
+                        args.author,
+                        insertion_date=args.insertion_date,
+                        dryrun=args.dryrun,
+                        # all or nothing
+                        batchsize=max(len(edits), 1)
+                    )
+                except ValueError as err:
+                    if err.args[0].startswith('not allowed to'):
+                        api.abort(405, err.args[0])
+                    raise
+
+                for name, diff in diffs.items():
+                    if diff is None:
+                        # nothing happened
+                        diffs[name] = util.empty_series(
+                            edits[name].index.tz is not None,
+                            dtype=edits[name].dtype
+                        )
+                return diffs_response(args.format, diffs)
+
+            @api.expect(manual)
+            @instrumented
+            @onerror
+            @required_roles('admin', 'rw')
+            def patch(self):
+                """apply manual edits to many series at once
+
+                The edits come as a tshpack bundle of series and are
+                applied within one transaction. The diffs are returned
+                per series.
+                """
+                return self._apply()
+
+            @api.expect(manual)
+            @instrumented
+            @onerror
+            @required_roles('admin', 'rw')
+            def post(self):
+                """apply manual edits to many series at once (same as
+                patch)
+                """
+                return self._apply()
+
+        @nss.route('/supervision/upstream')
+        class series_supervision_upstream(Resource):
+
+            @api.expect(upstream)
+            @instrumented
+            @onerror
+            @required_roles('admin', 'rw', 'ro')
+            def get(self):
+                """get the upstream (provider) values of a series"""
+                args = upstream.parse_args()
+                if not tsa.exists(args.name):
+                    api.abort(404, f'`{args.name}` does not exists')
+
+                series = tsa.upstream(
+                    args.name,
+                    revision_date=args.insertion_date,
+                    from_value_date=args.from_value_date,
+                    to_value_date=args.to_value_date
+                )
+                if args.format == 'tshpack':
+                    # tshpack is already zlib-compressed
+                    return series_response(
+                        args.format, series,
+                        util.series_metadata(series), 200
+                    )
+                return compress_response(
+                    series_response(args.format, series, None, 200)
+                )
+
+        @nss.route('/supervision/upstream/insertion_dates')
+        class series_supervision_upstream_idates(Resource):
+
+            @api.expect(upstream_idates)
+            @instrumented
+            @onerror
+            @required_roles('admin', 'rw', 'ro')
+            def get(self):
+                """get the insertion dates of the upstream revisions"""
+                args = upstream_idates.parse_args()
+                if not tsa.exists(args.name):
+                    api.abort(404, f'`{args.name}` does not exists')
+
+                idates = tsa.upstream_insertion_dates(
+                    args.name,
+                    from_insertion_date=args.from_insertion_date,
+                    to_insertion_date=args.to_insertion_date,
+                    from_value_date=args.from_value_date,
+                    to_value_date=args.to_value_date
+                )
+                response = make_response({
+                    'insertion_dates': [dt.isoformat() for dt in idates]
+                })
+                response.headers['Content-Type'] = 'text/json'
+                return response
+
+        @nss.route('/supervision/upstream/history')
+        class series_supervision_upstream_history(Resource):
+
+            @api.expect(upstream_history)
+            @instrumented
+            @onerror
+            @required_roles('admin', 'rw', 'ro')
+            def get(self):
+                """get the upstream revisions of a series
+
+                The tshpack format streams the revisions one by one.
+                """
+                args = upstream_history.parse_args()
+                if not tsa.exists(args.name):
+                    api.abort(404, f'`{args.name}` does not exists')
+
+                if args.format == 'tshpack':
+                    idates = tsa.upstream_insertion_dates(
+                        args.name,
+                        from_insertion_date=args.from_insertion_date,
+                        to_insertion_date=args.to_insertion_date,
+                        from_value_date=args.from_value_date,
+                        to_value_date=args.to_value_date
+                    )
+                    response = make_response(
+                        stream_history(
+                            tsa, args.name, idates or [],
+                            from_value_date=args.from_value_date,
+                            to_value_date=args.to_value_date
+                        )
+                    )
+                    response.headers['Content-Type'] = 'application/octet-stream'
                     response.status_code = 200
                     return response
 
-                assert args.format == 'tshpack'
-                markersmeta = util.series_metadata(markers)
+                hist = tsa.upstream_history(
+                    args.name,
+                    from_insertion_date=args.from_insertion_date,
+                    to_insertion_date=args.to_insertion_date,
+                    from_value_date=args.from_value_date,
+                    to_value_date=args.to_value_date
+                )
+                if args.format == 'json':
+                    response = make_response(
+                        json.dumps({
+                            idate.isoformat(): {
+                                stamp.isoformat(): value
+                                for stamp, value in series.items()
+                            }
+                            for idate, series in hist.items()
+                        }, ignore_nan=True)
+                    )
+                    response.headers['Content-Type'] = 'text/json'
+                    response.status_code = 200
+                    return compress_response(response)
+
+        @nss.route('/supervision/frame')
+        class series_supervision_frame(Resource):
+
+            @api.expect(frame)
+            @instrumented
+            @onerror
+            @required_roles('admin', 'rw', 'ro')
+            def get(self):
+                """get the edited values and markers of many series as
+                two aligned frames (packed)
+                """
+                args = frame.parse_args()
+                try:
+                    values, markers = tsa.edited_frame(
+                        args.name,
+                        revision_date=args.insertion_date,
+                        from_value_date=args.from_value_date,
+                        to_value_date=args.to_value_date
+                    )
+                except ValueError as err:
+                    api.abort(400, err.args[0])
+
+                response = make_response(pack_frame(values, markers))
+                response.headers['Content-Type'] = 'application/octet-stream'
+                response.status_code = 200
+                return response
+
+        @nss.route('/supervision/overrides')
+        class series_supervision_overrides(Resource):
+
+            @api.expect(overrides)
+            @instrumented
+            @onerror
+            @required_roles('admin', 'rw', 'ro')
+            def get(self):
+                """stream the manual overrides of the supervised series
+
+                The output is csv with `name`, `value_date` and
+                `value` columns.
+                """
+                args = overrides.parse_args()
+                with readengine(tsa).begin() as cn:
+                    names = tsa.tsh.supervised_series(cn, args.name)
                 response = make_response(
-                    util.pack_many_series(
-                        [
-                            (metadata, series),
-                            (markersmeta, markers)
-                        ]
+                    stream_overrides(
+                        tsa, names,
+                        from_value_date=args.from_value_date,
+                        to_value_date=args.to_value_date,
+                        revision_date=args.insertion_date
                     )
                 )
-                response.headers['Content-Type'] = 'application/octet-stream'
+                response.headers['Content-Type'] = 'text/csv'
                 response.status_code = 200
                 return response
 
 
 class supervision_httpclient(httpclient):
     index = 0.5
+    editedcache_size = 256
+    # transport format of `edited` (tshpack or arrow)
+    editedformat = 'tshpack'
+
+    def __init__(self, uri):
+        super().__init__(uri)
+        # query args -> (etag, series, markers)
+        self._editedcache = OrderedDict()
 
     def __repr__(self):
         return f"tshistory-supervision-http-client(uri='{self.uri}')"
@@ -145,12 +1065,21 @@ class supervision_httpclient(httpclient):
                from_value_date=None,
                to_value_date=None,
                inferred_freq=False,
+               max_points=None,
+               resample=None,
+               provenance=False,
                _keep_nans=False):
         args = {
             'name': name,
             '_keep_nans': json.dumps(_keep_nans),
-            'format': 'tshpack',
+            'format': self.editedformat,
         }
+        if max_points:
+            args['max_points'] = max_points
+        if resample:
+            args['resample'] = resample
+        if provenance:
+            args['provenance'] = json.dumps(provenance)
         if revision_date:
             args['insertion_date'] = strft(revision_date)
         if from_value_date:
@@ -159,17 +1088,269 @@ class supervision_httpclient(httpclient):
             args['to_value_date'] = strft(to_value_date)
         if inferred_freq:
             args['inferred_freq'] = inferred_freq
+        key = tuple(sorted(args.items()))
+        cached = self._editedcache.get(key)
+        headers = {}
+        if cached:
+            headers['If-None-Match'] = cached[0]
+
         res = self.session.get(
-            f'{self.uri}/series/supervision', params=args
+            f'{self.uri}/series/supervision',
+            params=args,
+            headers=headers
         )
         if res.status_code == 404:
             return None
+        if res.status_code == 304:
+            self._editedcache.move_to_end(key)
+            _, series, markers = cached
+            return series.copy(), markers.copy()
         if res.status_code == 200:
-            series, markers = util.unpack_many_series(res.content)
+            if self.editedformat == 'arrow':
+                series, markers = unpack_arrow(res.content)
+            else:
+                series, markers = util.unpack_many_series(res.content)
+            etag = res.headers.get('ETag')
+            if etag:
+                self._editedcache[key] = etag, series.copy(), markers.copy()
+                if len(self._editedcache) > self.editedcache_size:
+                    self._editedcache.popitem(last=False)
             return series, markers
 
         return res
 
+    @unwraperror
+    def edited_frame(self, names,
+                     revision_date=None,
+                     from_value_date=None,
+                     to_value_date=None):
+        args = {
+            'name': names
+        }
+        if revision_date:
+            args['insertion_date'] = strft(revision_date)
+        if from_value_date:
+            args['from_value_date'] = strft(from_value_date)
+        if to_value_date:
+            args['to_value_date'] = strft(to_value_date)
+        res = self.session.get(
+            f'{self.uri}/series/supervision/frame', params=args
+        )
+        if res.status_code == 400:
+            raise ValueError(res.json()['message'])
+        if res.status_code == 200:
+            return unpack_frame(res.content)
+
+        return res
+
+    @unwraperror
+    def revert_overrides(self, name, author,
+                         from_value_date=None,
+                         to_value_date=None,
+                         insertion_date=None):
+        res = self.revert_overrides_many(
+            [name], author,
+            from_value_date=from_value_date,
+            to_value_date=to_value_date,
+            insertion_date=insertion_date
+        )
+        if isinstance(res, dict):
+            return res.get(name)
+        return res
+
+    @unwraperror
+    def update_manual_many(self, serieslist, author,
+                           insertion_date=None,
+                           dryrun=False):
+        # one request, hence one transaction: all or nothing
+        bundle = []
+        for name, series in serieslist.items():
+            util.guard_insert(series, name, author, None, insertion_date)
+            series = series.copy()
+            series.name = name
+            bundle.append((util.series_metadata(series), series))
+        args = {
+            'author': author,
+            'dryrun': dryrun,
+            'format': 'tshpack'
+        }
+        if insertion_date:
+            args['insertion_date'] = strft(insertion_date)
+        res = self.session.patch(
+            f'{self.uri}/series/supervision/manual',
+            data=args,
+            files={
+                'bseries': util.pack_many_series(bundle)
+            }
+        )
+        if res.status_code == 405:
+            raise ValueError(res.json()['message'])
+        if res.status_code == 200:
+            return {
+                diff.name: diff
+                for diff in util.unpack_many_series(res.content)
+            }
+
+        return res
+
+    @unwraperror
+    def revert_overrides_many(self, names, author,
+                              from_value_date=None,
+                              to_value_date=None,
+                              insertion_date=None):
+        args = {
+            'name': names,
+            'author': author,
+            'format': 'tshpack'
+        }
+        if from_value_date:
+            args['from_value_date'] = strft(from_value_date)
+        if to_value_date:
+            args['to_value_date'] = strft(to_value_date)
+        if insertion_date:
+            args['insertion_date'] = strft(insertion_date)
+        res = self.session.put(
+            f'{self.uri}/series/supervision/revert', data=args
+        )
+        if res.status_code == 405:
+            raise ValueError(res.json()['message'])
+        if res.status_code == 404:
+            return {}
+        if res.status_code == 200:
+            return {
+                diff.name: diff
+                for diff in util.unpack_many_series(res.content)
+            }
+
+        return res
+
+    @unwraperror
+    def overrides_many(self, names=None,
+                       from_value_date=None,
+                       to_value_date=None,
+                       revision_date=None):
+        args = {}
+        if names is not None:
+            if not names:
+                return pd.DataFrame(columns=['name', 'value_date', 'value'])
+            args['name'] = names
+        if from_value_date:
+            args['from_value_date'] = strft(from_value_date)
+        if to_value_date:
+            args['to_value_date'] = strft(to_value_date)
+        if revision_date:
+            args['insertion_date'] = strft(revision_date)
+        res = self.session.get(
+            f'{self.uri}/series/supervision/overrides',
+            params=args,
+            stream=True
+        )
+        if res.status_code == 200:
+            # parse the csv as it comes
+            res.raw.decode_content = True
+            frame = pd.read_csv(res.raw, dtype={'name': str})
+            frame['value_date'] = pd.to_datetime(
+                frame['value_date'], utc=True
+            )
+            return frame
+
+        return res
+
+    @unwraperror
+    def upstream(self, name,
+                 revision_date=None,
+                 from_value_date=None,
+                 to_value_date=None):
+        args = {
+            'name': name,
+            'format': 'tshpack'
+        }
+        if revision_date:
+            args['insertion_date'] = strft(revision_date)
+        if from_value_date:
+            args['from_value_date'] = strft(from_value_date)
+        if to_value_date:
+            args['to_value_date'] = strft(to_value_date)
+        res = self.session.get(
+            f'{self.uri}/series/supervision/upstream', params=args
+        )
+        if res.status_code == 404:
+            return None
+        if res.status_code == 200:
+            return util.unpack_series(name, res.content)
+
+        return res
+
+    def _upstream_args(self, name,
+                       from_insertion_date,
+                       to_insertion_date,
+                       from_value_date,
+                       to_value_date):
+        args = {'name': name}
+        if from_insertion_date:
+            args['from_insertion_date'] = strft(from_insertion_date)
+        if to_insertion_date:
+            args['to_insertion_date'] = strft(to_insertion_date)
+        if from_value_date:
+            args['from_value_date'] = strft(from_value_date)
+        if to_value_date:
+            args['to_value_date'] = strft(to_value_date)
+        return args
+
+    @unwraperror
+    def upstream_insertion_dates(self, name,
+                                 from_insertion_date=None,
+                                 to_insertion_date=None,
+                                 from_value_date=None,
+                                 to_value_date=None):
+        res = self.session.get(
+            f'{self.uri}/series/supervision/upstream/insertion_dates',
+            params=self._upstream_args(
+                name,
+                from_insertion_date,
+                to_insertion_date,
+                from_value_date,
+                to_value_date
+            )
+        )
+        if res.status_code == 404:
+            return None
+        if res.status_code == 200:
+            return [
+                pd.Timestamp(t).tz_convert('UTC')
+                for t in res.json()['insertion_dates']
+            ]
+
+        return res
+
+    @unwraperror
+    def upstream_history(self, name,
+                         from_insertion_date=None,
+                         to_insertion_date=None,
+                         from_value_date=None,
+                         to_value_date=None):
+        args = self._upstream_args(
+            name,
+            from_insertion_date,
+            to_insertion_date,
+            from_value_date,
+            to_value_date
+        )
+        args['format'] = 'tshpack'
+        res = self.session.get(
+            f'{self.uri}/series/supervision/upstream/history',
+            params=args,
+            stream=True
+        )
+        if res.status_code == 404:
+            return None
+        if res.status_code == 200:
+            return unpack_history_stream(
+                name, res.iter_content(HISTORY_CHUNK)
+            )
+
+        return res
+
     @unwraperror
     def supervision_status(self, name):
         meta = self.internal_metadata(name)
@@ -4,7 +4,8 @@ import responses
 
 from tshistory.testutil import (
     read_request_bridge,
-    with_http_bridge as basebridge
+    with_http_bridge as basebridge,
+    write_request_bridge
 )
 
 
@@ -17,3 +18,38 @@ class with_http_bridge(basebridge):
             responses.GET, uri + '/series/supervision',
             callback=partial(read_request_bridge, wsgitester)
         )
+
+        resp.add_callback(
+            responses.GET, uri + '/series/supervision/frame',
+            callback=partial(read_request_bridge, wsgitester)
+        )
+
+        resp.add_callback(
+            responses.GET, uri + '/series/supervision/overrides',
+            callback=partial(read_request_bridge, wsgitester)
+        )
+
+        resp.add_callback(
+            responses.GET, uri + '/series/supervision/upstream',
+            callback=partial(read_request_bridge, wsgitester)
+        )
+
+        resp.add_callback(
+            responses.GET, uri + '/series/supervision/upstream/insertion_dates',
+            callback=partial(read_request_bridge, wsgitester)
+        )
+
+        resp.add_callback(
+            responses.GET, uri + '/series/supervision/upstream/history',
+            callback=partial(read_request_bridge, wsgitester)
+        )
+
+        resp.add_callback(
+            responses.PUT, uri + '/series/supervision/revert',
+            callback=write_request_bridge(wsgitester.put)
+        )
+
+        resp.add_callback(
+            responses.PATCH, uri + '/series/supervision/manual',
+            callback=write_request_bridge(wsgitester.patch)
+        )
@@ -1,16 +1,47 @@
+from collections import Counter
+from contextlib import contextmanager
+import contextvars
+import logging
+from time import monotonic
+import weakref
+
 import pandas as pd
 import numpy as np
 
+from sqlalchemy import event
+from sqlalchemy.engine import Connection
+from sqlhelp import select
 from tshistory.util import (
     diff,
+    empty_series,
+    guard_insert,
     tx,
     with_inferred_freq
 )
+from tshistory.storage import Postgres
 from tshistory.tsio import timeseries as basets
 
 from tshistory_supervision import api  # noqa
 
 
+L = logging.getLogger('tshistory_supervision.tsio')
+
+# the observer of the edition phases (series reconstruction, markers
+# building) of the current context, e.g. the http request timings: a
+# `phase name -> context manager` callable
+PHASEHOOK = contextvars.ContextVar('phasehook', default=None)
+
+
+@contextmanager
+def phase(name):
+    hook = PHASEHOOK.get()
+    if hook is None:
+        yield
+        return
+    with hook(name):
+        yield
+
+
 def join_index(ts1, ts2):
     if ts1 is None and ts2 is None:
         return None
@@ -38,7 +69,505 @@ def fill_markers(markers):
     return markers
 
 
-class timeseries(basets):
+def index_date(stamp, tzaware):
+    """ coerce a value date to the index convention of a series (utc
+    tz-aware or naive utc)
+    """
+    stamp = pd.Timestamp(stamp)
+    if tzaware:
+        return stamp.tz_localize('UTC') if stamp.tz is None else stamp
+    if stamp.tz is not None:
+        return stamp.tz_convert('UTC').tz_localize(None)
+    return stamp
+
+
+# provenance codes of the edited series points
+UPSTREAM, MANUAL, INFERRED, ERASED = range(4)
+PROVENANCE = ('upstream', 'manual', 'inferred', 'erased')
+
+
+def provenance_codes(edited, markers):
+    """ turn the (possibly inferred-freq extended) markers into an int8
+    series of provenance codes: the erased points of the `edited`
+    series and the points created by the infer-freq option get their
+    own code, on top of the upstream/manual distinction
+    """
+    flags = markers.values
+    codes = np.where(flags == True, MANUAL, UPSTREAM).astype('int8')  # noqa: E712
+    codes[edited.reindex(markers.index).isna().values] = ERASED
+    codes[pd.isna(flags)] = INFERRED
+    return pd.Series(codes, index=markers.index, name=edited.name)
+
+
+def within_tolerance(refvalues, values, atol=0., rtol=0.):
+    """ vectorized closeness test, nans (e.g. missing reference
+    points or erasures) are never within tolerance
+    """
+    with np.errstate(invalid='ignore'):
+        return np.abs(values - refvalues) <= atol + rtol * np.abs(refvalues)
+
+
+def denoise(ref, ts, atol=0., rtol=0.):
+    """ align the values of `ts` on those of `ref` wherever they are
+    within tolerance, so that diffing will not see them
+
+    Returns the (possibly) new series and the number of
+    aligned points.
+    """
+    if ref is None or not len(ref) or ts.dtype != 'float64':
+        return ts, 0
+
+    refvalues = ref.reindex(ts.index).values
+    mask = within_tolerance(refvalues, ts.values, atol, rtol)
+    count = int(mask.sum())
+    if not count:
+        return ts, 0
+
+    values = ts.values.copy()
+    values[mask] = refvalues[mask]
+    return pd.Series(values, index=ts.index, name=ts.name), count
+
+
+def manual_diff(upstream, edited, atol=0., rtol=0.):
+    """ compute the manual overrides as the diff from upstream to
+    edited, ignoring the points within tolerance and the erasures of
+    points unknown to upstream
+
+    Such an erasure leaves the edited series in agreement with
+    upstream (no value on both sides), e.g. after the revert of a
+    point that only existed as a manual edit.
+    """
+    manual = diff(upstream, edited)
+    if upstream is None or manual is None or not len(manual):
+        return manual
+
+    mask = manual.isna().values & ~manual.index.isin(upstream.index)
+    if (atol or rtol) and manual.dtype == 'float64':
+        mask |= within_tolerance(
+            upstream.reindex(manual.index).values,
+            manual.values,
+            atol,
+            rtol
+        )
+    if not mask.any():
+        return manual
+    return manual[~mask]
+
+
+def manual_markers(status, edited, upstream, atol=0., rtol=0.):
+    """ compute the raw markers of the `edited` series (nans kept)
+
+    They span the edited index for the unsupervised (all False) and
+    handcrafted (all True) series, and the union of the edited and
+    upstream indexes for the supervised ones (True for the manual
+    overrides) -- or are None when both series are empty.
+    """
+    if status != 'supervised':
+        flags = pd.Series(
+            [status == 'handcrafted'] * len(edited.index),
+            index=edited.index,
+            dtype=np.dtype('bool')
+        )
+        flags.name = edited.name
+        return flags
+
+    unionindex = join_index(upstream, edited)
+    if unionindex is None:
+        return None
+
+    manual = manual_diff(upstream, edited, atol, rtol)
+    mask_manual = pd.Series(
+        [False] * len(unionindex),
+        index=unionindex,
+        dtype='object'
+    )
+    if manual is not None:
+        mask_manual[manual.index] = True
+        mask_manual.name = edited.name
+    return mask_manual
+
+
+def minmax_positions(values, buckets):
+    """ returns the positions of the min and max values of each bucket
+    (the buckets codes being sorted)
+    """
+    # within each bucket, sort by value: the min and max come first
+    # and last
+    order = np.lexsort((values, buckets))
+    starts = np.flatnonzero(np.diff(buckets, prepend=-1))
+    ends = np.append(starts[1:], len(buckets)) - 1
+    return np.union1d(order[starts], order[ends])
+
+
+def downsample(series, markers, max_points=None, resample=None):
+    """ reduce a series to the min and max points of its buckets
+
+    The buckets are either of the `resample` frequency (e.g. `1D`)
+    or made to yield about `max_points` points (or both, in that
+    order). The manual overrides (per the markers) are always kept,
+    unless everything is marked (handcrafted series).
+
+    Returns the downsampled series and markers.
+    """
+    if series is None or series.dtype != 'float64':
+        return series, markers
+
+    valid = np.flatnonzero(~np.isnan(series.values))
+    positions = valid
+    if resample and len(positions):
+        buckets = pd.Series(
+            positions, index=series.index[positions]
+        ).groupby(pd.Grouper(freq=resample)).ngroup().values
+        positions = positions[
+            minmax_positions(series.values[positions], buckets)
+        ]
+    if max_points and len(positions) > max_points:
+        nbuckets = max(max_points // 2, 1)
+        buckets = np.arange(len(positions)) * nbuckets // len(positions)
+        positions = positions[
+            minmax_positions(series.values[positions], buckets)
+        ]
+    if len(positions) == len(valid):
+        return series, markers
+
+    keep = series.index[positions]
+    if markers.dtype == 'int8':
+        # provenance codes
+        flags = markers.values == MANUAL
+    else:
+        flags = markers.values.astype('bool', copy=False)
+    if not flags.all():
+        keep = keep.union(markers.index[flags])
+    return (
+        series[series.index.isin(keep)],
+        markers[markers.index.isin(keep)]
+    )
+
+
+def aligned_frames(names, parts):
+    """ build the values and markers dataframes of many (numeric)
+    series on their union index
+
+    `parts` maps the names to their (series, markers) pair. The
+    frames are filled column by column from the series arrays.
+    """
+    pairs = [parts.get(name, (None, None)) for name in names]
+    present = [ts for ts, _ in pairs if ts is not None]
+    for name, (ts, _) in zip(names, pairs):
+        if ts is not None and ts.dtype != 'float64':
+            raise ValueError(f'`{name}` is not a numeric series')
+    if len({ts.index.tz is None for ts in present}) > 1:
+        raise ValueError('cannot align tz-aware and tz-naive series')
+
+    if present:
+        stamps = np.unique(
+            np.concatenate([ts.index.values for ts in present])
+        )
+    else:
+        stamps = np.array([], dtype='datetime64[ns]')
+    values = np.full((len(stamps), len(names)), np.nan)
+    flags = np.zeros((len(stamps), len(names)), dtype='bool')
+    for col, (ts, markers) in enumerate(pairs):
+        if ts is None or not len(ts):
+            continue
+        values[np.searchsorted(stamps, ts.index.values), col] = ts.values
+        # the markers may hold erased points the series don't have
+        mstamps = markers.index.values
+        pos = np.searchsorted(stamps, mstamps).clip(max=len(stamps) - 1)
+        known = stamps[pos] == mstamps
+        flags[pos[known], col] = markers.values[known].astype('bool')
+
+    index = pd.DatetimeIndex(stamps)
+    if any(ts.index.tz is not None for ts in present):
+        index = index.tz_localize('UTC')
+    return (
+        pd.DataFrame(values, index=index, columns=names),
+        pd.DataFrame(flags, index=index, columns=names)
+    )
+
+
+def last_revision(tsh, cn, name, tablename=None):
+    # NOTE: we don't use `_series_to_tablename` since its cache
+    # does not discriminate the edited and upstream namespaces
+    if tablename is None:
+        tablename = cn.execute(
+            f'select internal_metadata->>\'tablename\' '
+            f'from "{tsh.namespace}".registry '
+            'where name = %(name)s',
+            name=name
+        ).scalar()
+    if tablename is None:
+        return None
+    row = cn.execute(
+        f'select id, insertion_date '
+        f'from "{tsh.namespace}.revision"."{tablename}" '
+        'order by id desc limit 1'
+    ).fetchone()
+    if row is None:
+        return None
+    return row.id, pd.Timestamp(row.insertion_date).astimezone('UTC')
+
+
+# number of series per revision stats query
+STATS_BATCH = 200
+
+# seconds during which the reads of a freshly written series stay
+# pinned to the primary database (replication lag allowance)
+READ_YOUR_WRITES_DELAY = 5
+
+# max number of series whose suppressed noisy points are counted
+SUPPRESSED_SIZE = 1000
+
+# connection -> (timeseries, name) pairs written by its transaction
+_WRITES = weakref.WeakKeyDictionary()
+
+
+def _stamp_writes(cn):
+    now = monotonic()
+    for tsh, name in _WRITES.pop(cn, ()):
+        tsh._stamp_write(name, now)
+
+
+def _forget_writes(cn):
+    _WRITES.pop(cn, None)
+
+
+def revision_stats(tsh, cn, names=None):
+    """ returns a mapping from series name to (supervision status,
+    revisions count, manual revisions count, last manual insertion
+    date) using aggregate queries over the revision tables
+    """
+    q = select(
+        'name',
+        "internal_metadata->>'tablename'",
+        "internal_metadata->>'supervision_status'"
+    ).table(
+        f'"{tsh.namespace}".registry'
+    )
+    if names is not None:
+        if not names:
+            return {}
+        q.where('name in %(names)s', names=tuple(names))
+    registry = q.do(cn).fetchall()
+
+    status = {
+        name: status or 'unsupervised'
+        for name, _tablename, status in registry
+    }
+    stats = {}
+    for start in range(0, len(registry), STATS_BATCH):
+        queries = []
+        kw = {'edited': '{"edited": true}'}
+        for idx, (name, tablename, _status) in enumerate(
+                registry[start:start + STATS_BATCH]):
+            kw[f'name{idx}'] = name
+            queries.append(
+                f'select %(name{idx})s as name, '
+                'count(*) as revisions, '
+                'count(*) filter (where metadata @> %(edited)s) as manual, '
+                'max(insertion_date) filter '
+                '  (where metadata @> %(edited)s) as lastmanual '
+                f'from "{tsh.namespace}.revision"."{tablename}"'
+            )
+        for row in cn.execute(' union all '.join(queries), **kw).fetchall():
+            lastmanual = row.lastmanual
+            if lastmanual is not None:
+                lastmanual = pd.Timestamp(lastmanual).astimezone('UTC')
+            stats[row.name] = (
+                status[row.name], row.revisions, row.manual, lastmanual
+            )
+    return stats
+
+
+def upstream_revision_counts(tsh, cn, names):
+    """ returns a mapping from supervised series name to its upstream
+    revisions count, as `upstream_history` sees them: the copy of the
+    edited series taken at the first manual edit is not one of them,
+    the edited revisions made before it are
+    """
+    if not names:
+        return {}
+    registry = cn.execute(
+        "select edited.name, "
+        "       edited.internal_metadata->>'tablename', "
+        "       upstream.internal_metadata->>'tablename' "
+        f'from "{tsh.namespace}".registry as edited '
+        f'join "{tsh.upstream.namespace}".registry as upstream '
+        '  on upstream.name = edited.name '
+        'where edited.name in %(names)s',
+        names=tuple(names)
+    ).fetchall()
+
+    counts = {}
+    for start in range(0, len(registry), STATS_BATCH):
+        queries = []
+        kw = {'edited': '{"edited": true}'}
+        for idx, (name, tablename, uptablename) in enumerate(
+                registry[start:start + STATS_BATCH]):
+            kw[f'name{idx}'] = name
+            edited = f'"{tsh.namespace}.revision"."{tablename}"'
+            upstream = f'"{tsh.upstream.namespace}.revision"."{uptablename}"'
+            queries.append(
+                f'select %(name{idx})s as name, '
+                f' (select count(*) from {upstream}) as revisions, '
+                f' origin.insertion_date as origin, '
+                f' (select count(*) from {edited} '
+                '   where insertion_date < origin.insertion_date) as before '
+                'from (select 1) as one '
+                'left join ('
+                f' select insertion_date from {upstream} '
+                f' where id = (select min(id) from {upstream}) '
+                '   and metadata @> %(edited)s'
+                ') as origin on true'
+            )
+        for row in cn.execute(' union all '.join(queries), **kw).fetchall():
+            if row.origin is None:
+                counts[row.name] = row.revisions
+            else:
+                counts[row.name] = row.revisions - 1 + row.before
+    return counts
+
+
+class windowedstorage(Postgres):
+    """ snapshot storage only fetching the chunks overlapping the
+    value dates window of a read
+
+    The base storage walks the chunks chain from its head (the most
+    recent value dates) with their payloads, hence reading the start
+    of a long series loads all of it.
+    """
+    __slots__ = ()
+
+    windowsql = """
+        with recursive allchunks as (
+            select chunks.id as cid,
+                   chunks.parent as parent,
+                   chunks.cstart as cstart,
+                   0 as depth
+            from "{namespace}"."{table}" as chunks
+            where chunks.id = %(head)s
+          union
+            select chunks.id as cid,
+                   chunks.parent as parent,
+                   chunks.cstart as cstart,
+                   allchunks.depth + 1 as depth
+            from "{namespace}"."{table}" as chunks
+            join allchunks on chunks.id = allchunks.parent
+            {where}
+        )
+        select allchunks.cid, allchunks.parent, chunks.chunk
+        from allchunks
+        join "{namespace}"."{table}" as chunks on chunks.id = allchunks.cid
+        where allchunks.cstart <= %(end)s
+        order by allchunks.depth desc
+    """
+
+    def chunk(self, head, from_value_date=None, to_value_date=None):
+        if to_value_date is None:
+            return super().chunk(head, from_value_date, to_value_date)
+
+        where = ''
+        if from_value_date:
+            where = 'where chunks.cend >= %(start)s '
+        sql = self.windowsql.format(
+            namespace=f'{self.tsh.namespace}.snapshot',
+            table=self.tablename,
+            where=where
+        )
+        chunks = self.cn.execute(
+            sql,
+            head=head,
+            start=from_value_date,
+            end=to_value_date
+        ).fetchall()
+        if not chunks:
+            meta = self.tsh.internal_metadata(self.cn, self.name)
+            return empty_series(
+                meta['tzaware'],
+                dtype=meta['value_dtype'],
+                name=self.name
+            )
+        snapdata = self._chunks_to_ts(raw[2] for raw in chunks)
+        return snapdata.loc[from_value_date:to_value_date]
+
+
+# root transaction -> {(namespace, name): preloaded metadata}
+_PRELOADED = weakref.WeakKeyDictionary()
+
+
+def preloads(cn):
+    """ returns the metadata preloaded into the transaction of `cn`
+    (a throw-away dict outside of a transaction)
+    """
+    if not isinstance(cn, Connection) or cn.get_transaction() is None:
+        return {}
+    return _PRELOADED.setdefault(cn.get_transaction(), {})
+
+
+class preloaded:
+    """Serve the registry lookups of a series (table name, internal
+    metadata) from the metadata preloaded into the transaction by
+    `timeseries.series_meta`.
+
+    The base class cache does not survive from one call to the next,
+    this one lives as long as the transaction, and is forgotten on
+    every registry write.
+    """
+
+    def _preloaded(self, cn, name):
+        return preloads(cn).get((self.namespace, name))
+
+    def _forget(self, cn):
+        preloads(cn).clear()
+
+    @tx
+    def update_internal_metadata(self, cn, name, metadata):
+        self._forget(cn)
+        return super().update_internal_metadata(cn, name, metadata)
+
+    @tx
+    def update_metadata(self, cn, name, metadata):
+        self._forget(cn)
+        return super().update_metadata(cn, name, metadata)
+
+    @tx
+    def replace_metadata(self, cn, name, metadata):
+        self._forget(cn)
+        return super().replace_metadata(cn, name, metadata)
+
+    @tx
+    def rename(self, cn, oldname, newname, propagate=True):
+        self._forget(cn)
+        return super().rename(cn, oldname, newname, propagate=propagate)
+
+    @tx
+    def delete(self, cn, name):
+        self._forget(cn)
+        return super().delete(cn, name)
+
+    @tx
+    def strip(self, cn, name, csid):
+        self._forget(cn)
+        return super().strip(cn, name, csid)
+
+    def _series_to_tablename(self, cn, name):
+        meta = self._preloaded(cn, name)
+        if meta is not None:
+            return meta['internal_metadata']['tablename']
+        return super()._series_to_tablename(cn, name)
+
+    def internal_metadata(self, cn, name):
+        meta = self._preloaded(cn, name)
+        if meta is not None:
+            return meta['internal_metadata']
+        return super().internal_metadata(cn, name)
+
+
+class upstreamts(preloaded, basets):
+    storageclass = windowedstorage
+
+
+class timeseries(preloaded, basets):
     """This class refines the base `tshistory.timeseries` by adding a
     specific workflow on top of it.
 
@@ -73,6 +602,7 @@ class timeseries(basets):
 
     """
     index = 1
+    storageclass = windowedstorage
     metakeys = {
         'tzaware',
         'index_type',
@@ -86,14 +616,144 @@ class timeseries(basets):
 
     def __init__(self, *a, **kw):
         super().__init__(*a, **kw)
-        self.upstream = basets(namespace=f'{self.namespace}-upstream')
+        self.upstream = upstreamts(namespace=f'{self.namespace}-upstream')
+        # series name -> count of upstream points suppressed
+        # because within the series tolerance (for the
+        # `SUPPRESSED_SIZE` most recently denoised series)
+        self.suppressed = Counter()
+        # optional read-only engine (e.g. a streaming replica)
+        self.replica = None
+        # series name -> monotonic time of its last write
+        self.lastwrites = {}
 
-    def supervision_status(self, cn, name):
-        meta = self.internal_metadata(cn, name)
+    def series_meta(self, cn, name):
+        """ returns the internal metadata and metadata of a series
+        (or None if it does not exist), along with the upstream
+        internal metadata, in one query
+
+        This can be handed to the methods accepting a `_meta`
+        argument to spare them their own queries. The registry
+        lookups of both branches are also served from it for the rest
+        of the transaction (up to the next write): this is meant for
+        the read paths.
+        """
+        rows = cn.execute(
+            'select 0 as branch, internal_metadata, metadata '
+            f'from "{self.namespace}".registry '
+            'where name = %(name)s '
+            'union all '
+            'select 1, internal_metadata, metadata '
+            f'from "{self.upstream.namespace}".registry '
+            'where name = %(name)s',
+            name=name
+        ).fetchall()
+        branches = {
+            row.branch: {
+                'internal_metadata': row.internal_metadata,
+                'metadata': row.metadata
+            }
+            for row in rows
+        }
+        if 0 not in branches:
+            return None
+
+        preloaded = preloads(cn)
+        preloaded[(self.namespace, name)] = branches[0]
+        if 1 in branches:
+            preloaded[(self.upstream.namespace, name)] = branches[1]
+        return dict(branches[0], upstream=branches.get(1))
+
+    def supervision_status(self, cn, name, _meta=None):
+        if _meta is not None:
+            meta = _meta['internal_metadata']
+        else:
+            meta = self.internal_metadata(cn, name)
         if meta:
             return meta.get('supervision_status', 'unsupervised')
         return 'unsupervised'
 
+    def tolerance(self, cn, name, _meta=None):
+        """ returns the (absolute, relative) tolerance under which upstream
+        values changes are considered noise
+
+        They are read from the `supervision_atol` and
+        `supervision_rtol` metadata entries.
+        """
+        if _meta is not None:
+            meta = _meta['metadata'] or {}
+        else:
+            meta = self.metadata(cn, name) or {}
+        return (
+            float(meta.get('supervision_atol', 0.)),
+            float(meta.get('supervision_rtol', 0.))
+        )
+
+    def recently_written(self, name=None):
+        """ tells if a series (or any series when no name is given)
+        was written within the last `READ_YOUR_WRITES_DELAY` seconds
+
+        Only the committed writes made through this object (hence
+        this process) are known.
+        """
+        horizon = monotonic() - READ_YOUR_WRITES_DELAY
+        if name is None:
+            return any(
+                stamp > horizon
+                for stamp in list(self.lastwrites.values())
+            )
+        return self.lastwrites.get(name, horizon) > horizon
+
+    def _mark_written(self, cn, *names):
+        # the names are stamped when (and if) the transaction commits
+        if not event.contains(cn, 'commit', _stamp_writes):
+            event.listen(cn, 'commit', _stamp_writes)
+            event.listen(cn, 'rollback', _forget_writes)
+        _WRITES.setdefault(cn, set()).update(
+            (self, name) for name in names
+        )
+
+    def _stamp_write(self, name, now):
+        if len(self.lastwrites) > 1000:
+            horizon = now - READ_YOUR_WRITES_DELAY
+            for key, stamp in list(self.lastwrites.items()):
+                if stamp <= horizon:
+                    self.lastwrites.pop(key, None)
+        self.lastwrites[name] = now
+
+    def _lock_series(self, cn, name):
+        # we are going to write: forget the preloaded metadata
+        self._forget(cn)
+        self._mark_written(cn, name)
+        cn.execute(
+            'select pg_advisory_xact_lock('
+            ' hashtext(%(namespace)s), hashtext(%(name)s)'
+            ')',
+            namespace=self.namespace,
+            name=name
+        )
+
+    def _denoise(self, cn, ts, name, supervision_status):
+        atol, rtol = self.tolerance(cn, name)
+        if not (atol or rtol) or not len(ts):
+            return ts
+
+        # upstream values live in the edited series until
+        # the first manual edit
+        tsh = self if supervision_status == 'unsupervised' else self.upstream
+        ref = tsh.get(
+            cn, name,
+            from_value_date=ts.index.min(),
+            to_value_date=ts.index.max()
+        )
+        ts, count = denoise(ref, ts, atol, rtol)
+        if count:
+            # keep the most recently denoised series last
+            self.suppressed[name] = self.suppressed.pop(name, 0) + count
+            if len(self.suppressed) > SUPPRESSED_SIZE:
+                self.suppressed.pop(next(iter(self.suppressed)))
+            L.info('suppressed %s noisy points for %s', count, name)
+        return ts
+
     @tx
     def __supervise__(self, cn, ts, name, author,
                       metadata=None,
@@ -102,6 +762,13 @@ class timeseries(basets):
                       manual=False,
                       __supermethod__=None,
                       __upmethod__=None):
+        # serialize the writers of a given series (only) because of
+        # the status check -> upstream/edited writes sequence
+        self._lock_series(cn, name)
+        if insertion_date is None:
+            # one stamp for the upstream and edited revisions of a
+            # given write (the strip relies on it)
+            insertion_date = pd.Timestamp.utcnow()
 
         if manual:
             if metadata is None:
@@ -128,6 +795,8 @@ class timeseries(basets):
             return series_diff
 
         supervision_status = self.supervision_status(cn, name)
+        if not manual:
+            ts = self._denoise(cn, ts, name, supervision_status)
 
         if supervision_status == 'unsupervised':
             if manual:
@@ -214,25 +883,227 @@ class timeseries(basets):
             __upmethod__=self.upstream.replace
         )
 
+    def update_manual_many(self, cn, serieslist, author,
+                           insertion_date=None,
+                           dryrun=False):
+        """Apply manual edits to many series within the `cn` transaction.
+
+        Yields the (name, diff) pairs as they are done, hence it must be
+        consumed before the transaction ends. In `dryrun` mode nothing is
+        written and the diffs are those the edits would produce.
+
+        The series are written in the order of their names: concurrent
+        bulk edits take the series locks in the same order and cannot
+        deadlock.
+        """
+        for name in sorted(serieslist):
+            ts = serieslist[name]
+            if not dryrun:
+                yield name, self.update(
+                    cn, ts, name, author,
+                    insertion_date=insertion_date,
+                    manual=True
+                )
+                continue
+
+            ts = guard_insert(ts, name, author, None, insertion_date)
+            current = None
+            if len(ts):
+                current = self.get(
+                    cn, name,
+                    from_value_date=ts.index.min(),
+                    to_value_date=ts.index.max(),
+                    _keep_nans=True
+                )
+            yield name, diff(current, ts)
+
+    @tx
+    def update_metadata(self, cn, name, metadata):
+        self._mark_written(cn, name)
+        super().update_metadata(cn, name, metadata)
+
     @tx
     def delete(self, cn, seriename):
+        self._mark_written(cn, seriename)
         super().delete(cn, seriename)
         self.upstream.delete(cn, seriename)
 
     @tx
     def rename(self, cn, oldname, newname, propagate=True):
+        self._mark_written(cn, oldname, newname)
         super().rename(cn, oldname, newname, propagate=propagate)
         self.upstream.rename(cn, oldname, newname, propagate=propagate)
 
     @tx
     def strip(self, cn, name, csid):
+        self._lock_series(cn, name)
         if self.supervision_status(cn, name) == 'supervised':
-            raise ValueError(f'supervised series `{name}` cannot be striped')
+            self._strip_upstream(cn, name, csid)
 
         super().strip(cn, name, csid)
 
+    def _strip_upstream(self, cn, name, csid):
+        # the upstream revisions posterior to the last kept edited
+        # revision belong to the stripped writes, save the upstream
+        # only ones (writes which did not reach edited) made before
+        # the first stripped write
+        # (the upstream and edited revisions of a given write may
+        # differ by a few microseconds in the series written before
+        # both got the same stamp)
+        tablename = self._series_to_tablename(cn, name)
+        edited = f'"{self.namespace}.revision"."{tablename}"'
+        first = cn.execute(
+            f'select insertion_date, metadata from {edited} '
+            'where id = %(csid)s',
+            csid=csid
+        ).fetchone()
+        # the tablename cache does not discriminate namespaces
+        cn.cache['series_tablename'].pop(name, None)
+        uptablename = self.upstream._series_to_tablename(cn, name)
+        q = select(
+            'id', 'insertion_date', 'metadata'
+        ).table(
+            f'"{self.upstream.namespace}.revision"."{uptablename}"'
+        ).where(
+            'insertion_date > coalesce(('
+            f' select max(insertion_date) from {edited}'
+            '  where id < %(csid)s'
+            "), '-infinity')",
+            csid=csid
+        ).order('id')
+        revs = q.do(cn).fetchall()
+        before = [
+            rev for rev in revs
+            if rev.insertion_date <= first.insertion_date
+        ]
+        upcsid = next(
+            (
+                rev.id for rev in revs
+                if rev.insertion_date > first.insertion_date
+            ),
+            None
+        )
+        firstmeta = first.metadata or {}
+        if before and not firstmeta.get('reverted'):
+            # the upstream revision of the first stripped write (an
+            # upstream write, or the copy taken by a first manual edit)
+            # is the last one before it
+            lastmeta = before[-1].metadata or {}
+            if not firstmeta.get('edited') or lastmeta.get('edited'):
+                upcsid = before[-1].id
+        if upcsid is not None:
+            self.upstream.strip(cn, name, upcsid)
+
+        stripped = self.upstream.latest_insertion_date(cn, name) is None
+        if stripped:
+            # back to the state before the first upstream write
+            self.upstream.delete(cn, name)
+        cn.cache['series_tablename'].pop(name, None)
+        if not stripped:
+            return
+
+        firstmeta = cn.execute(
+            f'select metadata from "{self.namespace}.revision"."{tablename}" '
+            'order by id asc limit 1'
+        ).scalar() or {}
+        self.update_internal_metadata(
+            cn, name,
+            {
+                'supervision_status': 'handcrafted'
+                if firstmeta.get('edited') else 'unsupervised'
+            }
+        )
+
     # supervision specific API
 
+    @tx
+    def last_revisions(self, cn, name, _meta=None):
+        """ returns the (id, insertion date) of the last revision of
+        both the edited and upstream series (or None)
+
+        With a preloaded `_meta`, the upstream revision is only looked
+        up for supervised series (the others don't depend on it).
+        """
+        if _meta is None:
+            return (
+                last_revision(self, cn, name),
+                last_revision(self.upstream, cn, name)
+            )
+        upstream = _meta['upstream']
+        return (
+            last_revision(
+                self, cn, name,
+                tablename=_meta['internal_metadata']['tablename']
+            ),
+            last_revision(
+                self.upstream, cn, name,
+                tablename=upstream['internal_metadata']['tablename']
+            )
+            if upstream and
+            self.supervision_status(cn, name, _meta) == 'supervised'
+            else None
+        )
+
+    def supervised_series(self, cn, names=None):
+        """ returns the sorted names of the supervised series (possibly
+        restricted to the given names)
+        """
+        q = select(
+            'name'
+        ).table(
+            f'"{self.namespace}".registry'
+        ).where(
+            'internal_metadata @> %(status)s',
+            status='{"supervision_status": "supervised"}'
+        ).order('name')
+        if names is not None:
+            if not names:
+                return []
+            q.where('name in %(names)s', names=tuple(names))
+        return [name for name, in q.do(cn).fetchall()]
+
+    @tx
+    def supervision_stats(self, cn, names=None, points=False):
+        """ returns a mapping from series name to its supervision
+        figures: status, edited and upstream revisions counts, manual
+        changesets count and last manual edit date
+
+        These come from aggregate queries only. With `points`, the
+        count of currently overridden points is added (this needs the
+        series reconstruction).
+        """
+        edited = revision_stats(self, cn, names)
+        upstream = upstream_revision_counts(
+            self, cn,
+            [
+                name for name, (status, *_) in edited.items()
+                if status == 'supervised'
+            ]
+        )
+        stats = {}
+        for name in sorted(edited):
+            status, revisions, manual, lastmanual = edited[name]
+            if name in upstream:
+                upstreamrevs = upstream[name]
+            else:
+                # no upstream branch: the unsupervised series are their
+                # own upstream, the handcrafted ones have none
+                upstreamrevs = revisions if status == 'unsupervised' else 0
+            stats[name] = {
+                'status': status,
+                'edited_revisions': revisions,
+                'upstream_revisions': upstreamrevs,
+                'manual_changesets': manual,
+                'last_manual_edit': lastmanual
+            }
+            if points:
+                stats[name]['overridden_points'] = (
+                    len(self.get_overrides(cn, name))
+                    if status == 'supervised'
+                    else 0
+                )
+        return stats
+
     @tx
     def get_overrides(self, cn, name, revision_date=None,
                       from_value_date=None, to_value_date=None):
@@ -251,27 +1122,344 @@ class timeseries(basets):
             to_value_date=to_value_date,
             _keep_nans=True
         )
-        manual = diff(upstream, edited)
+        manual = manual_diff(
+            upstream, edited, *self.tolerance(cn, name)
+        )
 
         manual.name = name
         return manual
 
+    def _upstream_origin(self, cn, name, _meta=None):
+        """ returns the insertion date of the first upstream revision
+        if it is the copy of the edited series taken at its first
+        manual edit (before that date, the upstream values live in
+        the edited series) -- else None
+        """
+        if _meta is not None and _meta['upstream']:
+            tablename = _meta['upstream']['internal_metadata']['tablename']
+        else:
+            tablename = cn.execute(
+                f'select internal_metadata->>\'tablename\' '
+                f'from "{self.upstream.namespace}".registry '
+                'where name = %(name)s',
+                name=name
+            ).scalar()
+        if tablename is None:
+            return None
+        row = cn.execute(
+            f'select insertion_date, metadata '
+            f'from "{self.upstream.namespace}.revision"."{tablename}" '
+            'order by id asc limit 1'
+        ).fetchone()
+        if row is None or not (row.metadata or {}).get('edited'):
+            return None
+        return pd.Timestamp(row.insertion_date).astimezone('UTC')
+
+    def _no_upstream(self, cn, name):
+        meta = self.internal_metadata(cn, name)
+        return empty_series(
+            meta['tzaware'], dtype=meta['value_dtype'], name=name
+        )
+
     @tx
-    def get_ts_marker(self, cn, name, revision_date=None,
-                      from_value_date=None, to_value_date=None,
-                      inferred_freq=False,
-                      _keep_nans=False):
-        table = self._series_to_tablename(cn, name)
-        if table is None:
-            return None, None
+    def get_upstream(self, cn, name, revision_date=None,
+                     from_value_date=None, to_value_date=None,
+                     _meta=None):
+        """ returns the upstream (provider) values of a series
 
-        edited = self.get(
+        They are read from the edited series as long as it is not
+        supervised (and handcrafted series have none).
+        """
+        status = self.supervision_status(cn, name, _meta)
+        if status == 'handcrafted':
+            return self._no_upstream(cn, name)
+
+        tsh = self.upstream
+        if status == 'unsupervised':
+            tsh = self
+        elif revision_date is not None:
+            origin = self._upstream_origin(cn, name, _meta)
+            if origin is not None and revision_date < origin:
+                tsh = self
+
+        return tsh.get(
             cn, name,
             revision_date=revision_date,
             from_value_date=from_value_date,
+            to_value_date=to_value_date
+        )
+
+    @tx
+    def upstream_insertion_dates(self, cn, name,
+                                 from_insertion_date=None,
+                                 to_insertion_date=None,
+                                 from_value_date=None,
+                                 to_value_date=None,
+                                 _meta=None):
+        """ returns the insertion dates of the upstream revisions """
+        return list(self.upstream_history(
+            cn, name,
+            from_insertion_date=from_insertion_date,
+            to_insertion_date=to_insertion_date,
+            from_value_date=from_value_date,
             to_value_date=to_value_date,
+            _meta=_meta,
+            _idates=True
+        ))
+
+    @tx
+    def upstream_history(self, cn, name,
+                         from_insertion_date=None,
+                         to_insertion_date=None,
+                         from_value_date=None,
+                         to_value_date=None,
+                         _meta=None,
+                         _idates=False):
+        """ returns the upstream revisions as a dict from insertion
+        dates to series
+
+        The revisions before the first manual edit are read from the
+        edited series (the copy taken at that time is not one of them).
+        """
+        def read(tsh, from_insertion_date, to_insertion_date):
+            query = dict(
+                from_insertion_date=from_insertion_date,
+                to_insertion_date=to_insertion_date,
+                from_value_date=from_value_date,
+                to_value_date=to_value_date
+            )
+            if _idates:
+                return dict.fromkeys(tsh.insertion_dates(cn, name, **query))
+            return tsh.history(cn, name, **query) or {}
+
+        status = self.supervision_status(cn, name, _meta)
+        if status == 'handcrafted':
+            return {}
+        if status == 'unsupervised':
+            return read(self, from_insertion_date, to_insertion_date)
+
+        origin = self._upstream_origin(cn, name, _meta)
+        if origin is None:
+            return read(self.upstream, from_insertion_date, to_insertion_date)
+
+        hist = {}
+        if from_insertion_date is None or from_insertion_date < origin:
+            hist.update(
+                (idate, ts)
+                for idate, ts in read(
+                    self,
+                    from_insertion_date,
+                    origin if to_insertion_date is None
+                    else min(origin, to_insertion_date)
+                ).items()
+                if idate < origin
+            )
+        if to_insertion_date is None or to_insertion_date > origin:
+            hist.update(
+                (idate, ts)
+                for idate, ts in read(
+                    self.upstream,
+                    from_insertion_date,
+                    to_insertion_date
+                ).items()
+                if idate > origin
+            )
+        return hist
+
+    @tx
+    def revert_overrides(self, cn, name, author,
+                         from_value_date=None,
+                         to_value_date=None,
+                         insertion_date=None):
+        """Put back the upstream values in place of the manual overrides
+        (over an optional value dates range), within a single revision
+        of the edited series.
+
+        Overrides without an upstream counterpart are erased.
+        Returns the diff written into the edited series.
+        """
+        self._lock_series(cn, name)
+        if self.supervision_status(cn, name) != 'supervised':
+            # nothing to revert to
+            return empty_series(self.tzaware(cn, name), name=name)
+
+        overrides = self.get_overrides(
+            cn, name,
+            from_value_date=from_value_date,
+            to_value_date=to_value_date
+        )
+        if overrides is None or not len(overrides):
+            return empty_series(self.tzaware(cn, name), name=name)
+
+        upstream = self.upstream.get(
+            cn, name,
+            from_value_date=overrides.index.min(),
+            to_value_date=overrides.index.max(),
             _keep_nans=True
         )
+        if upstream is None:
+            reverted = pd.Series(np.nan, index=overrides.index)
+        else:
+            reverted = upstream.reindex(overrides.index)
+
+        # straight into the edited series, upstream is left alone
+        return super().update(
+            cn, reverted, name, author,
+            metadata={'reverted': True},
+            insertion_date=insertion_date,
+            keepnans=True
+        )
+
+    @tx
+    def get_ts_marker(self, cn, name, revision_date=None,
+                      from_value_date=None, to_value_date=None,
+                      inferred_freq=False,
+                      provenance=False,
+                      max_points=None,
+                      resample=None,
+                      chunk=None,
+                      _keep_nans=False,
+                      _meta=None):
+        """ returns the edited series and its markers (or provenance
+        codes), possibly downsampled
+
+        With a `chunk` value dates span (e.g. `365D`), the series is
+        built window by window (see `iter_ts_marker`) and the pieces
+        concatenated: the intermediate data of the edition logic stays
+        within the size of a chunk, but the output is the whole series
+        and the concatenation holds the pieces next to it. Only
+        `iter_ts_marker` is bounded by the chunk size.
+
+        A `_meta` preloaded with `series_meta` spares the status and
+        tolerance queries.
+        """
+        if _meta is None:
+            table = self._series_to_tablename(cn, name)
+            if table is None:
+                return None, None
+
+        seriespieces, markerpieces = [], []
+        if chunk is not None:
+            if inferred_freq:
+                raise ValueError('chunked reads do not support inferred_freq')
+            for piece, markerpiece in self.iter_ts_marker(
+                    cn, name, chunk,
+                    revision_date=revision_date,
+                    from_value_date=from_value_date,
+                    to_value_date=to_value_date,
+                    provenance=provenance,
+                    _keep_nans=_keep_nans,
+                    _meta=_meta):
+                seriespieces.append(piece)
+                markerpieces.append(markerpiece)
+
+        if seriespieces:
+            # one concatenation at a time, releasing its pieces
+            series = pd.concat(seriespieces)
+            del seriespieces
+            markers = pd.concat(markerpieces)
+            del markerpieces
+        else:
+            # nothing to chunk (or empty chunks)
+            series, markers = self._ts_marker(
+                cn, name,
+                revision_date=revision_date,
+                from_value_date=from_value_date,
+                to_value_date=to_value_date,
+                inferred_freq=inferred_freq,
+                provenance=provenance,
+                _keep_nans=_keep_nans,
+                _meta=_meta
+            )
+        if max_points or resample:
+            series, markers = downsample(
+                series, markers,
+                max_points=max_points,
+                resample=resample
+            )
+        return series, markers
+
+    def _value_span(self, cn, name, _meta):
+        """ returns the min and max value dates ever stored in the
+        edited and upstream series (or None)
+        """
+        tables = [(self.namespace, _meta['internal_metadata']['tablename'])]
+        if _meta['upstream']:
+            tables.append((
+                self.upstream.namespace,
+                _meta['upstream']['internal_metadata']['tablename']
+            ))
+        start, end = cn.execute(
+            'select min(tsstart), max(tsend) from ('
+            + ' union all '.join(
+                f'select tsstart, tsend from "{ns}.revision"."{table}"'
+                for ns, table in tables
+            ) + ') as revs'
+        ).fetchone()
+        if start is None:
+            return None
+        tz = 'UTC' if _meta['internal_metadata']['tzaware'] else None
+        return pd.Timestamp(start, tz=tz), pd.Timestamp(end, tz=tz)
+
+    def iter_ts_marker(self, cn, name, chunk,
+                       revision_date=None,
+                       from_value_date=None,
+                       to_value_date=None,
+                       provenance=False,
+                       _keep_nans=False,
+                       _meta=None):
+        """ yields the edited series and its markers (or provenance
+        codes) by consecutive value dates windows of a `chunk` span
+        (anything `pd.Timedelta` accepts), skipping the empty ones
+
+        Only one window is in memory at a time. The concatenated
+        pieces are the output of `get_ts_marker`.
+        """
+        if _meta is None:
+            _meta = self.series_meta(cn, name)
+            if _meta is None:
+                return
+        span = self._value_span(cn, name, _meta)
+        if span is None:
+            return
+
+        start, end = span
+        tzaware = _meta['internal_metadata']['tzaware']
+        if from_value_date is not None:
+            start = max(start, index_date(from_value_date, tzaware))
+        if to_value_date is not None:
+            end = min(end, index_date(to_value_date, tzaware))
+
+        chunk = pd.Timedelta(chunk)
+        while start <= end:
+            series, markers = self._ts_marker(
+                cn, name,
+                revision_date=revision_date,
+                # the value dates bounds are inclusive
+                from_value_date=start,
+                to_value_date=min(start + chunk - pd.Timedelta(1), end),
+                inferred_freq=False,
+                provenance=provenance,
+                _keep_nans=_keep_nans,
+                _meta=_meta
+            )
+            if markers is not None and len(markers):
+                yield series, markers
+            del series, markers
+            start += chunk
+
+    def _ts_marker(self, cn, name, revision_date, from_value_date,
+                   to_value_date, inferred_freq, provenance, _keep_nans,
+                   _meta):
+
+        with phase('reconstruction'):
+            edited = self.get(
+                cn, name,
+                revision_date=revision_date,
+                from_value_date=from_value_date,
+                to_value_date=to_value_date,
+                _keep_nans=True
+            )
         if edited is None:
             # because of a revision_date
             return None, None
@@ -282,14 +1470,23 @@ class timeseries(basets):
                 return edited.dropna()
             return edited
 
-        supervision = self.supervision_status(cn, name)
-        if supervision in ('unsupervised', 'handcrafted'):
-            flags = pd.Series(
-                [supervision == 'handcrafted'] * len(edited.index),
-                index=edited.index,
-                dtype=np.dtype('bool')
+        def finish_markers(markers, full=edited):
+            markers = extended(
+                inferred_freq,
+                markers,
+                from_value_date,
+                to_value_date
             )
-            flags.name = name
+            if provenance:
+                return provenance_codes(full, markers)
+            return fill_markers(markers)
+
+        supervision = self.supervision_status(cn, name, _meta)
+        if supervision in ('unsupervised', 'handcrafted'):
+            with phase('markers'):
+                markers = finish_markers(
+                    manual_markers(supervision, edited, None)
+                )
             edited = finish(edited)
             return (
                 extended(
@@ -298,39 +1495,27 @@ class timeseries(basets):
                     from_value_date,
                     to_value_date
                 ),
-                fill_markers(
-                    extended(
-                        inferred_freq,
-                        flags,
-                        from_value_date,
-                        to_value_date
-                    )
-                )
+                markers
             )
 
         upstreamtsh = self.upstream
-        upstream = upstreamtsh.get(
-            cn, name,
-            revision_date=revision_date,
-            from_value_date=from_value_date,
-            to_value_date=to_value_date,
-            _keep_nans=True
-        )
-        manual = diff(upstream, edited)
-
-        unionindex = join_index(upstream, manual)
-        if unionindex is None:
-            # this means both series are empty
-            return None, None
-
-        mask_manual = pd.Series(
-            [False] * len(unionindex),
-            index=unionindex,
-            dtype='object'
-        )
-        if manual is not None:
-            mask_manual[manual.index] = True
-            mask_manual.name = name
+        with phase('reconstruction'):
+            upstream = upstreamtsh.get(
+                cn, name,
+                revision_date=revision_date,
+                from_value_date=from_value_date,
+                to_value_date=to_value_date,
+                _keep_nans=True
+            )
+        with phase('markers'):
+            mask_manual = manual_markers(
+                supervision, edited, upstream,
+                *self.tolerance(cn, name, _meta)
+            )
+            if mask_manual is None:
+                # this means both series are empty
+                return None, None
+            markers = finish_markers(mask_manual)
 
         edited = finish(edited)
         return (
@@ -340,12 +1525,5 @@ class timeseries(basets):
                 from_value_date,
                 to_value_date
             ),
-            fill_markers(
-                extended(
-                    inferred_freq,
-                    mask_manual,
-                    from_value_date,
-                    to_value_date
-                )
-            )
+            markers
         )